@@ -0,0 +1 @@
+from typing import *
@@ -0,0 +1,51 @@
+"""
+Time to get the typed AST of a library of definitions, with a cold `ModuleCache` (the library
+is parsed, typechecked and stored) and with a warm one (it is loaded from disk); then the
+startup time of the `Interpreter` running it, which also optimizes and runs the program.
+
+Run from the repository root:
+    python -m benchmarks.bench_cache
+"""
+import os
+import tempfile
+import time
+
+from benchmarks.bench_definitions import synthetic_program
+from forfait.cache import ModuleCache
+from forfait.interpreter.interpreter import Interpreter
+from forfait.parser.firstphase import FirstPhase
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+def time_typecheck(code: str, cache) -> float:
+    start = time.perf_counter()
+    if cache is None:
+        FirstPhase(get_stdlib(), verbose=False).parse_and_typecheck(code)
+    else:
+        cache.parse_and_typecheck(get_stdlib(), code)
+    return time.perf_counter() - start
+
+
+def time_startup(code: str, cache) -> float:
+    start = time.perf_counter()
+    Interpreter(get_stdlib(), verbose=False, cache=cache).eval(code)
+    return time.perf_counter() - start
+
+
+def main():
+    for title, timer in (("typed AST", time_typecheck), ("interpreter startup", time_startup)):
+        print(title)
+        print(f"{'definitions':>12} {'no cache (s)':>13} {'cold (s)':>9} {'warm (s)':>9} {'speedup':>8} {'entry (KiB)':>12}")
+        for n_definitions in (10, 100, 1000):
+            code = synthetic_program(n_definitions)
+            with tempfile.TemporaryDirectory() as directory:
+                uncached = timer(code, None)
+                cold = timer(code, ModuleCache(directory))
+                warm = min(timer(code, ModuleCache(directory)) for _ in range(3))
+                size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+            print(f"{n_definitions:>12} {uncached:>13.3f} {cold:>9.3f} {warm:>9.3f} {uncached / warm:>7.1f}x {size / 1024:>12.1f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
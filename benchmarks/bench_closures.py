@@ -0,0 +1,38 @@
+"""
+Execution throughput, in words per second, of the `ClosureInterpreter` against the
+AST-walking `Interpreter` and the bytecode `VM`, on the programs of `bench_vm` and on
+straight-line u8 arithmetic.
+
+Run from the repository root:
+    python -m benchmarks.bench_closures
+"""
+from benchmarks.bench_vm import PROGRAMS, CountingInterpreter, time_eval
+from forfait.interpreter.closures import ClosureInterpreter
+from forfait.interpreter.interpreter import Interpreter
+from forfait.interpreter.vm import VM
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+STRAIGHT_LINE = "3 +u8 dup *u8 7 -u8 dup 5 *u8 swap over -u8 +u8 "
+
+BENCHMARKS = {
+    **PROGRAMS,
+    "straight-line": f"0 250 [| 0 250 [| {STRAIGHT_LINE * 4} drop |] indexed-iter drop |] indexed-iter",
+}
+
+
+def main():
+    print(f"{'program':<14} {'words':>10} {'interpreter (w/s)':>18} {'vm (w/s)':>12} {'closures (w/s)':>15} {'speedup':>8}")
+    for name, code in BENCHMARKS.items():
+        counter = CountingInterpreter(get_stdlib(), verbose=False)
+        counter.eval(code)
+        words = counter.executed
+
+        interpreter = words / time_eval(Interpreter(get_stdlib(), verbose=False), code)
+        vm = words / min(time_eval(VM(get_stdlib()), code) for _ in range(3))
+        closures = words / min(time_eval(ClosureInterpreter(get_stdlib()), code) for _ in range(3))
+        print(f"{name:<14} {words:>10} {interpreter:>18.0f} {vm:>12.0f} {closures:>15.0f} {closures / interpreter:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
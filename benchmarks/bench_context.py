@@ -0,0 +1,32 @@
+"""
+Cost of creating a compilation Context and of instantiating builtin type signatures.
+
+Run from the repository root:
+    python -m benchmarks.bench_context
+"""
+import copy
+import timeit
+
+from forfait.compiler import Compiler
+from forfait.stdlibs.basic_stdlib import STDLIB, get_stdlib
+
+
+def report(name: str, stmt, number: int):
+    seconds = min(timeit.repeat(stmt, number=number, repeat=5)) / number
+    print(f"{name:<45} {seconds * 1e6:>12.2f} us/call {1 / seconds:>14.0f} calls/s")
+
+
+def main():
+    # what each compilation used to pay, for reference
+    report("deepcopy of the builtins (previous get_stdlib)", lambda: copy.deepcopy(dict(STDLIB.builtin_types)), 20)
+
+    report("get_stdlib()", get_stdlib, 100_000)
+    report("Compiler()", Compiler, 100_000)
+
+    ctx = get_stdlib()
+    for funcname in ["dup", "swap", "+u8", "if", "while"]:
+        report(f"fresh_builtin_type({funcname!r})", lambda: ctx.fresh_builtin_type(funcname), 2_000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Number of words (funcalls, literals and quotations, in every body) of the examples and of the
+programs of the tests, as parsed, after the peephole rules, and after the rules and dead code
+elimination; then the time the `Interpreter` takes to run them in both cases.
+
+Run from the repository root:
+    python -m benchmarks.bench_dead_code
+"""
+import glob
+import os
+import time
+from typing import *
+
+from forfait.astnodes import AstNode, Sequence, Funcdef, Quote
+from forfait.interpreter.interpreter import Interpreter
+from forfait.optimizer import Optimizer
+from forfait.parser.firstphase import FirstPhase
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+# from tests/test_closures.py, test_vm.py and test_optimizer.py
+PROGRAMS = [
+    "1 2 3 rot- swap over rot+ dup drop",
+    "200 100 +u8 3 7 *u8 2 9 /u8 9 2 -u8 ++u8 0 --u8",
+    "7 9 over over swap over drop drop swap drop 3 4 5 ++u8 rot+ --u8 rot+",
+    "0 5 [| dup u16 store-at |] indexed-iter",
+    "1 1 [| dup 100 <=u8 |] [| swap over +u8 |] while swap drop",
+    "1 10 [| 3 *u8 dup 7 -u8 over /u8 swap 9 >=u8 drop drop |] indexed-iter",
+    ": sq dup *u8 ; 0 10 [| sq 5 u16 store-at |] indexed-iter",
+    "5 3 +u8 drop 0 u16 retrieve-from 4 *u8 dup drop 2 u16 store-at",
+    ": sq dup *u8 ; 3 sq drop 4 sq 9 u16 store-at 7 sq",
+    "0 5 [| dup 3 *u8 drop u16 dup retrieve-from swap store-at |] indexed-iter 6 7 over +u8 drop",
+]
+
+
+def count(nodes: Iterable[AstNode]) -> int:
+    total = 0
+    for node in nodes:
+        if isinstance(node, Sequence):
+            total += count(node.funcs)
+        elif isinstance(node, Funcdef):
+            total += count([node.funcbody])
+        elif isinstance(node, Quote):
+            total += 1 + count([node.body])
+        else:
+            total += 1
+    return total
+
+
+def corpus() -> List[Tuple[str, str]]:
+    examples = []
+    for filename in sorted(glob.glob(os.path.join(EXAMPLES, "*.forf"))):
+        with open(filename) as f:
+            examples.append((os.path.basename(filename), f.read() + " 8 fibonacci drop"))
+    return examples + [(code if len(code) < 40 else code[:37] + "...", code) for code in PROGRAMS]
+
+
+def time_interpreter(code: str, dead_code: bool, repeat: int=200) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        interpreter = Interpreter(get_stdlib(), verbose=False)
+        interpreter.optimizer = Optimizer(interpreter.ctx, dead_code=dead_code)
+        interpreter.eval(code)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    print(f"{'program':>42} {'parsed':>7} {'rules':>6} {'+ dce':>6} {'removed':>8} {'run (ms)':>9} {'+ dce (ms)':>11}")
+    totals = [0, 0, 0]
+    for title, code in corpus():
+        ctx = get_stdlib()
+        nodes = FirstPhase(ctx, verbose=False).parse_and_typecheck(code)
+        parsed = count(nodes)
+        rules = count(Optimizer(ctx, dead_code=False).optimize(nodes))
+        dce = count(Optimizer(ctx).optimize(nodes))
+        for i, n in enumerate((parsed, rules, dce)):
+            totals[i] += n
+        print(f"{title:>42} {parsed:>7} {rules:>6} {dce:>6} {(rules - dce) / rules:>7.0%} "
+              f"{1000 * time_interpreter(code, False):>9.3f} {1000 * time_interpreter(code, True):>11.3f}")
+    print(f"{'total':>42} {totals[0]:>7} {totals[1]:>6} {totals[2]:>6} {(totals[1] - totals[2]) / totals[1]:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
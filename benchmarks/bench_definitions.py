@@ -0,0 +1,55 @@
+"""
+Type inference of `fibonacci.forf`-style programs, scaled to thousands of definitions.
+
+Run from the repository root:
+    python -m benchmarks.bench_definitions [--max-definitions N]
+
+Each definition is a copy of the fibonacci example, which also calls the previous
+definition; inference scales linearly when the us/definition column stays flat.
+"""
+import argparse
+import time
+
+from forfait.parser.firstphase import FirstPhase
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+DEFINITION = """
+: fib{i}
+  1 1
+    [| rot- dup 1 >=u8 |]
+    [| --u8 rot+ over +u8 swap |]
+  while
+  drop drop {call}
+;
+"""
+
+
+def synthetic_program(n_definitions: int) -> str:
+    definitions = [DEFINITION.format(i=0, call="")]
+    for i in range(1, n_definitions):
+        definitions.append(DEFINITION.format(i=i, call=f"fib{i - 1}"))
+    return "".join(definitions) + f"8 fib{n_definitions - 1}\n"
+
+
+def time_inference(code: str) -> float:
+    start = time.perf_counter()
+    FirstPhase(get_stdlib(), verbose=False).parse_and_typecheck(code)
+    return time.perf_counter() - start
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--max-definitions", type=int, default=4_000)
+    args = argparser.parse_args()
+
+    print(f"{'definitions':>12} {'seconds':>10} {'us/definition':>14}")
+    n = 125
+    while n <= args.max_definitions:
+        elapsed = time_inference(synthetic_program(n))
+        print(f"{n:>12} {elapsed:>10.3f} {elapsed / n * 1e6:>14.1f}")
+        n *= 2
+
+
+if __name__ == "__main__":
+    main()
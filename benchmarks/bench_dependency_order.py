@@ -0,0 +1,61 @@
+"""
+Keeping substitutions in dependency order while they are added one at a time, on long
+chains 'a0 ~~> LIST<'a1>, 'a1 ~~> LIST<'a2>, ...
+
+Compares the `IncrementalGraph` kept alive by `Context` with rebuilding a `Graph` and
+visiting it in order after each new substitution (what `Context.ordered_subs` used to do).
+
+Run from the repository root:
+    python -m benchmarks.bench_dependency_order
+"""
+import random
+import time
+
+from forfait.data_structures.graph import Graph
+from forfait.ztypes.context import Context
+from forfait.ztypes.ztypes import ZTGeneric, ZTList
+
+
+def chain_edges(n: int, order: str) -> list[tuple[int, int]]:
+    edges = [(i, i + 1) for i in range(n)]
+    if order == "reversed":
+        edges.reverse()
+    elif order == "shuffled":
+        random.Random(0).shuffle(edges)
+    return edges
+
+
+def time_incremental(n: int, order: str) -> float:
+    ctx = Context()
+    generics = [ZTGeneric(f"a{i}") for i in range(n + 1)]
+
+    start = time.perf_counter()
+    for i, j in chain_edges(n, order):
+        generics[i].unify(ZTList(generics[j]), ctx)
+    ctx.dependencies.ordered_visit()
+    return time.perf_counter() - start
+
+
+def time_rebuild(n: int, order: str) -> float:
+    edges = list()
+
+    start = time.perf_counter()
+    for edge in chain_edges(n, order):
+        edges.append(edge)
+        g = Graph()
+        for i, j in edges:
+            g.add_edge(i, j)
+        g.ordered_visit()
+    return time.perf_counter() - start
+
+
+def main():
+    print(f"{'chain':>8} {'order':>10} {'rebuild (s)':>12} {'incremental (s)':>16}")
+    for n in [100, 200, 400, 800, 1600, 10_000]:
+        for order in ["forward", "reversed", "shuffled"]:
+            rebuild = f"{time_rebuild(n, order):>12.3f}" if n <= 400 else f"{'-':>12}"
+            print(f"{n:>8} {order:>10} {rebuild} {time_incremental(n, order):>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Cycle check and topological ordering of `Graph` on chains of diamonds
+(a ==> b, a ==> c, b ==> d, c ==> d, d ==> ...), where the number of paths doubles
+with each diamond.
+
+Run from the repository root:
+    python -m benchmarks.bench_graph [--max-nodes N]
+
+The previous implementation is run only on small graphs: its cycle check explores every
+path, and its ordered visit is quadratic.
+"""
+import argparse
+import time
+
+from forfait.data_structures.graph import Graph
+
+
+def diamond_chain(n_nodes: int) -> Graph:
+    g = Graph()
+    for i in range(max(1, (n_nodes - 1) // 3)):
+        top, left, right, bottom = 3 * i, 3 * i + 1, 3 * i + 2, 3 * i + 3
+        g.add_edge(top, left)
+        g.add_edge(top, right)
+        g.add_edge(left, bottom)
+        g.add_edge(right, bottom)
+    return g
+
+
+def legacy_ciclicity_check_single_node(g: Graph, node, path):
+    # what Graph.ciclicity_check used to do, for each node
+    for neigh in g.outer_edges.get(node, []):
+        if neigh in path:
+            raise Exception("Found ciclicity")
+        legacy_ciclicity_check_single_node(g, neigh, path + [neigh])
+
+
+def legacy_ordered_visit(g: Graph):
+    # what Graph.ordered_visit used to do
+    for node in g.nodes:
+        legacy_ciclicity_check_single_node(g, node, [])
+    order = list()
+    stack = list(g.nodes - set(g.inner_edges.keys()))
+    while len(stack) > 0:
+        node = stack.pop()
+        if node not in order:
+            order.append(node)
+        for neigh in g.outer_edges.get(node, []):
+            if all(x in order for x in g.inner_edges[neigh]):
+                stack.append(neigh)
+    return order
+
+
+def timed(f, g: Graph) -> float:
+    start = time.perf_counter()
+    f(g)
+    return time.perf_counter() - start
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--max-nodes", type=int, default=100_000)
+    args = argparser.parse_args()
+
+    print(f"{'nodes':>8} {'before (s)':>12} {'after (s)':>12} {'us/node':>10}")
+    for n in [16, 31, 46, 61, 1_000, 10_000, 100_000]:
+        if n > args.max_nodes:
+            break
+        g = diamond_chain(n)
+        before = f"{timed(legacy_ordered_visit, g):>12.3f}" if n < 100 else f"{'-':>12}"
+        after = timed(Graph.ordered_visit, g) + timed(Graph.ciclicity_check, g)
+        print(f"{len(g.nodes):>8} {before} {after:>12.4f} {after / len(g.nodes) * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Type inference time on a single long `Sequence`.
+
+Run from the repository root:
+    python -m benchmarks.bench_inference [--max-words N]
+
+Inference is (near) linear when the us/word column stays flat as the number of words grows.
+"""
+import argparse
+import time
+
+from forfait.parser.firstphase import FirstPhase
+from forfait.parser.lexer import tokenize
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+# generic stack shufflers, quotations and higher order functions; the chunk leaves the
+# stack as it found it, so that the stack does not grow with the length of the sequence
+CHUNK = "1 2 3 rot- drop swap over +u8 dup *u8 [| dup |] eval drop u16 identity drop drop "
+WORDS_PER_CHUNK = len(list(tokenize(CHUNK)))
+
+
+def synthetic_sequence(n_words: int) -> str:
+    return CHUNK * max(1, n_words // WORDS_PER_CHUNK)
+
+
+def time_inference(code: str) -> float:
+    parser = FirstPhase(get_stdlib(), verbose=False)
+    ast = parser.parse(code)
+
+    start = time.perf_counter()
+    parser.typechecker(ast)
+    return time.perf_counter() - start
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--max-words", type=int, default=10_000)
+    args = argparser.parse_args()
+
+    print(f"{'words':>10} {'seconds':>10} {'us/word':>10}")
+    n = 500
+    while n <= args.max_words:
+        elapsed = time_inference(synthetic_sequence(n))
+        print(f"{n:>10} {elapsed:>10.3f} {elapsed / n * 1e6:>10.1f}")
+        n *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Call-heavy programs, with and without inlining of the small user-defined words and of the
+quotations run by `eval`/`if`: the time the `Interpreter` takes to run them (without NumPy, so
+that every call is run) and to parse and optimize them, then the time `Compiler.ssify` takes,
+with the number of SSA instructions left after constant propagation. Without inlining, `SSA_ification` rejects the
+calls of user-defined words.
+
+Run from the repository root:
+    python -m benchmarks.bench_inlining
+"""
+import contextlib
+import io
+import os
+import time
+from typing import *
+
+from forfait.compiler import Compiler
+from forfait.interpreter.interpreter import Interpreter
+from forfait.optimizer import Optimizer
+from forfait.parser.firstphase import FirstPhase
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+with open(os.path.join(os.path.dirname(__file__), "..", "examples", "fibonacci.forf")) as f:
+    FIBONACCI = f.read()
+
+WORDS = """
+: sq dup *u8 ;
+: q sq sq ;
+: poly dup sq swap 3 *u8 +u8 1 +u8 ;
+: inc [| 1 +u8 |] eval ;
+: clamp dup 200 >u8 [| drop 200 |] [| identity |] if ;
+"""
+
+INTERPRETED = [
+    ("words in a loop", WORDS + "0 200 [| dup poly swap u16 store-at |] indexed-iter"),
+    ("nested words", WORDS + "0 200 [| dup q inc inc swap u16 store-at |] indexed-iter"),
+    ("quotations", WORDS + "0 200 [| dup [| 3 *u8 |] eval clamp swap u16 store-at |] indexed-iter"),
+    ("fibonacci", FIBONACCI + " 0 100 [| drop 12 fibonacci drop |] indexed-iter"),
+    ("recursion (not inlined)", ": countdown dup 0 ==u8 [| drop |] [| --u8 countdown |] if ; 1 200 countdown"),
+]
+
+COMPILED = [
+    ("words", WORDS + " ".join(f"{i} poly {i} q +u8" for i in range(50))),
+    ("quotations", " ".join(f"{i} [| dup [| +u8 |] eval |] eval" for i in range(50))),
+    ("branches", " ".join(f"{i} dup 3 >u8 [| 1 +u8 |] [| 2 *u8 |] if" for i in range(50))),
+]
+
+
+def time_interpreter(code: str, inline: bool, repeat: int=20) -> Tuple[float, float]:
+    """
+    :return: the time to parse and optimize the program, and the time to run it
+    """
+    interpreter = Interpreter(get_stdlib(), verbose=False, vectorized=False)
+    start = time.perf_counter()
+    nodes = Optimizer(interpreter.ctx, inline=inline).optimize(FirstPhase(interpreter.ctx, verbose=False).parse_and_typecheck(code))
+    compiled = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        interpreter.clear()
+        for node in nodes:
+            interpreter.eval_astnode(node)
+    return compiled, (time.perf_counter() - start) / repeat
+
+
+def ssify(code: str, optimize: bool, repeat: int=20) -> Tuple[Optional[float], Optional[int]]:
+    """
+    :return: the time to build the CFGs, and the number of their instructions (None if
+    `SSA_ification` doesn't support the program)
+    """
+    start = time.perf_counter()
+    try:
+        # `Compiler` prints the types
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(repeat):
+                cfgs = Compiler(get_stdlib(), optimize=optimize).ssify(code)
+    except Exception:
+        return None, None
+    instructions = sum(len(block.instructions) for cfg in cfgs for block in cfg.graph_visit())
+    return (time.perf_counter() - start) / repeat, instructions
+
+
+def cell(x: Optional[float], width: int, fmt: str) -> str:
+    return f"{'-':>{width}}" if x is None else f"{x:>{width}{fmt}}"
+
+
+def main():
+    print("Interpreter (run time, and parsing and optimization time)")
+    print(f"{'program':>26} {'calls (ms)':>11} {'inlined (ms)':>13} {'speedup':>8} {'opt (ms)':>9} {'+ inline (ms)':>14}")
+    for title, code in INTERPRETED:
+        (compiled, calls), (compiled_inlined, inlined) = time_interpreter(code, False), time_interpreter(code, True)
+        print(f"{title:>26} {1000 * calls:>11.2f} {1000 * inlined:>13.2f} {calls / inlined:>7.1f}x "
+              f"{1000 * compiled:>9.2f} {1000 * compiled_inlined:>14.2f}")
+
+    print()
+    print("SSA pipeline (SSA_ification and constant_propagation)")
+    print(f"{'program':>26} {'plain (ms)':>11} {'instrs':>7} {'inlined (ms)':>13} {'instrs':>7}")
+    for title, code in COMPILED:
+        plain, plain_instructions = ssify(code, False)
+        inlined, inlined_instructions = ssify(code, True)
+        print(f"{title:>26} {cell(plain and 1000 * plain, 11, '.2f')} {cell(plain_instructions, 7, 'd')} "
+              f"{cell(inlined and 1000 * inlined, 13, '.2f')} {cell(inlined_instructions, 7, 'd')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Time to typecheck a synthetic project of 500 modules, each importing its parent in a 4-ary tree,
+then to typecheck it again after an edit: of a leaf module, of the body of the root module (its
+importers are not typechecked again, since the types it exports don't change), and of the
+signature of the root module (every module is typechecked again).
+
+Run from the repository root:
+    python -m benchmarks.bench_modules
+"""
+import time
+
+from forfait.modules import ModuleGraph
+
+
+N_MODULES = 500
+ARITY = 4
+
+
+def synthetic_project(n_modules: int) -> ModuleGraph:
+    modules = ModuleGraph()
+    modules.set_source("m0", ": w0 1 ;")
+    for i in range(1, n_modules):
+        parent = (i - 1) // ARITY
+        modules.set_source(f"m{i}", f"import m{parent} : w{i} w{parent} {i % 256} +u8 ;")
+    return modules
+
+
+def time_edit(modules: ModuleGraph, name: str, source: str):
+    start = time.perf_counter()
+    typechecked = modules.set_source(name, source)
+    return time.perf_counter() - start, len(typechecked)
+
+
+def main():
+    modules = synthetic_project(N_MODULES)
+    start = time.perf_counter()
+    for i in range(N_MODULES):
+        modules.load(f"m{i}")
+    full = time.perf_counter() - start
+
+    leaf, parent = N_MODULES - 1, (N_MODULES - 2) // ARITY
+    edits = (
+        ("full load",            None),
+        ("leaf edit",            (f"m{leaf}", f"import m{parent} : w{leaf} w{parent} ;")),
+        ("root body edit",       ("m0", ": w0 2 ;")),
+        ("root signature edit",  ("m0", ": w0 1 2 ;")),
+    )
+
+    print(f"{'':>20} {'time (s)':>9} {'modules':>8} {'speedup':>8}")
+    for title, edit in edits:
+        if edit is None:
+            elapsed, n = full, N_MODULES
+        else:
+            elapsed, n = time_edit(modules, *edit)
+        print(f"{title:>20} {elapsed:>9.4f} {n:>8} {full / elapsed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
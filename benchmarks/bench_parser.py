@@ -0,0 +1,65 @@
+"""
+Parsing throughput of `FirstPhase.parse` on synthetic sources of growing size.
+
+Run from the repository root:
+    python -m benchmarks.bench_parser [--max-tokens N]
+
+Parsing is linear when the ns/token column stays (roughly) flat as the number of
+tokens grows by powers of ten, and when it does not depend on the nesting depth
+of quotations.
+"""
+import argparse
+import itertools
+import time
+
+from forfait.parser.firstphase import FirstPhase
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+# a line of code with 16 tokens, a comment and a tab
+LINE = "1 2 +u8 dup\t[| 3 swap drop |] swap drop (( some comment )) 5 *u8 drop\n"
+TOKENS_PER_LINE = 16
+
+
+def synthetic_source(n_tokens: int) -> str:
+    return "".join(itertools.repeat(LINE, max(1, n_tokens // TOKENS_PER_LINE)))
+
+
+def nested_source(depth: int, n_tokens: int) -> str:
+    """
+    `depth` nested quotations, with the same total amount of tokens for any depth
+    """
+    words_per_level = max(1, (n_tokens - 2 * depth) // depth)
+    level = " ".join(["1 drop"] * (words_per_level // 2))
+    return f"[| {level} " * depth + " |]" * depth
+
+
+def time_parse(code: str) -> float:
+    parser = FirstPhase(get_stdlib(), verbose=False)
+    start = time.perf_counter()
+    parser.parse(code)
+    return time.perf_counter() - start
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--max-tokens", type=int, default=1_000_000)
+    args = argparser.parse_args()
+
+    print(f"{'tokens':>10} {'seconds':>10} {'ns/token':>10}")
+    n = 1_000
+    while n <= args.max_tokens:
+        elapsed = time_parse(synthetic_source(n))
+        print(f"{n:>10} {elapsed:>10.3f} {elapsed / n * 1e9:>10.0f}")
+        n *= 10
+
+    print()
+    print(f"{'depth':>10} {'seconds':>10} {'ns/token':>10}")
+    n = min(100_000, args.max_tokens)
+    for depth in [1, 10, 50, 100, 200]:
+        elapsed = time_parse(nested_source(depth, n))
+        print(f"{depth:>10} {elapsed:>10.3f} {elapsed / n * 1e9:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Startup code computing constants (sums, polynomials, loops with constant bounds, then stored in
+memory), with and without the `PartialEvaluator`: the number of words left after optimization,
+the time to parse and optimize it, and the time the `Interpreter` takes to run it (without
+NumPy, so that every loop is run).
+
+Run from the repository root:
+    python -m benchmarks.bench_partial_evaluator
+"""
+import os
+import time
+from typing import *
+
+from forfait.astnodes import AstNode, Sequence, Funcdef, Quote
+from forfait.interpreter.interpreter import Interpreter
+from forfait.optimizer import Optimizer
+from forfait.parser.firstphase import FirstPhase
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+with open(os.path.join(os.path.dirname(__file__), "..", "examples", "fibonacci.forf")) as f:
+    FIBONACCI = f.read()
+
+# a table of 32 entries, each one computed by a loop
+TABLES = [
+    ("sums of squares", " ".join(f"0 0 {k} [| dup *u8 +u8 |] indexed-iter {k} u16 store-at" for k in range(32))),
+    ("polynomials", ": poly dup dup *u8 swap 3 *u8 +u8 1 +u8 ; " +
+                    " ".join(f"{k} poly {k} 7 +u8 poly -u8 {k} u16 store-at" for k in range(32))),
+    ("fibonacci", FIBONACCI + " " + " ".join(f"{k} fibonacci {k} u16 store-at" for k in range(32))),
+    ("while loops", " ".join(f"1 1 [| dup {100 + k} <=u8 |] [| swap over +u8 |] while swap drop {k} u16 store-at"
+                             for k in range(32))),
+]
+
+
+def count(nodes: Iterable[AstNode]) -> int:
+    total = 0
+    for node in nodes:
+        if isinstance(node, Sequence):
+            total += count(node.funcs)
+        elif isinstance(node, Funcdef):
+            total += count([node.funcbody])
+        elif isinstance(node, Quote):
+            total += 1 + count([node.body])
+        else:
+            total += 1
+    return total
+
+
+def measure(code: str, partial_evaluation: bool, repeat: int=20) -> Tuple[int, float, float]:
+    """
+    :return: the number of words after optimization, the time to parse and optimize the
+    program, and the time to run it
+    """
+    interpreter = Interpreter(get_stdlib(), verbose=False, vectorized=False)
+    start = time.perf_counter()
+    nodes = Optimizer(interpreter.ctx, partial_evaluation=partial_evaluation).optimize(
+        FirstPhase(interpreter.ctx, verbose=False).parse_and_typecheck(code)
+    )
+    compiled = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        interpreter.clear()
+        for node in nodes:
+            interpreter.eval_astnode(node)
+    return count(nodes), compiled, (time.perf_counter() - start) / repeat
+
+
+def main():
+    print(f"{'program':>16} {'words':>6} {'+ peval':>8} {'opt (ms)':>9} {'+ peval (ms)':>13} "
+          f"{'run (ms)':>9} {'+ peval (ms)':>13} {'speedup':>8}")
+    for title, code in TABLES:
+        words, compiled, run = measure(code, False)
+        evaluated_words, evaluated_compiled, evaluated_run = measure(code, True)
+        print(f"{title:>16} {words:>6} {evaluated_words:>8} {1000 * compiled:>9.2f} {1000 * evaluated_compiled:>13.2f} "
+              f"{1000 * run:>9.3f} {1000 * evaluated_run:>13.3f} {run / evaluated_run:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
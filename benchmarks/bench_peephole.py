@@ -0,0 +1,118 @@
+"""
+Peephole optimization of long sequences: the trie-indexed single-pass `Rewriter` against the
+previous engine, which ran each `PeepholeOptimization` over the whole sequence (with a
+`list.pop(0)` per word) and repeated such rounds until nothing changed.
+
+The first table scales the sequence with the stdlib rules; the second one scales the number of
+rules on a 10k-word sequence. For the previous engine, each rule is a `PeepholeOptimization`.
+
+Run from the repository root:
+    python -m benchmarks.bench_peephole [--max-words N]
+"""
+import argparse
+import gc
+import time
+from typing import *
+
+from forfait.astnodes import Funcall
+from forfait.optimizer import PeepholeOptimization, Optimizer, stdlib_peeps
+from forfait.parser.firstphase import FirstPhase
+from forfait.peephole import RuleSet, Rule, load_rules, key
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+# balanced (it leaves the stack as it finds it), half of it folds
+CHUNK = "0 u16 retrieve-from 3 +u8 7 3 +u8 dup drop *u8 5 swap swap over over *u8 drop drop 1 u16 store-at"
+
+# the timings of the previous engine stop being measured above this
+MAX_LEGACY_SECONDS = 10.0
+
+
+def legacy_optimize(peeps: List[PeepholeOptimization], funcs: List[Funcall]) -> List[Funcall]:
+    """
+    The previous `Optimizer.optimize_sequence`.
+    """
+    while True:
+        local_copy, out = funcs[:], list()
+        for optimization in peeps:
+            while len(local_copy) >= optimization.arity:
+                out_funcall = optimization.try_optimization(local_copy)
+                if out_funcall is not None:
+                    out.append(out_funcall)
+            local_copy = out + local_copy
+            out = list()
+        if local_copy == funcs:
+            return funcs
+        funcs = local_copy
+
+
+def as_peephole_optimization(rule: Rule, rewriter) -> PeepholeOptimization:
+    def check(*window):
+        return [key(x) for x in window] == rule.keys and rule.match(list(window)) is not None
+
+    def generate(stream: List[Funcall]):
+        window = stream[:len(rule.keys)]
+        del stream[:len(rule.keys)]
+        stream[0:0] = rewriter._nodes(rule, rule.match(window), window)
+
+    return PeepholeOptimization(len(rule.keys), check, generate)
+
+
+def synthetic_rules(n_rules: int) -> RuleSet:
+    """
+    The stdlib rules, then rules on literals which never match the sequence (as most rules of a
+    large set don't match a given program), e.g. `N 3 *u8 => ...`.
+    """
+    rules = [f"N {k} {op} => (N)" for k in range(200, 256) for op in ("*u8", "+u8", "-u8", "/u8")]
+    return stdlib_peeps + load_rules("\n".join(rules[:max(0, n_rules - len(stdlib_peeps))]))
+
+
+def sequence(n_words: int) -> List[Funcall]:
+    chunk = len(CHUNK.split())
+    code = " ".join([CHUNK] * max(1, n_words // chunk))
+    return FirstPhase(get_stdlib(), verbose=False).parse_and_typecheck(code)[0].funcs
+
+
+def timed(f: Callable[[], Any]) -> Tuple[float, Any]:
+    gc.collect()
+    start = time.perf_counter()
+    out = f()
+    return time.perf_counter() - start, out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max-words", type=int, default=100_000)
+    args = parser.parse_args()
+
+    print("sequence length, stdlib rules")
+    print(f"{'words':>8} {'previous (s)':>13} {'rewriter (s)':>13} {'us/word':>8} {'speedup':>8}")
+    legacy_seconds = 0.0
+    for n in [n for n in (1000, 10_000, 25_000, 50_000, 100_000) if n <= args.max_words]:
+        funcs = sequence(n)
+        optimizer = Optimizer(get_stdlib())
+        elapsed, optimized = timed(lambda: optimizer.optimization_round(funcs))
+        if legacy_seconds < MAX_LEGACY_SECONDS:
+            peeps = [as_peephole_optimization(rule, optimizer.rewriter) for rule in stdlib_peeps.rules]
+            legacy_seconds, legacy = timed(lambda: legacy_optimize(peeps, funcs))
+            previous = f"{legacy_seconds:>13.3f}"
+            speedup = f"{legacy_seconds / elapsed:>7.1f}x"
+        else:
+            previous, speedup = f"{'-':>13}", f"{'-':>8}"
+        print(f"{len(funcs):>8} {previous} {elapsed:>13.3f} {1e6 * elapsed / len(funcs):>8.2f} {speedup}")
+
+    print()
+    print("number of rules, 10k words")
+    print(f"{'rules':>8} {'previous (s)':>13} {'rewriter (s)':>13} {'speedup':>8}")
+    funcs = sequence(10_000)
+    for n_rules in (len(stdlib_peeps), 50, 100, 200):
+        rules = synthetic_rules(n_rules)
+        optimizer = Optimizer(get_stdlib(), rules=rules)
+        elapsed, _ = timed(lambda: optimizer.optimization_round(funcs))
+        peeps = [as_peephole_optimization(rule, optimizer.rewriter) for rule in rules.rules]
+        legacy_seconds, _ = timed(lambda: legacy_optimize(peeps, funcs))
+        print(f"{len(rules):>8} {legacy_seconds:>13.3f} {elapsed:>13.3f} {legacy_seconds / elapsed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Overhead of profiling a program with `ProfilingInterpreter`, with and without timing the
+builtins, against the plain `Interpreter` (with the same optimizer, which doesn't inline words),
+on the programs of `bench_vm`; then the profile of the fibonacci example.
+
+Run from the repository root:
+    python -m benchmarks.bench_profiler
+"""
+import time
+
+from benchmarks.bench_vm import PROGRAMS
+from forfait.interpreter.interpreter import Interpreter
+from forfait.interpreter.profiler import ProfilingInterpreter
+from forfait.optimizer import Optimizer
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+def time_eval(machine, code: str) -> float:
+    start = time.perf_counter()
+    machine.eval(code)
+    return time.perf_counter() - start
+
+
+def interpreter() -> Interpreter:
+    machine = Interpreter(get_stdlib(), verbose=False, vectorized=False)
+    machine.optimizer = Optimizer(machine.ctx, inline=False)
+    return machine
+
+
+def main():
+    print(f"{'program':<14} {'interpreter (s)':>16} {'profiling (s)':>14} {'overhead':>9} "
+          f"{'counting builtins (s)':>22} {'overhead':>9}")
+    for name, code in PROGRAMS.items():
+        plain = min(time_eval(interpreter(), code) for _ in range(3))
+        timed = min(time_eval(ProfilingInterpreter(get_stdlib(), verbose=False, vectorized=False), code) for _ in range(3))
+        counted = min(time_eval(ProfilingInterpreter(get_stdlib(), verbose=False, vectorized=False, time_builtins=False), code)
+                      for _ in range(3))
+        print(f"{name:<14} {plain:>16.3f} {timed:>14.3f} {timed / plain:>8.1f}x "
+              f"{counted:>22.3f} {counted / plain:>8.1f}x")
+
+    profiling = ProfilingInterpreter(get_stdlib(), verbose=False)
+    profiling.eval(PROGRAMS["fibonacci"])
+    print()
+    print(profiling.profiler.table(limit=10))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Execution throughput, in words per second, of `RegisterProgram`s against the AST-walking
+`Interpreter`, on loop-free programs, with and without `constant_propagation`.
+
+Run from the repository root:
+    python -m benchmarks.bench_registers
+
+Parsing, typing and loading are not timed: each program is run many times.
+"""
+import timeit
+
+from benchmarks.bench_vm import CountingInterpreter
+from forfait.interpreter.interpreter import Interpreter
+from forfait.interpreter.registers import RegisterInterpreter
+from forfait.parser.firstphase import FirstPhase
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+ARITHMETIC = "3 +u8 dup *u8 7 -u8 dup 5 *u8 swap over -u8 +u8 "
+
+PROGRAMS = {
+    "constants":  "2 3 +u8 dup *u8 7 swap -u8 dup 5 *u8 swap over -u8 +u8 " * 8,
+    "arithmetic": "9 " + ARITHMETIC * 8,
+    "if":         "9 " + f"dup 100 <u8 [| {ARITHMETIC} |] [| dup -u8 |] if " * 8,
+    "nested":     "9 " + f"dup 100 <u8 [| dup 50 <u8 [| {ARITHMETIC} |] [| 1 +u8 |] if |] [| [| 2 *u8 |] eval |] if " * 8,
+}
+
+
+def per_second(stmt, number: int=2_000) -> float:
+    return number / min(timeit.repeat(stmt, number=number, repeat=5))
+
+
+def main():
+    print(f"{'program':<12} {'words':>6} {'interpreter (w/s)':>18} {'registers (w/s)':>16} {'propagated (w/s)':>17} {'speedup':>8}")
+    for name, code in PROGRAMS.items():
+        counter = CountingInterpreter(get_stdlib(), verbose=False)
+        counter.eval(code)
+        words = counter.executed
+
+        interpreter = Interpreter(get_stdlib(), verbose=False)
+        nodes = interpreter.optimizer.optimize(FirstPhase(interpreter.ctx, verbose=False).parse_and_typecheck(code))
+        def run_interpreter():
+            interpreter.stack.clear()
+            for node in nodes:
+                interpreter.eval_astnode(node)
+
+        speeds = [words * per_second(run_interpreter)]
+        for propagate_constants in (False, True):
+            registers = RegisterInterpreter(get_stdlib(), propagate_constants=propagate_constants)
+            program = registers.load(registers.optimizer.optimize(
+                FirstPhase(registers.ctx, verbose=False).parse_and_typecheck(code)
+            )[0])
+            speeds.append(words * per_second(lambda: program.run([])))
+
+        print(f"{name:<12} {words:>6} {speeds[0]:>18.0f} {speeds[1]:>16.0f} {speeds[2]:>17.0f} {speeds[2] / speeds[0]:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Dispatches and execution time of the `SuperinstructionVM` against the plain `VM`, on the
+loop programs of `bench_vm`, and the most frequent static n-grams of those programs.
+
+Run from the repository root:
+    python -m benchmarks.bench_superinstructions
+"""
+import time
+
+from benchmarks.bench_vm import PROGRAMS
+from forfait.interpreter.superinstructions import SuperinstructionVM, ngram_profile
+from forfait.interpreter.vm import VM
+from forfait.parser.firstphase import FirstPhase
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+def counting(vm_class):
+    class Counting(vm_class):
+        """
+        Counts the instructions dispatched by the program.
+        """
+        dispatched = 0
+
+        def _dispatch_table(self):
+            def count(f):
+                def g(arg):
+                    self.dispatched += 1
+                    f(arg)
+                return g
+            return [count(f) if f is not None else None for f in super()._dispatch_table()]
+    return Counting
+
+
+def time_eval(machine, code: str) -> float:
+    start = time.perf_counter()
+    machine.eval(code)
+    return time.perf_counter() - start
+
+
+def main():
+    print(f"{'program':<14} {'vm (disp)':>12} {'fused (disp)':>13} {'reduction':>10} {'vm (s)':>8} {'fused (s)':>10} {'speedup':>8}")
+    for name, code in PROGRAMS.items():
+        vm, fused = counting(VM)(get_stdlib()), counting(SuperinstructionVM)(get_stdlib())
+        vm.eval(code)
+        fused.eval(code)
+
+        before = min(time_eval(VM(get_stdlib()), code) for _ in range(7))
+        after  = min(time_eval(SuperinstructionVM(get_stdlib()), code) for _ in range(7))
+        print(f"{name:<14} {vm.dispatched:>12} {fused.dispatched:>13} {1 - fused.dispatched / vm.dispatched:>9.0%} "
+              f"{before:>8.3f} {after:>10.3f} {before / after:>7.1f}x")
+
+    print()
+    nodes = []
+    for code in PROGRAMS.values():
+        nodes.extend(FirstPhase(get_stdlib(), verbose=False).parse_and_typecheck(code))
+    for n in (2, 3):
+        print(f"most frequent {n}-grams:")
+        for ngram, count in ngram_profile(nodes, n).most_common(8):
+            print(f"    {count:>4} {' '.join(ngram)}")
+
+
+if __name__ == "__main__":
+    main()
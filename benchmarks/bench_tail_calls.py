@@ -0,0 +1,55 @@
+"""
+Execution time of a tail-recursive countdown, 1M calls deep, in the `Interpreter` (which runs
+calls on an explicit return stack) and in the `ClosureInterpreter` (where each call is a
+Python call).
+
+Run from the repository root:
+    python -m benchmarks.bench_tail_calls
+"""
+import time
+
+from forfait.interpreter.closures import ClosureInterpreter
+from forfait.interpreter.interpreter import Interpreter
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+# counts down a 24-bit counter, as three u8 (high, middle, low), with a tail call at each step
+COUNTDOWN = """
+: countdown
+    dup 0 ==u8
+    [| drop dup 0 ==u8
+        [| drop dup 0 ==u8
+            [| drop |]
+            [| --u8 255 255 countdown |] if |]
+        [| --u8 255 countdown |] if |]
+    [| --u8 countdown |] if ;
+"""
+
+DEPTHS = {
+    "1K":  "0 3 231 countdown",
+    "64K": "0 255 255 countdown",
+    "1M":  "15 255 255 countdown",
+}
+
+
+def time_eval(machine, code: str) -> str:
+    machine.eval(COUNTDOWN)
+    start = time.perf_counter()
+    try:
+        machine.eval(code)
+    except RecursionError:
+        return "RecursionError"
+    assert machine.stack == [], machine.stack
+    return f"{time.perf_counter() - start:.3f}"
+
+
+def main():
+    print(f"{'depth':<6} {'interpreter (s)':>16} {'closures (s)':>16}")
+    for name, code in DEPTHS.items():
+        interpreter = time_eval(Interpreter(get_stdlib(), verbose=False), code)
+        closures = time_eval(ClosureInterpreter(get_stdlib()), code)
+        print(f"{name:<6} {interpreter:>16} {closures:>16}")
+
+
+if __name__ == "__main__":
+    main()
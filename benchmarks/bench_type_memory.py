@@ -0,0 +1,66 @@
+"""
+Memory allocated for the types of typed ASTs, measured with tracemalloc.
+
+Run from the repository root:
+    python -m benchmarks.bench_type_memory [--copies N]
+
+Each program of the test suite (and the examples) is parsed and typechecked `--copies`
+times, keeping all the ASTs alive; the table reports the blocks and bytes still allocated
+afterwards (i.e. retained by the typed ASTs), and the peak during typechecking.
+"""
+import argparse
+import os
+import tracemalloc
+
+from forfait.parser.firstphase import FirstPhase
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+PROGRAMS = {
+    "numbers":           "1 3 5",
+    "quote":             "[| 1 3 5 |]",
+    "indexed-iter":      "0 5 [| dup u16 store-at |] indexed-iter",
+    "eval":              "5 true [| dup swap swap |] rot- swap eval",
+    "while":             "1 1 [| dup 100 <=u8 |] [| swap over +u8 |] while swap drop",
+    "nested quotes":     "5 true [| [| dup dup +u8 +u8 |] eval |] [| ++u8 |] if dup",
+    "identity":          "3 identity [| 1 2 3 |] identity",
+    "funcdef":           ": sq dup *u8 ; 0 10 [| sq 5 u16 store-at |] indexed-iter",
+}
+for filename in sorted(os.listdir(EXAMPLES)):
+    with open(os.path.join(EXAMPLES, filename)) as f:
+        PROGRAMS[filename] = f.read()
+
+
+def measure(code: str, copies: int) -> tuple[int, int, int]:
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+
+    asts = [FirstPhase(get_stdlib(), verbose=False).parse_and_typecheck(code) for _ in range(copies)]
+
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, "filename")
+    blocks = sum(s.count_diff for s in stats)
+    size   = sum(s.size_diff for s in stats)
+    del asts
+    return blocks, size, peak
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument("--copies", type=int, default=100)
+    args = argparser.parse_args()
+
+    print(f"{'program':<16} {'blocks/AST':>12} {'bytes/AST':>12} {'peak (KiB)':>12}")
+    for name, code in PROGRAMS.items():
+        blocks, size, peak = measure(code, args.copies)
+        print(f"{name:<16} {blocks / args.copies:>12.0f} {size / args.copies:>12.0f} {peak / 1024:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
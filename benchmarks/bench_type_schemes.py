@@ -0,0 +1,44 @@
+"""
+Instantiations per second of type signatures: precompiled `TypeScheme`s against the
+previous deepcopy + one `substitute_generic` traversal per generic.
+
+Run from the repository root:
+    python -m benchmarks.bench_type_schemes
+"""
+import copy
+import timeit
+
+from forfait.stdlibs.basic_stdlib import get_stdlib
+from forfait.ztypes.ztypes import ZTRowGeneric, ZTGeneric
+
+
+def legacy_fresh_type(t):
+    # what Context.fresh_type used to do (now that types are immutable, deepcopy is a no-op)
+    t = copy.deepcopy(t)
+    generics = set()
+    t.find_generics_inside(generics)
+    for old_generic in generics:
+        if isinstance(old_generic, ZTRowGeneric):
+            t = t.substitute_generic(old_generic, ZTRowGeneric(old_generic.human_name))
+        else:
+            t = t.substitute_generic(old_generic, ZTGeneric(old_generic.human_name))
+    return t
+
+
+def per_second(stmt, number: int) -> float:
+    return number / min(timeit.repeat(stmt, number=number, repeat=5))
+
+
+def main():
+    ctx = get_stdlib()
+
+    print(f"{'builtin':<14} {'before (inst/s)':>16} {'after (inst/s)':>16} {'speedup':>8}")
+    for funcname in ["dup", "swap", "rot+", "+u8", "if", "while", "indexed-iter", "eval"]:
+        t = ctx.builtin_types[funcname]
+        before = per_second(lambda: legacy_fresh_type(t), 2_000)
+        after  = per_second(lambda: ctx.fresh_builtin_type(funcname), 20_000)
+        print(f"{funcname:<14} {before:>16.0f} {after:>16.0f} {after / before:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+Execution time of `indexed-iter` loops whose body is pure arithmetic, in the `Interpreter`,
+with and without NumPy vectorization.
+
+Run from the repository root:
+    python -m benchmarks.bench_vectorize
+"""
+import time
+
+from forfait.interpreter.interpreter import Interpreter
+from forfait.interpreter.vectorize import np
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+PROGRAMS = {
+    "squares":   ": square dup *u8 ; 0 250 [| drop 0 250 [| dup square swap u16 store-at |] indexed-iter |] indexed-iter",
+    "constant":  ": square dup *u8 ; 0 250 [| drop 0 250 [| square 7 u16 store-at |] indexed-iter |] indexed-iter",
+    "polynomial": "0 250 [| drop 0 250 [| dup dup dup *u8 3 *u8 swap 5 *u8 +u8 7 +u8 swap u16 store-at |] indexed-iter |] indexed-iter",
+    "two stores": "0 250 [| drop 0 250 [| dup dup ++u8 swap u16 store-at dup 2 *u8 swap --u8 u16 store-at |] indexed-iter |] indexed-iter",
+}
+
+
+def time_eval(machine, code: str) -> float:
+    start = time.perf_counter()
+    machine.eval(code)
+    return time.perf_counter() - start
+
+
+def main():
+    if np is None:
+        print("NumPy is not installed")
+        return
+
+    print(f"{'program':<12} {'scalar (s)':>11} {'vectorized (s)':>15} {'speedup':>8}")
+    for name, code in PROGRAMS.items():
+        scalar = min(time_eval(Interpreter(get_stdlib(), verbose=False, vectorized=False), code) for _ in range(3))
+        vectorized = min(time_eval(Interpreter(get_stdlib(), verbose=False), code) for _ in range(3))
+        print(f"{name:<12} {scalar:>11.3f} {vectorized:>15.3f} {scalar / vectorized:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
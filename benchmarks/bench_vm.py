@@ -0,0 +1,65 @@
+"""
+Execution throughput, in words per second, of the bytecode `VM` against the AST-walking
+`Interpreter`, on the fibonacci example and on loop-heavy programs.
+
+Run from the repository root:
+    python -m benchmarks.bench_vm
+
+Words are counted once per execution: a word inside a loop counts at each iteration. They are
+counted as the instructions dispatched by the VM, so the no-op words (`u16`, `identity`),
+which are not compiled, are not counted.
+"""
+import os
+import time
+
+from forfait.interpreter.interpreter import Interpreter
+from forfait.interpreter.vm import VM
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+with open(os.path.join(os.path.dirname(__file__), "..", "examples", "fibonacci.forf")) as f:
+    FIBONACCI = f.read()
+
+PROGRAMS = {
+    "fibonacci":    FIBONACCI + " 0 100 [| drop 250 fibonacci drop |] indexed-iter",
+    "indexed-iter": "0 250 [| drop 0 250 [| dup u16 store-at |] indexed-iter |] indexed-iter",
+    "while":        "0 250 [| drop 250 [| dup 0 >u8 |] [| --u8 |] while drop |] indexed-iter",
+    "arithmetic":   "0 250 [| 0 250 [| over *u8 swap 3 +u8 swap -u8 |] indexed-iter drop |] indexed-iter",
+}
+
+
+class CountingVM(VM):
+    """
+    Counts the words executed by the program.
+    """
+    executed = 0
+
+    def _dispatch_table(self):
+        def count(f):
+            def g(arg):
+                self.executed += 1
+                f(arg)
+            return g
+        return [count(f) if f is not None else None for f in super()._dispatch_table()]
+
+
+def time_eval(machine, code: str) -> float:
+    start = time.perf_counter()
+    machine.eval(code)
+    return time.perf_counter() - start
+
+
+def main():
+    print(f"{'program':<14} {'words':>10} {'interpreter (w/s)':>18} {'vm (w/s)':>12} {'speedup':>8}")
+    for name, code in PROGRAMS.items():
+        counter = CountingVM(get_stdlib())
+        counter.eval(code)
+        words = counter.executed
+
+        interpreter = words / time_eval(Interpreter(get_stdlib(), verbose=False, vectorized=False), code)
+        vm = words / time_eval(VM(get_stdlib()), code)
+        print(f"{name:<14} {words:>10} {interpreter:>18.0f} {vm:>12.0f} {vm / interpreter:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
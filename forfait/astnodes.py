@@ -1,7 +1,6 @@
 import logging
 
 
-import copy
 from abc import abstractmethod
 from typing import Optional
 
@@ -47,22 +46,16 @@ class Funcall(AstNode):
         print(f"{' '*indent}Funcall {self.funcname} :: {self.type}")
 
     def finally_annotate_quotes(self, ctx: Context):
-        subs, order = ctx.ordered_subs()
-        for lhs in order:
-            if lhs.counter not in subs:  # HACK: TODO: da ripensare eh
-                continue
-
-            self.type.substitute_generic(lhs, subs[lhs.counter])
-
-        self.type.left.keep_last_n(self.arity_in)
-        self.type.right.keep_last_n(self.arity_out)
+        self.type = ctx.resolve(self.type)
+        self.type = ZTFunction(self.type.left.keep_last_n(self.arity_in), self.type.right.keep_last_n(self.arity_out))
 
 
 ##################################################
 
 class Quote(Funcall):
-    def __init__(self, body: "Sequence"):
+    def __init__(self, body: "Sequence", position: Optional[str]=None):
         self.body: Sequence = body
+        self.position: Optional[str] = position  # of the opening `[|` in the source, as line:column
         self.row_generic = ZTRowGeneric("NQ")
         self.funcname = None # ?
 
@@ -74,14 +67,7 @@ class Quote(Funcall):
         if self.type is not None:
              return self.type
 
-        # TODO: credo che usare qui copy() sia un grosso problema.
-        #  infatti quando poi devi ricostruire il tipo interno delle funcall nella quote non riesci,
-        #  perché ti troverai con delle type variables T_123 internamente identiche ma con hash diversi
-        #  (e infati questo è uno dei problemi che hai trovato, che quando aggiungi una sub ti ritrovi cose tipo
-        #  T_123 =?= T_123 il che è paradossale, e forse richiede di implementare un eq() fra tipi)
-        # TODO: ma poi perché faccio la copy? Immagino sia perché in futuro "taglierò" questi tipi, ma
-        #  quando e perche?
-        self.type      = ZTFuncHelper(self.row_generic, [], self.row_generic, [copy.deepcopy(self.body.typeof(ctx))])
+        self.type      = ZTFuncHelper(self.row_generic, [], self.row_generic, [self.body.typeof(ctx)])
         self.arity_in  = self.type.left.arity()  # is it always 0 right?
         self.arity_out = self.type.right.arity() # is it always 1 right?
 
@@ -187,14 +173,17 @@ class Sequence(AstNode):
 
     def typeof(self, ctx: Context) -> ZTFunction:
         # if the type was already calculated, then return the old result
-        logging.debug(f"Typechecking sequence: {self}")
+        logging.debug("Typechecking sequence: %s", self)
 
         if self.type is not None:
-            logging.debug(f"Sequence had an already-set type, namely: {self.type}")
+            logging.debug("Sequence had an already-set type, namely: %s", self.type)
             return self.type
 
         if len(self.funcs) == 0:
-            raise ZException("Empty sequence of funcalls has no type")
+            # e.g. the body of an empty quotation, which leaves the stack as it is
+            row = ZTRowGeneric("E")
+            self.type = ZTFuncHelper(row, [], row, [])
+            return self.type
 
         if len(self.funcs) == 1:
             out = self.funcs[0].typeof(ctx)
@@ -218,10 +207,9 @@ class Sequence(AstNode):
         # (where would they be needed?)
         # ctx.clear_generic_subs()
 
-        # store the final type of the whole sequence (`copy` is needed, as otherwise
-        # it would be cut when adjusting the arity of the types in Context, at the end
-        # of the parsing phase)
-        self.type = copy.deepcopy(last_type)
+        # store the final type of the whole sequence (types are immutable, so it is not
+        # affected when the arity of the types is adjusted at the end of the parsing phase)
+        self.type = last_type
 
         return last_type
 
@@ -256,5 +244,4 @@ class Funcdef(AstNode):
         self.funcbody.prettyprint(indent+2)
 
     def finally_annotate_quotes(self, ctx: Context):
-        for node in self.funcbody:
-            node.finally_annotate_quotes(ctx)
+        self.funcbody.finally_annotate_quotes(ctx)
@@ -0,0 +1,154 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import zlib
+from typing import *
+
+from forfait.astnodes import AstNode
+from forfait.parser.firstphase import FirstPhase
+from forfait.ssa.ssa import CFG
+from forfait.ztypes.context import Context
+from forfait.ztypes.ztypes import ZType, ZTGeneric, ZTRowGeneric, ZTRow, ZTFunction, ZTComposite
+
+
+# bumped whenever the pickled classes (AST nodes, types, CFGs) change incompatibly
+FORMAT_VERSION = 1
+
+MAGIC = b"FORF"
+
+
+def signature(t: ZType, names: Optional[Dict[int, str]]=None) -> str:
+    """
+    :return: the type as a string where the generics are numbered in order of appearance, so
+    that types which only differ by the names (or counters) of their generics have the same
+    signature, and types with different generics have different ones
+    """
+    names = dict() if names is None else names
+    if isinstance(t, ZTGeneric):
+        if t.counter not in names:
+            names[t.counter] = f"{'..' if isinstance(t, ZTRowGeneric) else '.'}{len(names)}"
+        return names[t.counter]
+    if isinstance(t, ZTRow):
+        return " ".join([signature(t.row_var, names)] + [signature(x, names) for x in t.types])
+    if isinstance(t, ZTFunction):
+        return f"({signature(t.left, names)} -> {signature(t.right, names)})"
+    if isinstance(t, ZTComposite):
+        return f"{t.typename}<{' '.join(signature(x, names) for x in t.inner_types)}>"
+    return str(t)
+
+
+class ModuleCache:
+    """
+    An on-disk cache of the typed ASTs of source files (and optionally of their CFGs), so that
+    loading a file which did not change skips `FirstPhase` entirely.
+
+    Entries are keyed by a hash of the source code, of the signatures of the builtins and of the
+    user-defined words it is typechecked with, and of `FORMAT_VERSION`: changing a signature in
+    the stdlib, or a word the file uses, gives a different key. Each entry is a pickle of the
+    typed AST and of the user-defined words it adds to the `Context`, compressed with zlib.
+    An entry which can't be read is a miss, and it is overwritten.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self._stdlib_signatures: Dict[int, Tuple[Mapping[str, ZType], str]] = dict()
+
+    def key(self, ctx: Context, code: str) -> str:
+        h = hashlib.sha256()
+        h.update(f"{FORMAT_VERSION}\n{self._stdlib_signature(ctx)}\n".encode())
+        for funcname in sorted(ctx.user_types):
+            h.update(f"{funcname} :: {signature(ctx.user_types[funcname])}\n".encode())
+        h.update(b"\n")
+        h.update(code.encode())
+        return h.hexdigest()
+
+    def _stdlib_signature(self, ctx: Context) -> str:
+        # the builtins are usually shared by many contexts, see `Context.overlay`
+        builtins = ctx.builtin_types
+        if id(builtins) not in self._stdlib_signatures or self._stdlib_signatures[id(builtins)][0] is not builtins:
+            h = hashlib.sha256()
+            for funcname in sorted(builtins):
+                h.update(f"{funcname} :: {signature(builtins[funcname])}\n".encode())
+            self._stdlib_signatures[id(builtins)] = (builtins, h.hexdigest())
+        return self._stdlib_signatures[id(builtins)][1]
+
+    ##################################################
+
+    def parse_and_typecheck(self, ctx: Context, code: str, verbose=False) -> List[AstNode]:
+        """
+        Same as `FirstPhase(ctx, verbose).parse_and_typecheck(code)`, from the cache if possible.
+        """
+        key = self.key(ctx, code)
+        entry = self._load(key)
+        if entry is None:
+            user_types = dict(ctx.user_types)
+            nodes = FirstPhase(ctx, verbose=verbose).parse_and_typecheck(code)
+            self._store(key, (nodes, self._new_user_types(ctx, user_types)))
+            return nodes
+
+        nodes, user_types = entry
+        self._add_user_types(ctx, user_types)
+        if verbose:
+            for node in nodes:
+                print(node.typeof(ctx))
+        return nodes
+
+    def cfgs(self, ctx: Context, code: str, build: Callable[[List[AstNode]], List[CFG]]) -> List[CFG]:
+        """
+        :param build: builds the CFGs of the typed AST of `code`
+        :return: the CFGs of `code`, from the cache if possible
+        """
+        key = self.key(ctx, code) + ".ssa"
+        entry = self._load(key)
+        if entry is None:
+            user_types = dict(ctx.user_types)
+            cfgs = build(FirstPhase(ctx, verbose=False).parse_and_typecheck(code))
+            self._store(key, (cfgs, self._new_user_types(ctx, user_types)))
+            return cfgs
+
+        cfgs, user_types = entry
+        self._add_user_types(ctx, user_types)
+        return cfgs
+
+    @staticmethod
+    def _new_user_types(ctx: Context, before: Dict[str, ZTFunction]) -> Dict[str, ZTFunction]:
+        return {funcname: t for funcname, t in ctx.user_types.items() if before.get(funcname) is not t}
+
+    @staticmethod
+    def _add_user_types(ctx: Context, user_types: Dict[str, ZTFunction]):
+        for funcname, t in user_types.items():
+            ctx.add_userfunction_type(funcname, t)
+
+    ##################################################
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _load(self, key: str) -> Optional[Any]:
+        try:
+            with open(self._path(key), "rb") as f:
+                data = f.read()
+            if not data.startswith(MAGIC):
+                raise ValueError(f"Not a cache entry: {self._path(key)}")
+            entry = pickle.loads(zlib.decompress(data[len(MAGIC):]))
+        except (OSError, ValueError, EOFError, zlib.error, pickle.UnpicklingError, AttributeError, ImportError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def _store(self, key: str, entry: Any):
+        data = MAGIC + zlib.compress(pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+        # written to a temporary file and renamed, so that readers never see a partial entry
+        fd, path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(path, self._path(key))
+        except OSError:
+            os.unlink(path)
+            raise
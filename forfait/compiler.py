@@ -3,7 +3,8 @@ import logging
 
 from typing import List, Optional
 
-from forfait.astnodes import AstNode
+from forfait.astnodes import AstNode, Funcdef
+from forfait.cache import ModuleCache
 from forfait.code_generator import CodeGenerator
 from forfait.optimizer import Optimizer
 from forfait.parser.firstphase import FirstPhase
@@ -12,28 +13,47 @@ from forfait.stdlibs.basic_stdlib import get_stdlib
 from forfait.ztypes.context import Context
 
 class Compiler:
-    def __init__(self, ctx:Optional[Context]=None, debug_level=0):
+    def __init__(self, ctx:Optional[Context]=None, debug_level=0, cache: Optional[ModuleCache]=None, optimize=False):
         self.ctx = ctx if ctx is not None else get_stdlib()
         self.debug_level = debug_level
+        self.cache = cache  # of the typed ASTs (and CFGs) of the compiled code, if any
+
+        # whether the typed AST is optimized before SSA-ification: this inlines the calls of
+        # user-defined words, which `SSA_ification` doesn't support
+        self.optimizer = Optimizer(self.ctx) if optimize else None
 
     def _debug(self, required_level: int, s: str):
         if self.debug_level >= required_level:
             print(s)
 
+    def parse_and_typecheck(self, source: str) -> List[AstNode]:
+        if self.cache is not None:
+            return self.cache.parse_and_typecheck(self.ctx, source, verbose=True)
+        return FirstPhase(self.ctx).parse_and_typecheck(source)
+
     def compile_source_code(self, source: str):
-        typed_ast: List[AstNode]     = FirstPhase(self.ctx).parse_and_typecheck(source)
+        typed_ast: List[AstNode]     = self.parse_and_typecheck(source)
         optimized_ast: List[AstNode] = Optimizer(self.ctx).optimize(typed_ast)
         asm_code                     = CodeGenerator(self.ctx).generate(optimized_ast)
         self._debug(1, asm_code)
 
     def ssify(self, source: str) -> list[CFG]:
+        if self.cache is not None and self.optimizer is None:
+            # the optimizer keeps the definitions it inlines, which a hit wouldn't give it
+            return self.cache.cfgs(self.ctx, source, self._ssify)
+        return self._ssify(FirstPhase(self.ctx).parse_and_typecheck(source))
+
+    def _ssify(self, typed_ast: List[AstNode]) -> list[CFG]:
         from forfait.ssa.ssa import SSA_ification
 
-        typed_ast: List[AstNode] = FirstPhase(self.ctx).parse_and_typecheck(source)
+        if self.optimizer is not None:
+            typed_ast = self.optimizer.optimize(typed_ast)
 
         cfgs = list()
         for astnode in typed_ast:
             self._debug(1, str(astnode))
+            if isinstance(astnode, Funcdef):
+                continue  # no code runs where a word is defined
 
             cfg, _ = SSA_ification(astnode)  # TODO: scartare i vstack da un astnode all'altro ti fa perdere qualcosa secondo me
             cfg    = constant_propagation(cfg)
@@ -6,18 +6,15 @@ class DependencyGraphException(Exception):
 class Graph:
     """
     Needed to check for put an order on rewritings of types.
+
+    Nodes are hashable ids (e.g. the counters of generics); both the cycle check and the
+    ordered visit are O(V+E).
     """
     def __init__(self):
-        self.outer_edges = dict()  # i vicini in uscita
-        self.inner_edges = dict()  # i vicini entranti
+        self.outer_edges: Dict[Any, Set[Any]] = dict()  # i vicini in uscita
+        self.inner_edges: Dict[Any, Set[Any]] = dict()  # i vicini entranti
         self.nodes = set()
 
-    def __update(self, d, key, val):
-        if key in d:
-            d[key].append(val)
-        else:
-            d[key] = [val]
-
     def add_node(self, x):
         self.nodes.add(x)
 
@@ -25,69 +22,72 @@ class Graph:
         self.nodes.add(x)
         self.nodes.add(y)
 
-        self.__update(self.outer_edges, x, y)
-        self.__update(self.inner_edges, y, x)
+        self.outer_edges.setdefault(x, set()).add(y)
+        self.inner_edges.setdefault(y, set()).add(x)
 
-    def is_terminal_generic(self, gen) -> List[Any]:
+    def is_terminal_generic(self, gen) -> bool:
         return gen in self.nodes and (gen not in self.outer_edges)
 
     def ciclicity_check(self):
-        for node in self.nodes:
-            self.ciclicity_check_single_node(node, [])
-
-    def ciclicity_check_single_node(self, node, path):
-        if node not in self.outer_edges:
-            return
-
-        for neigh in self.outer_edges[node]:
-            if neigh in path:
-                raise DependencyGraphException(
-                    f"Found ciclicity: " + " ==> ".join([str(x) for x in path]) + " ==> " + str(neigh) +
-                    f"\nGraph is:\n{self}"
-                )
-            self.ciclicity_check_single_node(neigh, path + [neigh])
-
+        """
+        Raises DependencyGraphException, reporting the whole cycle, if the graph has one.
+        """
+        cycle = self.find_cycle()
+        if cycle is not None:
+            raise DependencyGraphException(
+                f"Found ciclicity: " + " ==> ".join([str(x) for x in cycle]) +
+                f"\nGraph is:\n{self}"
+            )
+
+    def find_cycle(self) -> Optional[List[Any]]:
+        """
+        Iterative depth-first search, where each node is explored once.
+        :return: a cycle as a list of nodes, with the first one repeated at the end, or None
+        """
+        on_path, done = dict(), set()   # node on the current DFS path ~~> its position in `path`
+        for start in self.nodes:
+            if start in done:
+                continue
+            path = [start]
+            on_path[start] = 0
+            stack = [iter(self.outer_edges.get(start, ()))]
+            while len(stack) > 0:
+                for neigh in stack[-1]:
+                    if neigh in on_path:
+                        return path[on_path[neigh]:] + [neigh]
+                    if neigh not in done:
+                        on_path[neigh] = len(path)
+                        path.append(neigh)
+                        stack.append(iter(self.outer_edges.get(neigh, ())))
+                        break
+                else:
+                    # all the successors of the last node on the path are explored
+                    stack.pop()
+                    node = path.pop()
+                    del on_path[node]
+                    done.add(node)
+        return None
 
     def ordered_visit(self) -> List[Any]:
         """
-        :return: Ordered list of nodes to visit.
+        :return: Ordered list of nodes to visit (each node before its successors).
         """
+        # Kahn: a node is visited once all its predecessors have been visited
+        missing = {node: len(self.inner_edges.get(node, ())) for node in self.nodes}
+        stack = [node for node, n in missing.items() if n == 0]
 
-        # Se non ho nodi non ho niente da visitare
-        if len(self.nodes) == 0:
-            return []
-
-        # Controllo se ci sono cicli, prima di iniziare qualsiasi visita
-        self.ciclicity_check()
-
-        # ordered list of nodes
         order = list()
-
-        # initial elements are all nodes with no entering edges;
-        # stack = list(self.nodes - set(self.inner_edges.keys()))
-        stack = set()
-        for node in self.nodes - set(self.inner_edges.keys()):
-            # se un nodo è un singleton, escludilo
-            # if node not in self.outer_edges:
-            #     continue
-            stack.add(node)
-        stack = list(stack)
-
-
         while len(stack) > 0:
             node = stack.pop()
-
-            # add extracted node to ordered list
-            if node not in order:
-                order.append(node)
-
-            for neigh in self.outer_edges.get(node, []):
-                # you can visit a node only if all its predecessors have already been visited
-                if all(x in order for x in self.inner_edges[neigh]):
-                    # don't output terminal nodes, you don't need them
-                    # if not self.is_terminal_generic(neigh):
+            order.append(node)
+            for neigh in self.outer_edges.get(node, ()):
+                missing[neigh] -= 1
+                if missing[neigh] == 0:
                     stack.append(neigh)
 
+        if len(order) < len(self.nodes):
+            # the nodes never visited are on a cycle, or after one
+            self.ciclicity_check()
         return order
 
     def __str_edges(self, edges: dict):
@@ -102,6 +102,133 @@ class Graph:
                 f"Outer edges:\n{self.__str_edges(self.outer_edges)}")
 
 
+class IncrementalGraph(Graph):
+    """
+    A dependency graph which is kept acyclic while edges are inserted one at a time.
+
+    A topological order of the nodes is maintained online (Pearce-Kelly algorithm): inserting
+    an edge that agrees with the current order costs O(1), otherwise only the nodes between
+    its two ends in the order are visited and shifted. An edge closing a cycle is refused.
+    """
+    def __init__(self):
+        super().__init__()
+        self.position: Dict[Any, int] = dict()  # node ~~> its index in the topological order
+        self.__front = 0
+        self.__back = 0
+
+    def add_node(self, x, last: bool=False):
+        """
+        Adds `x`, if new, at the front (or at the back, if `last`) of the order.
+        """
+        if x not in self.position:
+            self.nodes.add(x)
+            if last:
+                self.__back += 1
+                self.position[x] = self.__back
+            else:
+                self.__front -= 1
+                self.position[x] = self.__front
+
+    def add_edge(self, x, y):
+        """
+        Inserts the edge x ==> y, keeping the topological order up to date.
+        Raises DependencyGraphException if the edge would close a cycle.
+        """
+        # a new node can always be placed where the edge agrees with the order
+        self.add_node(x)
+        self.add_node(y, last=True)
+
+        if x == y:
+            raise DependencyGraphException(f"Found ciclicity: {x} ==> {y}")
+        if y in self.outer_edges.get(x, ()):
+            return
+
+        lower, upper = self.position[y], self.position[x]
+        if lower < upper:
+            forward  = self.__visit_forward(y, x, upper)
+            backward = self.__visit_backward(x, lower)
+            self.__reorder(backward, forward)
+
+        self.outer_edges.setdefault(x, set()).add(y)
+        self.inner_edges.setdefault(y, set()).add(x)
+
+    def merge_nodes(self, x, into):
+        """
+        Removes node `x`, moving all its edges on node `into`.
+        """
+        if x == into or x not in self.position:
+            self.add_node(into)
+            return
+
+        outer = self.outer_edges.pop(x, set())
+        inner = self.inner_edges.pop(x, set())
+        for y in outer:
+            self.inner_edges[y].discard(x)
+        for w in inner:
+            self.outer_edges[w].discard(x)
+        self.nodes.discard(x)
+        del self.position[x]
+
+        for y in outer:
+            self.add_edge(into, y)
+        for w in inner:
+            self.add_edge(w, into)
+
+    def ciclicity_check(self):
+        # the graph is acyclic by construction
+        pass
+
+    def ordered_visit(self) -> List[Any]:
+        """
+        :return: Ordered list of nodes to visit (each node before its successors).
+        """
+        return sorted(self.nodes, key=self.position.__getitem__)
+
+    def __visit_forward(self, start, target, upper: int) -> List[Any]:
+        # nodes reachable from `start` and placed before `upper`; reaching `target` means a cycle
+        visited, parent = {start}, {start: None}
+        stack = [start]
+        while len(stack) > 0:
+            node = stack.pop()
+            for neigh in self.outer_edges.get(node, ()):
+                if neigh == target:
+                    path = [node]
+                    while parent[node] is not None:
+                        node = parent[node]
+                        path.append(node)
+                    path = [target] + path[::-1] + [target]
+                    raise DependencyGraphException(
+                        f"Found ciclicity: " + " ==> ".join(str(x) for x in path)
+                    )
+                if neigh not in visited and self.position[neigh] < upper:
+                    visited.add(neigh)
+                    parent[neigh] = node
+                    stack.append(neigh)
+        return list(visited)
+
+    def __visit_backward(self, start, lower: int) -> List[Any]:
+        # nodes from which `start` is reachable, and placed after `lower`
+        visited = {start}
+        stack = [start]
+        while len(stack) > 0:
+            node = stack.pop()
+            for neigh in self.inner_edges.get(node, ()):
+                if neigh not in visited and self.position[neigh] > lower:
+                    visited.add(neigh)
+                    stack.append(neigh)
+        return list(visited)
+
+    def __reorder(self, backward: List[Any], forward: List[Any]):
+        # the affected nodes take the same set of positions as before, with all the
+        # `backward` nodes (in their relative order) before all the `forward` ones
+        backward.sort(key=self.position.__getitem__)
+        forward.sort(key=self.position.__getitem__)
+        nodes = backward + forward
+        positions = sorted(self.position[n] for n in nodes)
+        for node, pos in zip(nodes, positions):
+            self.position[node] = pos
+
+
 if __name__ == '__main__':
     g = Graph()
 
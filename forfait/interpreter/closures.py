@@ -0,0 +1,346 @@
+from typing import *
+
+from forfait.astnodes import AstNode, Quote, Number, Funcall, Funcdef, Sequence, Boolean
+from forfait.interpreter.vm import NO_OPS
+from forfait.my_exceptions import ZException
+from forfait.optimizer import Optimizer, stdlib_peeps
+from forfait.parser.firstphase import FirstPhase
+from forfait.ssa.ssa import SSA_ification, SSA_Constant, SSA_Copy, SSA_Cast, SSA_Binop, Register
+from forfait.ssa.ssa import BINOPS as SSA_BINOPS
+from forfait.ztypes.context import Context
+from forfait.ztypes.ztypes import ZType
+
+
+class ZClosureError(ZException):
+    pass
+
+##################################################
+
+# Python source of the binary operators, applied to (top, second) as in `Interpreter`
+BINOPS: Dict[str, str] = {
+    **{f"{symbol}u{bits}": f"({{top}} % {modulo} {op} {{second}} % {modulo}) % {modulo}"
+       for bits, modulo in ((8, 256), (16, 65536))
+       for symbol, op in (("+", "+"), ("-", "-"), ("*", "*"), ("/", "//"))},
+    ">u8":  "{top} % 256 < {second} % 256",  "<u8":  "{top} % 256 > {second} % 256",
+    ">=u8": "{top} % 256 <= {second} % 256", "<=u8": "{top} % 256 >= {second} % 256",
+    "==u8": "{top} % 256 == {second} % 256", "!=u8": "{top} % 256 != {second} % 256",
+}
+
+# Python source of the builtins working on the list stack; quotations are Python callables
+BUILTINS: Dict[str, List[str]] = {
+    "swap": ["stack[-1], stack[-2] = stack[-2], stack[-1]"],
+    "drop": ["pop()"],
+    "dup":  ["push(stack[-1])"],
+    "over": ["push(stack[-2])"],
+    "rot-": ["stack[-3:] = stack[-2], stack[-1], stack[-3]"],
+    "rot+": ["stack[-3:] = stack[-1], stack[-3], stack[-2]"],
+    "++u8":  ["stack[-1] = (stack[-1] + 1) % 256"],   "--u8":  ["stack[-1] = (stack[-1] - 1) % 256"],
+    "++u16": ["stack[-1] = (stack[-1] + 1) % 65536"], "--u16": ["stack[-1] = (stack[-1] - 1) % 65536"],
+    **{funcname: [f"push({source.format(top='pop()', second='pop()')})"] for funcname, source in BINOPS.items()},
+    "if": [
+        "else_, then_, cond = pop(), pop(), pop()",
+        "(then_ if cond else else_)()",
+    ],
+    "while": [
+        "body, cond = pop(), pop()",
+        "while True:",
+        "    cond()",
+        "    if not pop():",
+        "        break",
+        "    body()",
+    ],
+    "indexed-iter": [
+        "quote = pop()",
+        "end, start = pop(), pop()",
+        "for i in range(start, end):",
+        "    push(i % 256)",
+        "    quote()",
+    ],
+    "eval": ["pop()()"],
+    "store-at": [
+        "address = pop()",
+        "obj = pop()",
+        "assert isinstance(obj, int) and 0 <= obj <= 256",
+        "memory[address] = obj",
+    ],
+    "retrieve-from": ["stack[-1] = memory.get(stack[-1], 0)"],
+    "__clear": ["clear()"],
+    ":s": ["print(stack)"],
+}
+
+# words whose stack effect is simulated by `SSA_ification`
+STRAIGHT_LINE: Set[str] = {"swap", "drop", "dup", "over", "rot-", "rot+"} | (set(SSA_BINOPS) & set(BINOPS))
+
+# quotations are inlined in loops only up to this depth (CPython allows 20 nested loops per function)
+MAX_INLINED_LOOPS = 16
+
+
+class ClosureInterpreter:
+    """
+    Compiles the typed (and optimized) AST to Python functions, and runs them.
+
+    Each user-defined word, quotation and top-level sequence becomes the source of a Python
+    function, which is compiled with `compile`/`exec`. Runs of straight-line words (literals,
+    stack shufflers and arithmetic) are transformed with `SSA_ification`: their operands are
+    loaded from the stack into local variables once, and their results are stored back once.
+    Every other word works on the list stack; a quotation immediately consumed by `eval`, `if`,
+    `while` or `indexed-iter` is inlined in the function, otherwise it is compiled to its own
+    function and pushed on the stack.
+
+    User-defined words are compiled once, when they are defined, and generated functions are
+    cached by their source and the user-defined words they call.
+    The semantics are the same as `Interpreter`'s.
+    """
+    def __init__(self, ctx: Context, verbose=False):
+        self.ctx = ctx
+        self.optimizer = Optimizer(self.ctx, stdlib_peeps, redefinable=True)
+
+        self.verbose = verbose
+
+        self.memory = dict()
+        self.stack = list()
+        self.words: Dict[str, Callable[[], None]] = dict()
+
+        self.cache: Dict[Tuple[str, FrozenSet[str]], Callable[[], None]] = dict()
+
+        self.namespace: Dict[str, Any] = {
+            "stack": self.stack, "push": self.stack.append, "pop": self.stack.pop,
+            "memory": self.memory, "words": self.words, "clear": self.clear,
+        }
+        self._counter = 0   # for unique names in the generated source
+        self._quotes: Dict[str, Callable[[], None]] = dict()  # pushed by the function being compiled
+
+    def clear(self):
+        self.ctx.clear_generic_subs()
+        self.memory.clear()
+        self.words.clear()
+        self.stack.clear()
+        # the generated functions hold the ones they use
+        self.cache.clear()
+
+    def eval(self, s: str):
+        for node in self.optimizer.optimize(FirstPhase(self.ctx, verbose=self.verbose).parse_and_typecheck(s)):
+            if isinstance(node, Funcdef):
+                self.words[node.funcname] = self.compile(node.funcbody, defining=node.funcname)
+            else:
+                self.compile(node)()
+
+    ##################################################
+    # compiler
+
+    def compile(self, node: AstNode, defining: Optional[str]=None) -> Callable[[], None]:
+        """
+        :param defining: name of the word whose body is `node`
+        :return: a function running `node` on `self.stack`
+        """
+        return self._cached(node, frozenset(self._user_words(node, defining)))
+
+    def _cached(self, node: AstNode, user_words: FrozenSet[str]) -> Callable[[], None]:
+        key = (str(node), user_words)
+        if key not in self.cache:
+            self.cache[key] = self._compile_function(node, user_words)
+        return self.cache[key]
+
+    def _user_words(self, node: AstNode, defining: Optional[str]) -> Iterator[str]:
+        if isinstance(node, Sequence):
+            for f in node.funcs:
+                yield from self._user_words(f, defining)
+        elif isinstance(node, Quote):
+            yield from self._user_words(node.body, defining)
+        elif isinstance(node, Funcall) and (node.funcname in self.words or node.funcname == defining):
+            yield node.funcname
+
+    def _compile_function(self, node: AstNode, user_words: FrozenSet[str]) -> Callable[[], None]:
+        name = self._fresh("f")
+        outer, self._quotes = self._quotes, dict()
+        try:
+            body = self._emit(node, user_words, 1, 0) or ["    pass"]
+            quotes = self._quotes
+        finally:
+            self._quotes = outer
+        # the quotations it pushes are bound like the rest of its state, so that the namespace
+        # doesn't keep them
+        parameters = ["stack=stack", "push=push", "pop=pop", "memory=memory", "words=words", "clear=clear"]
+        parameters += [f"{quote}={quote}" for quote in quotes]
+        source = "\n".join([f"def {name}({', '.join(parameters)}):"] + body)
+
+        namespace = dict(self.namespace, **quotes)
+        exec(compile(source, f"<forfait {name}>", "exec"), namespace)
+        function = namespace[name]
+        function.source = source
+        return function
+
+    def _fresh(self, prefix: str) -> str:
+        self._counter += 1
+        return f"{prefix}{self._counter}"
+
+    def _emit(self, node: AstNode, user_words: FrozenSet[str], indent: int, loops: int) -> List[str]:
+        """
+        :return: the lines of source running `node`, indented by `indent` levels
+        """
+        funcs = node.funcs if isinstance(node, Sequence) else [node]
+        # no-ops are not compiled, and must not break runs of straight-line words
+        funcs = [f for f in funcs if not (isinstance(f, Funcall) and f.funcname in NO_OPS)]
+
+        lines = list()
+        i = 0
+        while i < len(funcs):
+            run = self._straight_line_run(funcs, i, user_words)
+            if len(run) >= 2:
+                lines += self._emit_run(run, indent)
+                i += len(run)
+                continue
+
+            inlined = self._emit_inlined(funcs, i, user_words, indent, loops)
+            if inlined is not None:
+                consumed, body = inlined
+                lines += body
+                i += consumed
+                continue
+
+            lines += self._emit_word(funcs[i], user_words, indent)
+            i += 1
+        return lines
+
+    def _emit_word(self, node: AstNode, user_words: FrozenSet[str], indent: int) -> List[str]:
+        pad = "    " * indent
+        if isinstance(node, Number):
+            return [f"{pad}push({node.n})"]
+        if isinstance(node, Boolean):
+            return [f"{pad}push({node.b})"]
+        if isinstance(node, Quote):
+            name = self._fresh("q")
+            self._quotes[name] = self._cached(node.body, user_words)
+            return [f"{pad}push({name})"]
+        if isinstance(node, Funcdef):
+            raise ZClosureError(f"Definition of {node.funcname} is not at the top level")
+        if isinstance(node, Funcall):
+            if node.funcname in user_words:
+                return [f"{pad}words[{node.funcname!r}]()"]
+            if node.funcname in BUILTINS:
+                return [pad + line for line in BUILTINS[node.funcname]]
+            raise ZClosureError(f"Builtin {node.funcname} is not supported by the closure compiler")
+        return self._emit(node, user_words, indent, 0)
+
+    ##################################################
+    # straight-line code
+
+    def _straight_line_run(self, funcs: List[Funcall], i: int, user_words: FrozenSet[str]) -> List[Funcall]:
+        j = i
+        while j < len(funcs) and (
+            isinstance(funcs[j], Number | Boolean) or
+            (not isinstance(funcs[j], Quote) and funcs[j].funcname in STRAIGHT_LINE and funcs[j].funcname not in user_words)
+        ):
+            j += 1
+        return funcs[i:j]
+
+    def _emit_run(self, run: List[Funcall], indent: int) -> List[str]:
+        pad = "    " * indent
+
+        inputs = [Register(t) for t in self._input_types(run)]
+        cfg, outputs = SSA_ification(Sequence(run), list(inputs))
+
+        # copies and constants are propagated, so only the results of operators get a variable
+        value: Dict[Register, str] = {r: f"r{r.i}" for r in inputs}
+        operands: Set[str] = set()
+        body = list()
+        for instr in cfg.instructions:
+            if isinstance(instr, SSA_Constant):
+                value[instr.r] = str(instr.const.n if isinstance(instr.const, Number) else instr.const.b)
+            elif isinstance(instr, SSA_Copy):
+                value[instr.r] = value[instr.src_reg]
+            elif isinstance(instr, SSA_Cast):
+                value[instr.new_reg] = value[instr.old_reg]
+            elif isinstance(instr, SSA_Binop):
+                # SSA_Binop takes its operands in the order they were pushed
+                operands |= {value[instr.op1], value[instr.op2]}
+                source = BINOPS[instr.func.funcname].format(top=value[instr.op2], second=value[instr.op1])
+                body.append(f"{pad}r{instr.r.i} = {source}")
+                value[instr.r] = f"r{instr.r.i}"
+
+        # the bottom of the stack which is left as it is, is neither loaded nor stored
+        kept = 0
+        while kept < min(len(inputs), len(outputs)) and outputs[kept] is inputs[kept]:
+            kept += 1
+        referenced = operands | {value[r] for r in outputs[kept:]}
+        kept = next((k for k, r in enumerate(inputs[:kept]) if value[r] in referenced), kept)
+        loaded = [value[r] for r in inputs[kept:]]
+        stored = [value[r] for r in outputs[kept:]]
+
+        lines = list()
+        if referenced.intersection(loaded):
+            lines.append(f"{pad}{', '.join(loaded)} = " + ("stack[-1]" if len(loaded) == 1 else f"stack[-{len(loaded)}:]"))
+        lines += body
+
+        if len(loaded) == 0:
+            if len(stored) == 1:
+                lines.append(f"{pad}push({stored[0]})")
+            elif len(stored) > 1:
+                lines.append(f"{pad}stack.extend(({', '.join(stored)}))")
+        elif len(stored) == 0:
+            lines.append(f"{pad}del stack[-{len(loaded)}:]")
+        elif len(loaded) == 1 and len(stored) == 1:
+            lines.append(f"{pad}stack[-1] = {stored[0]}")
+        else:
+            lines.append(f"{pad}stack[-{len(loaded)}:] = {', '.join(stored)},")
+        return lines
+
+    @staticmethod
+    def _input_types(run: List[Funcall]) -> List[ZType]:
+        """
+        :return: the types of the values that `run` takes from the stack, from the deepest one
+        """
+        types, height = list(), 0
+        for word in run:
+            if height < word.arity_in:
+                types = list(word.type.left.types[:word.arity_in - height]) + types
+                height = word.arity_in
+            height += word.arity_out - word.arity_in
+        return types
+
+    ##################################################
+    # inlined quotations
+
+    def _emit_inlined(self, funcs: List[Funcall], i: int, user_words: FrozenSet[str],
+                      indent: int, loops: int) -> Optional[Tuple[int, List[str]]]:
+        """
+        Inlines the quotations starting at position `i`, if they are immediately consumed.
+        :return: the number of nodes consumed and their source, or None
+        """
+        def is_builtin(j: int, funcname: str) -> bool:
+            return j < len(funcs) and not isinstance(funcs[j], Quote) and \
+                   funcs[j].funcname == funcname and funcname not in user_words
+
+        def is_quote(j: int) -> bool:
+            return j < len(funcs) and isinstance(funcs[j], Quote)
+
+        pad = "    " * indent
+        if not is_quote(i):
+            return None
+
+        if is_builtin(i + 1, "eval"):
+            return 2, self._emit(funcs[i].body, user_words, indent, loops)
+
+        if is_quote(i + 1) and is_builtin(i + 2, "if"):
+            then_ = self._emit(funcs[i].body, user_words, indent + 1, loops) or [f"{pad}    pass"]
+            else_ = self._emit(funcs[i + 1].body, user_words, indent + 1, loops) or [f"{pad}    pass"]
+            return 3, [f"{pad}if pop():"] + then_ + [f"{pad}else:"] + else_
+
+        if loops >= MAX_INLINED_LOOPS:
+            return None
+
+        if is_quote(i + 1) and is_builtin(i + 2, "while"):
+            cond = self._emit(funcs[i].body, user_words, indent + 1, loops + 1)
+            body = self._emit(funcs[i + 1].body, user_words, indent + 1, loops + 1)
+            return 3, [f"{pad}while True:"] + cond + [f"{pad}    if not pop():", f"{pad}        break"] + body
+
+        if is_builtin(i + 1, "indexed-iter"):
+            index, start, end = self._fresh("i"), self._fresh("start"), self._fresh("end")
+            body = self._emit(funcs[i].body, user_words, indent + 1, loops + 1)
+            return 2, [
+                f"{pad}{end}, {start} = pop(), pop()",
+                f"{pad}for {index} in range({start}, {end}):",
+                f"{pad}    push({index} % 256)",
+            ] + body
+
+        return None
@@ -1,6 +1,12 @@
 import traceback
+from functools import partial
+from operator import length_hint
+from typing import *
 
 from forfait.astnodes import AstNode, Quote, Number, Funcall, Funcdef, Sequence, Boolean
+from forfait.cache import ModuleCache
+from forfait.interpreter.vectorize import vectorize, np
+from forfait.modules import ModuleGraph, qualified
 from forfait.optimizer import Optimizer, stdlib_peeps
 from forfait.parser.firstphase import FirstPhase
 from forfait.parser.parser_exceptions import ZUnknownFunction
@@ -8,43 +14,152 @@ from forfait.stdlibs.basic_stdlib import STDLIB
 from forfait.ztypes.context import Context
 
 class Interpreter:
-    def __init__(self, ctx: Context, verbose=True):
+    def __init__(self, ctx: Context, verbose=True, vectorized=True, cache: Optional[ModuleCache]=None):
         self.ctx = ctx
-        self.optimizer = Optimizer(self.ctx, stdlib_peeps)
+        self.optimizer = Optimizer(self.ctx, stdlib_peeps, redefinable=True)
 
         self.verbose = verbose
+        self.cache = cache  # of the typed ASTs of the evaluated code, if any
+
+        # indexed-iter loops which are pure arithmetic run with NumPy, if it is installed
+        self.vectorized = vectorized and np is not None
+        self.vectorized_loops = dict()  # quote body ~~> VectorizedLoop, or None
 
         self.memory = dict()
         self.dictionary = dict()
         self.stack = list()
+        self.modules = set()  # names of the modules run so far
 
     def clear(self):
         self.ctx.clear_generic_subs()
         self.memory = dict()
         self.dictionary = dict()
         self.stack = list()
+        self.modules = set()
+        self.vectorized_loops = dict()
 
     def eval(self, s: str):
-        for node in self.optimizer.optimize(FirstPhase(self.ctx, verbose=True).parse_and_typecheck(s)):
+        if self.cache is not None:
+            nodes = self.cache.parse_and_typecheck(self.ctx, s, verbose=self.verbose)
+        else:
+            nodes = FirstPhase(self.ctx, verbose=self.verbose).parse_and_typecheck(s)
+        for node in self.optimizer.optimize(nodes):
             self.eval_astnode(node)
 
+    def eval_module(self, modules: ModuleGraph, name: str):
+        """
+        Runs the module `name` after the modules it imports (each one once), and adds the words
+        it exports to the context.
+
+        The words of each module are defined with their qualified names (see
+        `ModuleGraph.linked`), so that two modules may define words with the same name; the
+        words exported by `name` are then defined with their own names too.
+        """
+        for module in modules.program(name):
+            if module.name not in self.modules:
+                self.modules.add(module.name)
+                for funcname, t in module.exports.items():
+                    self.ctx.add_userfunction_type(qualified(module.name, funcname), t)
+                for node in self.optimizer.optimize(modules.linked(module.name)):
+                    self.eval_astnode(node)
+        for funcname, t in modules.load(name).exports.items():
+            self.ctx.add_userfunction_type(funcname, t)
+            self.optimizer.forget(funcname)
+            self.eval_constant(Funcdef(funcname, self.dictionary[qualified(name, funcname)]))
+
     def eval_astnode(self, node: AstNode):
-        if isinstance(node, Sequence):
-            for x in node.funcs:
-                self.eval_astnode(x)
-        elif isinstance(node, Number):
+        """
+        Runs `node` without recursing in Python for each call: the return stack holds an
+        iterator on the nodes of each body being run, and a call pushes the body it runs.
+
+        A call in tail position (the last node of a body, e.g. a recursive call, or `if` and
+        `eval` running a quotation) first pops the exhausted frame of its caller, so tail
+        recursion runs in constant space. Loops are frames too: generators yielding the body
+        of the quotation to run at each step.
+        """
+        rstack = self._return_stack(node)
+        while len(rstack) > 0:
+            frame = rstack[-1]
+            for x in frame:
+                if type(x) is not Funcall:
+                    if isinstance(x, Sequence):
+                        # the body of a quotation run by a loop, or a nested sequence
+                        rstack.append(iter(x.funcs))
+                        break
+                    self.eval_constant(x)
+                    continue
+
+                funcname = x.funcname
+                if funcname in self.dictionary:
+                    body = self.dictionary[funcname]
+                elif funcname == "eval":
+                    body = self.stack.pop().args[0]
+                elif funcname == "if":
+                    else_, then_, cond = self.stack.pop(), self.stack.pop(), self.stack.pop()
+                    body = (then_ if cond else else_).args[0]
+                elif funcname == "while":
+                    iter_func, cond_func = self.stack.pop(), self.stack.pop()
+                    body = self._while(cond_func.args[0], iter_func.args[0])
+                elif funcname == "indexed-iter":
+                    quoted_foo = self.stack.pop()  # partial(self.eval_astnode, body)
+                    end, start = self.stack.pop(), self.stack.pop()
+                    if self.vectorized and self.eval_vectorized(quoted_foo.args[0], start, end):
+                        continue
+                    body = self._indexed_iter(quoted_foo.args[0], start, end)
+                else:
+                    self.eval_builtin(funcname)
+                    continue
+
+                if length_hint(frame) == 0:
+                    rstack.pop()  # tail call
+                if isinstance(body, Sequence):
+                    rstack.append(iter(body.funcs))
+                elif isinstance(body, AstNode):
+                    rstack.append(iter([body]))
+                else:
+                    rstack.append(body)
+                break
+            else:
+                rstack.pop()
+
+    def eval_constant(self, node: AstNode):
+        """
+        Runs the nodes which are not calls: constants, quotations and definitions.
+        """
+        if isinstance(node, Number):
             self.stack.append(node.n)
         elif isinstance(node, Boolean):
             self.stack.append(node.b)
         elif isinstance(node, Quote):
-            self.stack.append(lambda: self.eval_astnode(node.body))
+            self.stack.append(partial(self.eval_astnode, node.body))
         elif isinstance(node, Funcdef):
             self.dictionary[node.funcname] = node.funcbody
-        elif isinstance(node, Funcall):
-            if node.funcname in self.dictionary:
-                self.eval_astnode(self.dictionary[node.funcname])
-            else:
-                self.eval_builtin(node.funcname)
+            self.vectorized_loops.clear()
+
+    def _return_stack(self, node: AstNode) -> List[Iterator[AstNode]]:
+        """
+        :return: the return stack running `node`, with its frame
+        """
+        return [iter(node.funcs if isinstance(node, Sequence) else [node])]
+
+    def _while(self, cond: AstNode, body: AstNode) -> Iterator[AstNode]:
+        cond, body = self._as_sequence(cond), self._as_sequence(body)
+        while True:
+            yield cond
+            if not self.stack.pop():
+                return
+            yield body
+
+    def _indexed_iter(self, body: AstNode, start: int, end: int) -> Iterator[AstNode]:
+        body = self._as_sequence(body)
+        for i in range(start, end):
+            self.stack.append(i % 256)
+            yield body
+
+    @staticmethod
+    def _as_sequence(node: AstNode) -> Sequence:
+        # loop frames only yield sequences, which are never run as tail calls
+        return node if isinstance(node, Sequence) else Sequence([node])
 
     def eval_builtin(self, s: str):
         match s:
@@ -74,21 +189,6 @@ class Interpreter:
                 self.stack.append((self.stack.pop() + 1) % 256)
             case "--u8":
                 self.stack.append((self.stack.pop() - 1) % 256)
-            case "if": # TODO
-                pass
-                # else_, then_, cond = self.stack.pop(), self.stack.pop(), self.stack.pop()
-                # if self.stack.pop():
-                #     self.stack.pop()
-                # else:
-                #     temp = self.stack.pop()
-                #     self.stack.pop()
-                #     self.stack.append(temp)
-            case "indexed-iter":
-                quoted_foo = self.stack.pop()  # è una lambda
-                end, start = self.stack.pop(), self.stack.pop()
-                for i in range(start, end):
-                    self.stack.append(i % 256)
-                    quoted_foo()
             case "+u8":
                 self.stack.append(((self.stack.pop() % 256) + (self.stack.pop() % 256)) % 256)
             case "-u8":
@@ -97,6 +197,18 @@ class Interpreter:
                 self.stack.append(((self.stack.pop() % 256) * (self.stack.pop() % 256)) % 256)
             case "/u8":
                 self.stack.append(((self.stack.pop() % 256) // (self.stack.pop() % 256)) % 256)
+            case "++u16":
+                self.stack.append((self.stack.pop() + 1) % 65536)
+            case "--u16":
+                self.stack.append((self.stack.pop() - 1) % 65536)
+            case "+u16":
+                self.stack.append(((self.stack.pop() % 65536) + (self.stack.pop() % 65536)) % 65536)
+            case "-u16":
+                self.stack.append(((self.stack.pop() % 65536) - (self.stack.pop() % 65536)) % 65536)
+            case "*u16":
+                self.stack.append(((self.stack.pop() % 65536) * (self.stack.pop() % 65536)) % 65536)
+            case "/u16":
+                self.stack.append(((self.stack.pop() % 65536) // (self.stack.pop() % 65536)) % 65536)
             case ">u8":
                 self.stack.append(((self.stack.pop() % 256) < (self.stack.pop() % 256)))
             case "<u8":
@@ -109,14 +221,6 @@ class Interpreter:
                 self.stack.append(((self.stack.pop() % 256) == (self.stack.pop() % 256)))
             case "!=u8":
                 self.stack.append(((self.stack.pop() % 256) != (self.stack.pop() % 256)))
-            case "while":
-                iter_func, cond_func = self.stack.pop(), self.stack.pop()
-                while True:
-                    cond_func()
-                    if self.stack.pop():
-                        iter_func()
-                    else:
-                        break
             case "u16":
                 pass
             case "store-at":
@@ -124,13 +228,23 @@ class Interpreter:
                 obj = self.stack.pop()
                 assert isinstance(obj, int) and 0 <= obj <= 256
                 self.memory[address] = obj
-            case "eval":
-                self.stack.pop()()
+            case "retrieve-from":
+                self.stack.append(self.memory.get(self.stack.pop(), 0))
             case "__clear":
                 self.clear()
             case ":s":
                 print(self.stack)
 
+    def eval_vectorized(self, body: AstNode, start: int, end: int) -> bool:
+        """
+        Runs an indexed-iter loop at once, if its body is pure arithmetic.
+        :return: False if the loop has to be run one iteration at a time
+        """
+        if body not in self.vectorized_loops:
+            self.vectorized_loops[body] = vectorize(body, self.dictionary)
+        loop = self.vectorized_loops[body]
+        return loop is not None and loop.run(self.memory, start, end)
+
 
 if __name__ == "__main__":
     import logging
@@ -139,6 +253,7 @@ if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
 
     I = Interpreter(STDLIB)
+    modules = ModuleGraph(paths=["."])
     while True:
         s = input(">>> ")
         if s.strip() == "":
@@ -150,6 +265,10 @@ if __name__ == "__main__":
                 I.eval(f.read())
             continue
 
+        if len(s.strip().split(" ")) == 2 and s.strip().split(" ")[0] == "import":
+            I.eval_module(modules, s.strip().split(" ")[1])
+            continue
+
         if s == ":t":
             for funcname, functype in I.ctx.builtin_types.items():
                 print(f"{funcname} :: {functype}")
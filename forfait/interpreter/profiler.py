@@ -0,0 +1,339 @@
+from collections import defaultdict
+from functools import partial
+from operator import length_hint
+from time import perf_counter_ns
+from typing import *
+
+from forfait.astnodes import AstNode, Quote, Funcdef, Sequence, Funcall
+from forfait.cache import ModuleCache
+from forfait.interpreter.interpreter import Interpreter
+from forfait.optimizer import Optimizer, stdlib_peeps
+from forfait.ztypes.context import Context
+
+
+# label of the frames running the top-level nodes of a program, and nested sequences
+TOPLEVEL = "<toplevel>"
+SEQUENCE = "<sequence>"
+
+
+class _Node:
+    """
+    A call stack in the call tree of the profiled program: its calls, and the time spent in
+    them, in ns.
+    """
+    __slots__ = ("label", "count", "time", "children", "runs")
+
+    def __init__(self, label: str):
+        self.label = label
+        self.count = 0
+        self.time  = 0
+        self.children: Dict[str, _Node] = dict()
+        # body ~~> number of times it was run by the call stack, whose builtins are not counted yet
+        self.runs: Dict[AstNode, int] = dict()
+
+    def child(self, label: str) -> "_Node":
+        if label not in self.children:
+            self.children[label] = _Node(label)
+        return self.children[label]
+
+    def self_time(self) -> int:
+        return self.time - sum(child.time for child in self.children.values())
+
+
+class Profiler:
+    """
+    Counts the executions of each word, and measures its self and cumulative time, in ns.
+
+    A word is a builtin, a user-defined word, a quotation (labelled by the position of its `[|`
+    in the source) or a loop. While running, only the number of calls and the total time of
+    each call stack are recorded, in a call tree; everything else is computed when reporting.
+    The cumulative time of a recursive word is only counted by its outermost call.
+    """
+    def __init__(self):
+        self.root = _Node("")
+        self.frames: List[Tuple[_Node, int]] = [(self.root, 0)]  # call stack, with start times
+
+    def clear(self):
+        self.__init__()
+
+    def enter(self, label: str):
+        node = self.frames[-1][0].child(label)
+        node.count += 1
+        self.frames.append((node, perf_counter_ns()))
+
+    def exit(self):
+        node, start = self.frames.pop()
+        node.time += perf_counter_ns() - start
+
+    def depth(self) -> int:
+        return len(self.frames)
+
+    def builtin(self, funcname: str, time: int):
+        node = self.frames[-1][0].child(funcname)
+        node.count += 1
+        node.time += time
+
+    def builtins(self, counts: Iterable[Tuple[str, int]]):
+        """
+        Counts calls of builtins, without timing them: their time is the self time of their caller.
+        """
+        children = self.frames[-1][0].children
+        for funcname, count in counts:
+            node = children.get(funcname)
+            if node is None:
+                node = children[funcname] = _Node(funcname)
+            node.count += count
+
+    def stats(self) -> Dict[str, Tuple[int, int, int]]:
+        """
+        :return: label ~~> (count, self time, cumulative time)
+        """
+        stats: Dict[str, List[int]] = defaultdict(lambda: [0, 0, 0])
+
+        def visit(node: _Node, ancestors: Set[str]):
+            stat = stats[node.label]
+            stat[0] += node.count
+            stat[1] += node.self_time()
+            if node.label not in ancestors:
+                stat[2] += node.time
+            for child in node.children.values():
+                visit(child, ancestors | {node.label})
+
+        for child in self.root.children.values():
+            visit(child, set())
+        return {label: tuple(stat) for label, stat in stats.items()}
+
+    ##################################################
+
+    def table(self, sort_by: str="self", limit: Optional[int]=None) -> str:
+        """
+        :param sort_by: "self", "cumulative" or "count"
+        :return: the words, the hottest first, with their counts and times in ms
+        """
+        stats = self.stats()
+        column = {"count": 0, "self": 1, "cumulative": 2}[sort_by]
+        total = max(sum(self_time for _, self_time, _ in stats.values()), 1)
+
+        lines = [f"{'word':<24} {'count':>10} {'self (ms)':>10} {'self %':>7} {'cumul. (ms)':>12}"]
+        for label in sorted(stats, key=lambda label: stats[label][column], reverse=True)[:limit]:
+            count, self_time, cumulative = stats[label]
+            lines.append(
+                f"{label:<24} {count:>10} {self_time / 1e6:>10.3f} "
+                f"{100 * self_time / total:>6.1f}% {cumulative / 1e6:>12.3f}"
+            )
+        return "\n".join(lines)
+
+    def collapsed(self, weight: str="time") -> str:
+        """
+        :param weight: "time" or "count"
+        :return: the call stacks in the collapsed format of flamegraph tools: one line per call
+        stack, with the labels separated by `;` and followed by its self time in ns, or by its
+        number of calls. Every call stack is written, whatever its weight
+        """
+        lines = list()
+
+        def visit(node: _Node, stack: str):
+            lines.append(f"{stack} {node.self_time() if weight == 'time' else node.count}")
+            for label, child in sorted(node.children.items()):
+                visit(child, f"{stack};{label}")
+
+        for label, child in sorted(self.root.children.items()):
+            visit(child, label)
+        return "\n".join(lines)
+
+    def write_collapsed(self, filename: str, weight: str="time"):
+        with open(filename, "w") as f:
+            f.write(self.collapsed(weight) + "\n")
+
+##################################################
+
+# words running a quotation, which the profiler doesn't count as builtins
+CONTROL: Set[str] = {"eval", "if", "while", "indexed-iter"}
+
+
+class ProfilingInterpreter(Interpreter):
+    """
+    An `Interpreter` which profiles the programs it runs, see `Profiler`; `Interpreter` itself
+    does not pay any cost for it, since the profiler runs its own copy of the main loop.
+
+    Each frame of the return stack is labelled where it is pushed: by the user-defined word it
+    runs, the quotation (by the position of its `[|`) or the loop. `if` and `eval` are not words
+    of their own: their time is the time of the quotation they run.
+
+    :param time_builtins: whether each call of a builtin is timed. Otherwise the clock is only read
+    when a frame is entered or exited, and a frame only records which body it has run: the calls
+    of the builtins are counted from the bodies at the end of each top-level node. Their time is
+    the self time of their caller, and they cost as much as in `Interpreter`
+    """
+    def __init__(self, ctx: Context, verbose=True, vectorized=True, cache: Optional[ModuleCache]=None,
+                 time_builtins=True):
+        super().__init__(ctx, verbose, vectorized, cache)
+        # inlined words wouldn't be in the profile
+        self.optimizer = Optimizer(self.ctx, stdlib_peeps, inline=False, redefinable=True)
+        self.profiler = Profiler()
+        self.time_builtins = time_builtins
+
+        self.bodies: Dict[AstNode, Sequence] = dict()  # body of a quotation or word ~~> as a sequence
+        self.labels: Dict[Sequence, str] = dict()      # those sequences ~~> their labels
+        self.pending: List[_Node] = list()             # the nodes of the call tree with runs
+
+    def clear(self):
+        super().clear()
+        self.bodies = dict()
+        self.labels = dict()
+
+    def eval_astnode(self, node: AstNode):
+        """
+        `Interpreter.eval_astnode`, where the profiler enters each frame which is pushed on the
+        return stack, and exits it when it is popped (`Profiler.enter` and `exit`, inlined).
+        """
+        frames, dictionary, stack, labels = self.profiler.frames, self.dictionary, self.stack, self.labels
+        eval_builtin, timed, pending = self.eval_builtin, self.time_builtins, self.pending
+
+        depth = len(frames)
+        rstack = self._return_stack(node)
+        bodies: List[Optional[AstNode]] = [node if isinstance(node, Sequence) else Sequence([node])]
+        self.profiler.enter(TOPLEVEL)
+        try:
+            while len(rstack) > 0:
+                frame = rstack[-1]
+                for x in frame:
+                    if type(x) is not Funcall:
+                        if isinstance(x, Sequence):
+                            # the body of a quotation run by a loop, or a nested sequence
+                            body, label = x, labels.get(x, SEQUENCE)
+                        else:
+                            self.eval_constant(x)
+                            continue
+                    else:
+                        funcname = x.funcname
+                        if funcname in dictionary:
+                            body, label = dictionary[funcname], funcname
+                        elif funcname == "eval":
+                            body = stack.pop().args[0]
+                            label = labels.get(body, SEQUENCE)
+                        elif funcname == "if":
+                            else_, then_, cond = stack.pop(), stack.pop(), stack.pop()
+                            body = (then_ if cond else else_).args[0]
+                            label = labels.get(body, SEQUENCE)
+                        elif funcname == "while":
+                            iter_func, cond_func = stack.pop(), stack.pop()
+                            body, label = self._while(cond_func.args[0], iter_func.args[0]), "while"
+                        elif funcname == "indexed-iter":
+                            quoted_foo = stack.pop()
+                            end, start = stack.pop(), stack.pop()
+                            if self.vectorized and self.eval_vectorized(quoted_foo.args[0], start, end):
+                                continue
+                            body, label = self._indexed_iter(quoted_foo.args[0], start, end), "indexed-iter"
+                        elif timed:
+                            start = perf_counter_ns()
+                            eval_builtin(funcname)
+                            time = perf_counter_ns() - start
+
+                            # Profiler.builtin, inlined
+                            children = frames[-1][0].children
+                            child = children.get(funcname)
+                            if child is None:
+                                child = children[funcname] = _Node(funcname)
+                            child.count += 1
+                            child.time += time
+                            continue
+                        else:
+                            eval_builtin(funcname)
+                            continue
+
+                        if length_hint(frame) == 0:
+                            # tail call
+                            rstack.pop()
+                            caller, start = frames.pop()
+                            caller.time += perf_counter_ns() - start
+                            ran = bodies.pop()
+                            if ran is not None and not timed:
+                                if len(caller.runs) == 0:
+                                    pending.append(caller)
+                                caller.runs[ran] = caller.runs.get(ran, 0) + 1
+
+                    if isinstance(body, Sequence):
+                        rstack.append(iter(body.funcs))
+                        bodies.append(body)
+                    elif isinstance(body, AstNode):
+                        rstack.append(iter([body]))
+                        bodies.append(self._body(body))
+                    else:
+                        rstack.append(body)
+                        bodies.append(None)
+                    children = frames[-1][0].children
+                    child = children.get(label)
+                    if child is None:
+                        child = children[label] = _Node(label)
+                    child.count += 1
+                    frames.append((child, perf_counter_ns()))
+                    break
+                else:
+                    rstack.pop()
+                    callee, start = frames.pop()
+                    callee.time += perf_counter_ns() - start
+                    ran = bodies.pop()
+                    if ran is not None and not timed:
+                        if len(callee.runs) == 0:
+                            pending.append(callee)
+                        callee.runs[ran] = callee.runs.get(ran, 0) + 1
+        finally:
+            # the frames left by an error, whose last node is the one which failed
+            while len(rstack) > 0:
+                frame, ran = rstack.pop(), bodies.pop()
+                if ran is not None and not timed:
+                    self.profiler.builtins(self._builtins(ran.funcs[:len(ran.funcs) - length_hint(frame) - 1]).items())
+                self.profiler.exit()
+            while len(frames) > depth:
+                self.profiler.exit()
+            self.count_builtins()
+
+    def count_builtins(self):
+        """
+        Counts the calls of the builtins in the bodies run since the last time, as they are now:
+        it is done before a word is defined, since its calls are not builtins anymore.
+        """
+        counts: Dict[AstNode, Dict[str, int]] = dict()
+        for node in self.pending:
+            for body, runs in node.runs.items():
+                if body not in counts:
+                    counts[body] = self._builtins(body.funcs)
+                for funcname, count in counts[body].items():
+                    node.child(funcname).count += runs * count
+            node.runs.clear()
+        self.pending.clear()
+
+    def _builtins(self, funcs: List[AstNode]) -> Dict[str, int]:
+        """
+        :return: the number of calls of each builtin in `funcs`
+        """
+        counts: Dict[str, int] = defaultdict(int)
+        for x in funcs:
+            if type(x) is Funcall and x.funcname not in self.dictionary and x.funcname not in CONTROL:
+                counts[x.funcname] += 1
+        return counts
+
+    def eval_constant(self, node: AstNode):
+        if isinstance(node, Quote):
+            body = self._body(node.body)
+            self.labels[body] = f"quote@{node.position}" if node.position is not None else f"[| {node.body} |]"
+            self.stack.append(partial(self.eval_astnode, body))
+        elif isinstance(node, Funcdef):
+            self.count_builtins()
+            body = self._body(node.funcbody)
+            self.labels[body] = node.funcname
+            super().eval_constant(Funcdef(node.funcname, body))
+        else:
+            super().eval_constant(node)
+
+    def _body(self, body: AstNode) -> Sequence:
+        """
+        :return: `body` as a sequence, which is the same at each call, so that the frames running
+        it can be labelled
+        """
+        if isinstance(body, Sequence):
+            return body
+        if body not in self.bodies:
+            self.bodies[body] = Sequence([body])
+        return self.bodies[body]
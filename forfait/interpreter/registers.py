@@ -0,0 +1,209 @@
+import copy
+from typing import *
+
+from forfait.astnodes import AstNode, Quote, Number, Funcall, Funcdef, Sequence, Boolean
+from forfait.my_exceptions import ZException
+from forfait.optimizer import Optimizer, stdlib_peeps
+from forfait.parser.firstphase import FirstPhase
+from forfait.stdlibs.basic_semantics import OPERATIONS
+from forfait.ssa.ssa import CFG, Register, RegisterQuote, SSA_Constant, SSA_Copy, SSA_Cast, SSA_Binop, \
+    SSA_Unop, SSA_Jump_Cond, SSA_Jump_Uncond, SSA_ification, constant_propagation
+from forfait.ztypes.context import Context
+
+
+class ZRegisterError(ZException):
+    pass
+
+##################################################
+
+def _unary(apply: Callable[[Any], Any]) -> Callable[[Any, Any], Any]:
+    return lambda top, _: apply(top)
+
+# operators, applied to (top, second) as in `Interpreter`; the unary ones ignore the second
+OPERATORS: Dict[str, Callable[[Any, Any], Any]] = {
+    funcname: operation.apply if operation.arity == 2 else _unary(operation.apply)
+    for funcname, operation in OPERATIONS.items()
+}
+
+# a block instruction: registers[dst] = operator(registers[a], registers[b]), or a copy if operator is None
+Instruction = Tuple[Optional[Callable[[Any, Any], Any]], int, int, int]
+
+
+class RegisterProgram:
+    """
+    A CFG loaded on a flat register file: each register is an index in a list of values, and
+    each block is a list of instructions on those indices.
+
+    Since the registers are assigned once, the constants are stored in the register file when
+    it is created, and only copies and operators are run. The Phi of a block are resolved when
+    the block is entered, by copying the register of the block it is entered from.
+    """
+    def __init__(self, start_cfg: CFG, inputs: List[Register], outputs: List[Register]):
+        self.index: Dict[Register, int] = dict()
+        self.size = 0
+        self.constants: List[Tuple[int, Any]] = list()
+
+        self.cfgs: List[CFG] = list(start_cfg.graph_visit())
+        number = {cfg: i for i, cfg in enumerate(self.cfgs)}
+
+        self.inputs:  List[int] = [self._register(r) for r in inputs]
+        self.blocks:  List[List[Instruction]] = list()
+        # (test register, block if true, block if false); the block if true is the only one for an
+        # unconditional jump, and the last block has none
+        self.jumps:   List[Optional[Tuple[int, int, int]]] = list()
+        # (block entered from, block) ~~> copies resolving its Phi
+        self.entries: Dict[Tuple[int, int], List[Tuple[int, int]]] = dict()
+
+        for i, cfg in enumerate(self.cfgs):
+            block, jump = list(), None
+            for instr in cfg.instructions:
+                if isinstance(instr, SSA_Constant):
+                    self.constants.append((self._register(instr.r), self._value(instr.const)))
+                elif isinstance(instr, SSA_Copy):
+                    block.append((None, self._register(instr.r), self._register(instr.src_reg), 0))
+                elif isinstance(instr, SSA_Cast):
+                    block.append((None, self._register(instr.new_reg), self._register(instr.old_reg), 0))
+                elif isinstance(instr, SSA_Binop):
+                    # SSA_Binop takes its operands in the order they were pushed
+                    block.append((OPERATORS[instr.func.funcname], self._register(instr.r),
+                                  self._operand(instr.op2), self._operand(instr.op1)))
+                elif isinstance(instr, SSA_Unop):
+                    operand = self._operand(instr.op)
+                    block.append((OPERATORS[instr.func.funcname], self._register(instr.r), operand, operand))
+                elif isinstance(instr, SSA_Jump_Cond):
+                    jump = (self._register(instr.test_reg), number[instr.jump_to], number[instr.else_jump_to])
+                elif isinstance(instr, SSA_Jump_Uncond):
+                    jump = (-1, number[instr.jump_to], number[instr.jump_to])
+                else:
+                    raise ZRegisterError(f"Can't run SSA instruction {instr}")
+            self.blocks.append(block)
+            self.jumps.append(jump)
+
+            if len(cfg.phis) > 0:
+                then_exit, else_exit = cfg.entering_cfgs
+                self.entries[number[then_exit], i] = [(self._register(phi), self._register(phi.r1)) for phi in cfg.phis]
+                self.entries[number[else_exit], i] = [(self._register(phi), self._register(phi.r2)) for phi in cfg.phis]
+
+        self.output_registers: List[Register] = outputs
+        self.outputs: List[int] = [self._register(r) for r in outputs]
+
+    def _register(self, r: Register) -> int:
+        if r not in self.index:
+            self.index[r] = self._allocate()
+            if isinstance(r, RegisterQuote):
+                self.constants.append((self.index[r], r.quote))
+        return self.index[r]
+
+    def _operand(self, x: Register | Number | Boolean) -> int:
+        # constant propagation replaces registers with the constants they hold
+        if isinstance(x, Register):
+            return self._register(x)
+        i = self._allocate()
+        self.constants.append((i, self._value(x)))
+        return i
+
+    def _allocate(self) -> int:
+        self.size += 1
+        return self.size - 1
+
+    @staticmethod
+    def _value(const: Number | Boolean) -> int | bool:
+        return const.n if isinstance(const, Number) else const.b
+
+    def run(self, inputs: List[Any]) -> List[Any]:
+        """
+        :param inputs: the values of the input registers
+        :return: the values of the output registers
+        """
+        registers = [None] * self.size
+        for i, value in self.constants:
+            registers[i] = value
+        for i, value in zip(self.inputs, inputs):
+            registers[i] = value
+
+        blocks, jumps, entries = self.blocks, self.jumps, self.entries
+        current = 0
+        while True:
+            for operator, dst, a, b in blocks[current]:
+                registers[dst] = registers[a] if operator is None else operator(registers[a], registers[b])
+
+            jump = jumps[current]
+            if jump is None:
+                break
+            test, if_true, if_false = jump
+            previous, current = current, (if_true if test < 0 or registers[test] else if_false)
+            for dst, src in entries.get((previous, current), ()):
+                registers[dst] = registers[src]
+
+        return [registers[i] for i in self.outputs]
+
+##################################################
+
+class RegisterInterpreter:
+    """
+    Runs programs on their SSA form: each top-level sequence is transformed with `SSA_ification`
+    (and optionally `constant_propagation`), loaded as a `RegisterProgram`, and run.
+
+    User-defined words are expanded in place, and the stack is kept between sequences as the
+    registers of the final vstack and their values. Only the words supported by `SSA_ification`
+    can be run, e.g. there are no loops.
+    The semantics are the same as `Interpreter`'s.
+    """
+    def __init__(self, ctx: Context, verbose=False, propagate_constants=True):
+        self.ctx = ctx
+        self.optimizer = Optimizer(self.ctx, stdlib_peeps, redefinable=True)
+
+        self.verbose = verbose
+        self.propagate_constants = propagate_constants
+
+        self.stack: List[Any] = list()
+        self.vstack: List[Register] = list()
+        self.dictionary: Dict[str, AstNode] = dict()
+
+    def clear(self):
+        self.ctx.clear_generic_subs()
+        self.dictionary = dict()
+        self.stack = list()
+        self.vstack = list()
+
+    def eval(self, s: str):
+        for node in self.optimizer.optimize(FirstPhase(self.ctx, verbose=self.verbose).parse_and_typecheck(s)):
+            if isinstance(node, Funcdef):
+                self.dictionary[node.funcname] = node.funcbody
+            else:
+                self.execute(self.load(node))
+
+    def load(self, node: AstNode) -> RegisterProgram:
+        """
+        :return: the program running `node` on the current stack
+        """
+        inputs = list(self.vstack)
+        start_cfg, outputs = SSA_ification(self.expand(node), list(inputs))
+        if self.propagate_constants:
+            start_cfg = constant_propagation(start_cfg)
+        return RegisterProgram(start_cfg, inputs, outputs)
+
+    def execute(self, program: RegisterProgram):
+        self.stack = program.run(self.stack)
+        self.vstack = program.output_registers
+
+    def expand(self, node: AstNode, expanding: FrozenSet[str]=frozenset()) -> Sequence:
+        """
+        :param expanding: the user-defined words whose bodies contain `node`
+        :return: `node` as a sequence, where user-defined words are replaced by their bodies
+        """
+        funcs = list()
+        for f in (node.funcs if isinstance(node, Sequence) else [node]):
+            if isinstance(f, Quote):
+                quote = copy.copy(f)
+                quote.body = self.expand(f.body, expanding)
+                funcs.append(quote)
+            elif isinstance(f, Funcdef):
+                raise ZRegisterError(f"Definition of {f.funcname} is not at the top level")
+            elif isinstance(f, Funcall) and f.funcname in expanding:
+                raise ZRegisterError(f"Recursive word {f.funcname} can't be expanded")
+            elif isinstance(f, Funcall) and f.funcname in self.dictionary:
+                funcs += self.expand(self.dictionary[f.funcname], expanding | {f.funcname}).funcs
+            else:
+                funcs.append(f)
+        return Sequence(funcs)
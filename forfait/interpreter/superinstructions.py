@@ -0,0 +1,236 @@
+from collections import Counter
+from typing import *
+
+from forfait.astnodes import AstNode, Quote, Number, Funcall, Funcdef, Sequence
+from forfait.interpreter.vm import VM, OPNAMES, NO_OPS, ARITHMETIC, COMPARISONS
+
+
+Pattern = Tuple[str, ...]
+Factory = Callable[[list, dict], Callable[[int], None]]
+
+# in a pattern, matches a number literal; its value becomes the operand of the superinstruction
+LITERAL = "#"
+
+# pattern ~~> (declared stack effect, factory of the handler given the data stack and the memory)
+SUPERINSTRUCTIONS: Dict[Pattern, Tuple[Tuple[int, int], Factory]] = dict()
+
+
+def superinstruction(*pattern: str, effect: Tuple[int, int]):
+    def register(factory: Factory) -> Factory:
+        SUPERINSTRUCTIONS[pattern] = (effect, factory)
+        return factory
+    return register
+
+
+def stack_effect(words: Iterable[Funcall]) -> Tuple[int, int]:
+    """
+    Combined stack effect of a sequence of words, from their `arity_in`/`arity_out`.
+    :return: (number of values taken from the stack, number of values pushed in their place)
+    """
+    taken, height = 0, 0
+    for word in words:
+        if height < word.arity_in:
+            taken += word.arity_in - height
+            height = word.arity_in
+        height += word.arity_out - word.arity_in
+    return taken, height
+
+##################################################
+# hand-written superinstructions; each one has the same semantics as the VM running its words
+
+@superinstruction("swap", "drop", effect=(2, 1))
+def _nip(stack, _):
+    def f(_):
+        del stack[-2]
+    return f
+
+@superinstruction("drop", "drop", effect=(2, 0))
+def _drop2(stack, _):
+    def f(_):
+        del stack[-2:]
+    return f
+
+@superinstruction("over", "over", effect=(2, 4))
+def _dup2(stack, _):
+    def f(_):
+        stack.extend(stack[-2:])
+    return f
+
+@superinstruction("swap", "over", effect=(2, 3))
+def _tuck(stack, _):
+    def f(_):
+        stack[-1], stack[-2] = stack[-2], stack[-1]
+        stack.append(stack[-2])
+    return f
+
+@superinstruction("rot-", "dup", effect=(3, 4))
+def _rot_minus_dup(stack, _):
+    def f(_):
+        stack[-3], stack[-2], stack[-1] = stack[-2], stack[-1], stack[-3]
+        stack.append(stack[-1])
+    return f
+
+@superinstruction("--u8", "rot+", effect=(3, 3))
+def _dec_rot_plus(stack, _):
+    def f(_):
+        stack[-3], stack[-2], stack[-1] = (stack[-1] - 1) % 256, stack[-3], stack[-2]
+    return f
+
+@superinstruction("++u8", "rot+", effect=(3, 3))
+def _inc_rot_plus(stack, _):
+    def f(_):
+        stack[-3], stack[-2], stack[-1] = (stack[-1] + 1) % 256, stack[-3], stack[-2]
+    return f
+
+@superinstruction("dup", "store-at", effect=(1, 0))
+def _store_at_itself(stack, memory):
+    def f(_):
+        obj = stack.pop()
+        assert isinstance(obj, int) and 0 <= obj <= 256
+        memory[obj] = obj
+    return f
+
+
+def _arithmetic_family(funcname: str):
+    op, modulo = ARITHMETIC[funcname]
+
+    @superinstruction(LITERAL, funcname, effect=(1, 1))
+    def _literal_op(stack, _):
+        def f(k):
+            stack[-1] = op(k % modulo, stack[-1] % modulo) % modulo
+        return f
+
+    @superinstruction("dup", funcname, effect=(1, 1))
+    def _dup_op(stack, _):
+        def f(_):
+            x = stack[-1] % modulo
+            stack[-1] = op(x, x) % modulo
+        return f
+
+    @superinstruction("over", funcname, effect=(2, 2))
+    def _over_op(stack, _):
+        def f(_):
+            stack[-1] = op(stack[-2] % modulo, stack[-1] % modulo) % modulo
+        return f
+
+    @superinstruction("over", funcname, "swap", effect=(2, 2))
+    def _over_op_swap(stack, _):
+        def f(_):
+            a = stack[-2]
+            stack[-2], stack[-1] = op(a % modulo, stack[-1] % modulo) % modulo, a
+        return f
+
+def _comparison_family(funcname: str):
+    op = COMPARISONS[funcname]
+
+    @superinstruction(LITERAL, funcname, effect=(1, 1))
+    def _literal_cmp(stack, _):
+        def f(k):
+            stack[-1] = op(k % 256, stack[-1] % 256)
+        return f
+
+    @superinstruction("dup", LITERAL, funcname, effect=(1, 2))
+    def _dup_literal_cmp(stack, _):
+        def f(k):
+            stack.append(op(k % 256, stack[-1] % 256))
+        return f
+
+for _funcname in ARITHMETIC:
+    _arithmetic_family(_funcname)
+for _funcname in COMPARISONS:
+    _comparison_family(_funcname)
+
+SUPEROPCODES: Dict[Pattern, int] = {pattern: opcode for opcode, pattern in enumerate(SUPERINSTRUCTIONS, start=len(OPNAMES))}
+SUPERPATTERNS: List[Pattern] = list(SUPERINSTRUCTIONS)
+LONGEST_PATTERN: int = max(len(pattern) for pattern in SUPERINSTRUCTIONS)
+
+##################################################
+
+class SuperinstructionVM(VM):
+    """
+    A `VM` which fuses frequent n-grams of builtins into a single superinstruction, so that
+    each n-gram costs one dispatch instead of n.
+
+    Sequences are scanned left to right, replacing the longest n-gram with a superinstruction
+    at each position; an n-gram is fused only if the stack effect of its words (as given by
+    their `arity_in`/`arity_out`) is the one of the superinstruction.
+    """
+    def _dispatch_table(self) -> List[Callable[[int], None]]:
+        table = super()._dispatch_table()
+        for pattern, (_, factory) in SUPERINSTRUCTIONS.items():
+            table.append(factory(self.stack, self.memory))
+        return table
+
+    def _compile_node(self, node: AstNode, block: List[Tuple[int, int]]):
+        if not isinstance(node, Sequence):
+            return super()._compile_node(node, block)
+
+        # no-ops are not compiled, and must not break n-grams
+        funcs = [f for f in node.funcs if not (isinstance(f, Funcall) and f.funcname in NO_OPS)]
+        i = 0
+        while i < len(funcs):
+            fused = self._match(funcs, i)
+            if fused is None:
+                super()._compile_node(funcs[i], block)
+                i += 1
+            else:
+                pattern, operand = fused
+                block.append((SUPEROPCODES[pattern], operand))
+                i += len(pattern)
+
+    def _match(self, funcs: List[Funcall], i: int) -> Optional[Tuple[Pattern, int]]:
+        """
+        :return: the longest pattern matching the words from position `i`, and its operand
+        """
+        tokens = [self._token(f) for f in funcs[i:i + LONGEST_PATTERN]]
+        for n in range(len(tokens), 1, -1):
+            pattern = tuple(tokens[:n])
+            if pattern not in SUPERINSTRUCTIONS:
+                continue
+            effect, _ = SUPERINSTRUCTIONS[pattern]
+            if stack_effect(funcs[i:i + n]) != effect:
+                continue
+            literals = [f.n for f in funcs[i:i + n] if isinstance(f, Number)]
+            return pattern, (literals[0] if len(literals) > 0 else 0)
+        return None
+
+    def _token(self, node: AstNode) -> Optional[str]:
+        if isinstance(node, Number):
+            return LITERAL
+        if isinstance(node, Funcall) and not isinstance(node, Quote) and node.funcname not in self.words \
+                and node.funcname not in self.compiling:
+            return node.funcname
+        return None
+
+    def _opname(self, opcode: int) -> str:
+        if opcode < len(OPNAMES):
+            return super()._opname(opcode)
+        return f"[{' '.join(SUPERPATTERNS[opcode - len(OPNAMES)])}]"
+
+    def _has_operand(self, opcode: int) -> bool:
+        if opcode < len(OPNAMES):
+            return super()._has_operand(opcode)
+        return LITERAL in SUPERPATTERNS[opcode - len(OPNAMES)]
+
+
+def ngram_profile(nodes: List[AstNode], n: int) -> Counter:
+    """
+    Static count of the n-grams of words in the sequences of a program (in funcdefs and
+    quotations too); number literals are shown as LITERAL.
+    """
+    profile = Counter()
+
+    def visit(node: AstNode):
+        if isinstance(node, Funcdef):
+            visit(node.funcbody)
+        elif isinstance(node, Quote):
+            visit(node.body)
+        elif isinstance(node, Sequence):
+            tokens = [LITERAL if isinstance(f, Number) else (f.funcname or "[|...|]") for f in node.funcs]
+            profile.update(tuple(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+            for f in node.funcs:
+                visit(f)
+
+    for node in nodes:
+        visit(node)
+    return profile
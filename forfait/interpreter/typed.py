@@ -0,0 +1,173 @@
+from array import array
+from typing import *
+
+from forfait.astnodes import AstNode, Number, Boolean, Quote
+from forfait.interpreter.vm import VM, ZVMError, PUSH, PUSH_QUOTE, CALL, OPCODES, OPNAMES, ARITHMETIC, COMPARISONS
+from forfait.ztypes.ztypes import ZTBase
+
+
+STACK_SIZE  = 4096
+MEMORY_SIZE = 65536
+
+
+class TypedVM(VM):
+    """
+    A `VM` whose state has native-width values: the data stack is a preallocated `array('H')`
+    with a stack pointer, and the memory is the 64 KiB address space of the target, as a
+    `bytearray`.
+
+    Every value is a u8, a u16, a boolean (as 0 or 1) or a quotation; since quotations are
+    code offsets, they are u16 values on the data stack too. Number literals are reduced to
+    their type when they are compiled, so every value on the stack is already in range and
+    operators only reduce their result.
+    Reading an address which was never written gives 0.
+    """
+    def _allocate(self):
+        self.data = array("H", bytes(2 * STACK_SIZE))
+        self.memory = bytearray(MEMORY_SIZE)
+
+    @property
+    def stack(self) -> List[int]:
+        return self.data[:self._height()].tolist()
+
+    def clear(self):
+        self.ctx.clear_generic_subs()
+        self.memory[:] = bytes(MEMORY_SIZE)
+        self.words.clear()
+        self._reset()
+
+    def view(self, start: int=0, end: int=MEMORY_SIZE) -> memoryview:
+        """
+        :return: a read-only view of the memory from `start` to `end`, without copying it; the
+        view changes with the memory, use `bytes()` on it for a snapshot
+        """
+        return memoryview(self.memory)[start:end].toreadonly()
+
+    ##################################################
+    # compiler
+
+    def _compile_node(self, node: AstNode, block: List[Tuple[int, int]]):
+        if isinstance(node, Number):
+            block.append((PUSH, node.n % (65536 if node.type.right.types[-1] == ZTBase.U16 else 256)))
+        elif isinstance(node, Boolean):
+            block.append((PUSH, int(node.b)))
+        else:
+            super()._compile_node(node, block)
+
+    def _emit_block(self, block: List[Tuple[int, int]]) -> int:
+        offset = super()._emit_block(block)
+        if offset >= 65536:
+            raise ZVMError("The code does not fit in 64 KiB, quotations can't be pushed on the stack")
+        return offset
+
+    ##################################################
+    # virtual machine
+
+    def _dispatch_table(self) -> List[Callable[[int], None]]:
+        data, memory, execute = self.data, self.memory, self.execute
+        sp = 0   # number of values on the stack
+
+        def push(x):
+            nonlocal sp
+            data[sp] = x
+            sp += 1
+
+        def swap(_):
+            data[sp - 1], data[sp - 2] = data[sp - 2], data[sp - 1]
+        def drop(_):
+            nonlocal sp
+            sp -= 1
+        def dup(_):
+            nonlocal sp
+            data[sp] = data[sp - 1]
+            sp += 1
+        def over(_):
+            nonlocal sp
+            data[sp] = data[sp - 2]
+            sp += 1
+        def rot_minus(_):
+            data[sp - 3], data[sp - 2], data[sp - 1] = data[sp - 2], data[sp - 1], data[sp - 3]
+        def rot_plus(_):
+            data[sp - 3], data[sp - 2], data[sp - 1] = data[sp - 1], data[sp - 3], data[sp - 2]
+
+        def binary(funcname: str):
+            op, modulo = ARITHMETIC[funcname]
+            def f(_):
+                nonlocal sp
+                sp -= 1
+                data[sp - 1] = op(data[sp], data[sp - 1]) % modulo
+            return f
+        def comparison(funcname: str):
+            op = COMPARISONS[funcname]
+            def f(_):
+                nonlocal sp
+                sp -= 1
+                data[sp - 1] = op(data[sp], data[sp - 1])
+            return f
+        def increment(delta: int, modulo: int):
+            def f(_):
+                data[sp - 1] = (data[sp - 1] + delta) % modulo
+            return f
+
+        def if_(_):
+            nonlocal sp
+            sp -= 3
+            execute(data[sp + 1] if data[sp] else data[sp + 2])
+        def while_(_):
+            nonlocal sp
+            sp -= 2
+            cond, body = data[sp], data[sp + 1]
+            while True:
+                execute(cond)
+                sp -= 1
+                if not data[sp]:
+                    break
+                execute(body)
+        def indexed_iter(_):
+            nonlocal sp
+            sp -= 3
+            start, end, quote = data[sp], data[sp + 1], data[sp + 2]
+            for i in range(start, end):
+                data[sp] = i % 256
+                sp += 1
+                execute(quote)
+        def eval_(_):
+            nonlocal sp
+            sp -= 1
+            execute(data[sp])
+
+        def store_at(_):
+            nonlocal sp
+            sp -= 2
+            memory[data[sp + 1]] = data[sp]
+        def retrieve_from(_):
+            data[sp - 1] = memory[data[sp - 1]]
+        def clear(_):
+            self.clear()
+        def show(_):
+            print(self.stack)
+
+        def height() -> int:
+            return sp
+        def reset():
+            nonlocal sp
+            sp = 0
+        self._height, self._reset = height, reset
+
+        implementations: Dict[str, Callable[[int], None]] = {
+            "swap": swap, "drop": drop, "dup": dup, "over": over, "rot-": rot_minus, "rot+": rot_plus,
+            "++u8": increment(1, 256), "--u8": increment(-1, 256),
+            "++u16": increment(1, 65536), "--u16": increment(-1, 65536),
+            **{funcname: binary(funcname) for funcname in ARITHMETIC},
+            **{funcname: comparison(funcname) for funcname in COMPARISONS},
+            "if": if_, "while": while_, "indexed-iter": indexed_iter, "eval": eval_,
+            "store-at": store_at, "retrieve-from": retrieve_from, "__clear": clear, ":s": show,
+        }
+
+        table: List[Callable[[int], None]] = [None] * len(OPNAMES)
+        table[PUSH] = push
+        table[PUSH_QUOTE] = push
+        table[CALL] = execute
+        for funcname, opcode in OPCODES.items():
+            table[opcode] = implementations[funcname]
+        return table
@@ -0,0 +1,159 @@
+from typing import *
+
+from forfait.astnodes import AstNode, Number, Funcall, Sequence, Quote
+from forfait.interpreter.vm import ARITHMETIC
+
+try:
+    import numpy as np
+except ImportError:  # vectorized loops are an optional speedup
+    np = None
+
+
+# the value of an expression given the loop index; the index is either an int or an array of
+# indexes, and the value is of the same kind (or an int, for constant expressions)
+Expr = Callable[[Any], Any]
+
+# indexed-iter loops shorter than this are not worth vectorizing
+MIN_ITERATIONS = 32
+
+# nesting of user-defined words expanded in a loop body
+MAX_EXPANSION_DEPTH = 16
+
+
+class _NotVectorizable(Exception):
+    pass
+
+
+class VectorizedLoop:
+    """
+    The body of an `indexed-iter` loop which is a pure arithmetic function of the loop index,
+    whose only effect is a fixed number of `store-at` per iteration.
+
+    Each stored value and address is an expression of the index, evaluated on the whole range
+    at once with NumPy. Every operator reduces its operands and its result as `Interpreter`
+    does, on int64 intermediates, so the values are the same as the scalar path.
+    """
+    def __init__(self, stores: List[Tuple[Expr, Expr]]):
+        self.stores = stores  # (value, address) of each store-at, in order
+
+    def evaluate(self, index) -> List[Tuple[Any, Any]]:
+        """
+        :return: the (value, address) of each store-at, for an index or an array of indexes
+        """
+        return [(value(index), address(index)) for value, address in self.stores]
+
+    def run(self, memory: Dict[int, int], start: int, end: int) -> bool:
+        """
+        Runs the loop from `start` to `end` on `memory`.
+        :return: False, without any effect, if the loop must run on the scalar path instead
+        (e.g. because it raises an error there)
+        """
+        if np is None or end - start < MIN_ITERATIONS:
+            return False
+
+        index = np.arange(start, end, dtype=np.int64) % 256
+        try:
+            stores = self.evaluate(index)
+        except ZeroDivisionError:
+            return False
+        if len(stores) == 0:
+            return True
+
+        # interleaved as in the scalar path, so the last store to an address wins
+        values    = np.stack([np.broadcast_to(value, index.shape) for value, _ in stores], axis=1).ravel()
+        addresses = np.stack([np.broadcast_to(address, index.shape) for _, address in stores], axis=1).ravel()
+        if values.min() < 0 or values.max() > 256:
+            return False
+
+        memory.update(zip(addresses.tolist(), values.tolist()))
+        return True
+
+##################################################
+
+def vectorize(body: AstNode, dictionary: Dict[str, AstNode]) -> Optional[VectorizedLoop]:
+    """
+    :param body: the body of the quote run by `indexed-iter`
+    :param dictionary: the user-defined words, which are expanded in the body
+    :return: the vectorized loop, or None if the body does more than arithmetic and store-at on
+    the loop index
+    """
+    stack: List[Expr] = [_index]
+    stores: List[Tuple[Expr, Expr]] = list()
+
+    def run(node: AstNode, depth: int):
+        for f in (node.funcs if isinstance(node, Sequence) else [node]):
+            if isinstance(f, Number):
+                stack.append(_constant(f.n))
+            elif isinstance(f, Quote) or not isinstance(f, Funcall) or f.funcname is None:
+                raise _NotVectorizable()
+            elif f.funcname in dictionary:
+                if depth >= MAX_EXPANSION_DEPTH:
+                    raise _NotVectorizable()
+                run(dictionary[f.funcname], depth + 1)
+            elif f.funcname in _SHUFFLERS:
+                _SHUFFLERS[f.funcname](stack)
+            elif f.funcname in _OPERATORS:
+                top, second = stack.pop(), stack.pop()
+                stack.append(_binary(f.funcname, top, second))
+            elif f.funcname in _INCREMENTS:
+                stack.append(_increment(stack.pop(), *_INCREMENTS[f.funcname]))
+            elif f.funcname == "store-at":
+                address, value = stack.pop(), stack.pop()
+                stores.append((value, address))
+            elif f.funcname not in ("u16", "identity"):
+                raise _NotVectorizable()
+
+    try:
+        run(body, 0)
+    except (_NotVectorizable, IndexError):
+        # IndexError: the body uses the values below the loop index
+        return None
+    if len(stack) > 0:
+        return None
+    return VectorizedLoop(stores)
+
+
+def _index(i):
+    return i
+
+def _constant(n: int) -> Expr:
+    return lambda _: n
+
+def _binary(funcname: str, top: Expr, second: Expr) -> Expr:
+    op, modulo = ARITHMETIC[funcname]
+    if funcname.startswith("/"):
+        def divide(i):
+            divisor = second(i) % modulo
+            if (divisor == 0).any() if hasattr(divisor, "any") else divisor == 0:
+                raise ZeroDivisionError()
+            return op(top(i) % modulo, divisor) % modulo
+        return divide
+    return lambda i: op(top(i) % modulo, second(i) % modulo) % modulo
+
+def _increment(x: Expr, delta: int, modulo: int) -> Expr:
+    return lambda i: (x(i) + delta) % modulo
+
+# the arithmetic builtins implemented by `Interpreter`
+_OPERATORS: Set[str] = {"+u8", "-u8", "*u8", "/u8"}
+_INCREMENTS: Dict[str, Tuple[int, int]] = {"++u8": (1, 256), "--u8": (-1, 256)}
+
+def _swap(stack: List[Expr]):
+    top, second = stack.pop(), stack.pop()
+    stack.extend((top, second))
+
+def _over(stack: List[Expr]):
+    top, second = stack.pop(), stack.pop()
+    stack.extend((second, top, second))
+
+def _rot_minus(stack: List[Expr]):
+    top, snd, trd = stack.pop(), stack.pop(), stack.pop()
+    stack.extend((snd, top, trd))
+
+def _rot_plus(stack: List[Expr]):
+    top, snd, trd = stack.pop(), stack.pop(), stack.pop()
+    stack.extend((top, trd, snd))
+
+_SHUFFLERS: Dict[str, Callable[[List[Expr]], None]] = {
+    "swap": _swap, "drop": lambda stack: stack.pop(), "dup": lambda stack: stack.append(stack[-1]),
+    "over": _over, "rot-": _rot_minus, "rot+": _rot_plus,
+}
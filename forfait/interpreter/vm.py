@@ -0,0 +1,259 @@
+from typing import *
+
+from forfait.astnodes import AstNode, Quote, Number, Funcall, Funcdef, Sequence, Boolean
+from forfait.my_exceptions import ZException
+from forfait.optimizer import Optimizer, stdlib_peeps
+from forfait.parser.firstphase import FirstPhase
+from forfait.stdlibs.basic_semantics import ARITHMETIC, COMPARISONS, INCREMENTS
+from forfait.ztypes.context import Context
+
+
+class ZVMError(ZException):
+    pass
+
+##################################################
+
+# opcodes with an operand; the builtins follow, in the order of BUILTINS
+RET, PUSH, PUSH_QUOTE, CALL = range(4)
+
+BUILTINS: List[str] = [
+    "swap", "drop", "dup", "over", "rot-", "rot+",
+    "++u8", "--u8", "+u8", "-u8", "*u8", "/u8",
+    "++u16", "--u16", "+u16", "-u16", "*u16", "/u16",
+    ">u8", "<u8", ">=u8", "<=u8", "==u8", "!=u8",
+    "if", "while", "indexed-iter", "eval",
+    "store-at", "retrieve-from", "__clear", ":s",
+]
+OPCODES: Dict[str, int] = {funcname: opcode for opcode, funcname in enumerate(BUILTINS, start=CALL + 1)}
+
+# builtins which do nothing at runtime, and are not compiled at all
+NO_OPS: Set[str] = {"u16", "identity"}
+
+OPNAMES: List[str] = ["ret", "push", "push-quote", "call"] + BUILTINS
+
+
+class VM:
+    """
+    Compiles the typed (and optimized) AST to a flat bytecode, and runs it.
+
+    The bytecode is made of two parallel arrays: `code` holds the opcode of each instruction,
+    `args` its operand (a number, or the code offset of a quotation or user-defined word).
+    Every quotation and user-defined word is compiled once, as a block of code ending with
+    RET; at runtime, quotations are pushed on the stack as their code offset.
+
+    The main loop runs an instruction by indexing the dispatch table with its opcode, which
+    gives the function implementing it; the function takes the operand of the instruction.
+    The semantics are the same as `Interpreter`'s.
+    """
+    def __init__(self, ctx: Context, verbose=False):
+        self.ctx = ctx
+        self.optimizer = Optimizer(self.ctx, stdlib_peeps, redefinable=True)
+
+        self.verbose = verbose
+
+        self._allocate()
+
+        self.code: List[int] = list()
+        self.args: List[int] = list()
+        self.words: Dict[str, int] = dict()   # user-defined word ~~> code offset
+        self.compiling: Dict[str, List[int]] = dict()  # word being compiled ~~> pcs of its calls
+
+        self.table: List[Callable[[int], None]] = self._dispatch_table()
+
+    def _allocate(self):
+        """
+        Creates the data stack and the memory.
+        """
+        self.memory = dict()
+        self.stack = list()
+
+    def clear(self):
+        self.ctx.clear_generic_subs()
+        self.memory.clear()
+        self.words.clear()
+        self.stack.clear()
+
+    def eval(self, s: str):
+        nodes = self.optimizer.optimize(FirstPhase(self.ctx, verbose=self.verbose).parse_and_typecheck(s))
+        self.execute(self.compile(nodes))
+
+    ##################################################
+    # compiler
+
+    def compile(self, nodes: List[AstNode]) -> int:
+        """
+        Compiles a program; user-defined words are stored in `self.words`.
+        :return: the code offset of the block with the rest of the program
+        """
+        block: List[Tuple[int, int]] = list()
+        for node in nodes:
+            if isinstance(node, Funcdef):
+                self.words[node.funcname] = self._compile_word(node.funcname, node.funcbody)
+            else:
+                self._compile_node(node, block)
+        return self._emit_block(block)
+
+    def _compile_word(self, funcname: str, body: AstNode) -> int:
+        """
+        The recursive calls of a word are compiled before its offset is known: their operands
+        are patched once it is emitted.
+        """
+        self.compiling[funcname] = list()
+        try:
+            offset = self._compile_block(body)
+        finally:
+            calls = self.compiling.pop(funcname)
+        for pc in calls:
+            self.args[pc] = offset
+        return offset
+
+    def _compile_block(self, node: AstNode) -> int:
+        block: List[Tuple[int, int]] = list()
+        self._compile_node(node, block)
+        return self._emit_block(block)
+
+    def _emit_block(self, block: List[Tuple[int, int]]) -> int:
+        # nested blocks are emitted while compiling, so each block is emitted as a whole at the end
+        offset = len(self.code)
+        for opcode, arg in block:
+            if isinstance(arg, str):
+                # a recursive call
+                self.compiling[arg].append(len(self.code))
+                arg = 0
+            self.code.append(opcode)
+            self.args.append(arg)
+        self.code.append(RET)
+        self.args.append(0)
+        return offset
+
+    def _compile_node(self, node: AstNode, block: List[Tuple[int, int]]):
+        if isinstance(node, Sequence):
+            for x in node.funcs:
+                self._compile_node(x, block)
+        elif isinstance(node, Number):
+            block.append((PUSH, node.n))
+        elif isinstance(node, Boolean):
+            block.append((PUSH, node.b))
+        elif isinstance(node, Quote):
+            block.append((PUSH_QUOTE, self._compile_block(node.body)))
+        elif isinstance(node, Funcdef):
+            raise ZVMError(f"Definition of {node.funcname} is not at the top level")
+        elif isinstance(node, Funcall):
+            if node.funcname in self.compiling:
+                block.append((CALL, node.funcname))
+            elif node.funcname in self.words:
+                block.append((CALL, self.words[node.funcname]))
+            elif node.funcname in OPCODES:
+                block.append((OPCODES[node.funcname], 0))
+            elif node.funcname not in NO_OPS:
+                raise ZVMError(f"Builtin {node.funcname} is not supported by the VM")
+
+    def disassemble(self, start: int=0, end: Optional[int]=None) -> str:
+        lines = list()
+        for pc in range(start, len(self.code) if end is None else end):
+            opcode, arg = self.code[pc], self.args[pc]
+            lines.append(f"{pc:>6} {self._opname(opcode)}" + (f" {arg}" if self._has_operand(opcode) else ""))
+        return "\n".join(lines)
+
+    def _opname(self, opcode: int) -> str:
+        return OPNAMES[opcode]
+
+    def _has_operand(self, opcode: int) -> bool:
+        return opcode in (PUSH, PUSH_QUOTE, CALL)
+
+    ##################################################
+    # virtual machine
+
+    def execute(self, pc: int):
+        """
+        Runs the block of code starting at `pc`, until its RET.
+        """
+        code, args, table = self.code, self.args, self.table
+
+        opcode = code[pc]
+        while opcode != RET:
+            table[opcode](args[pc])
+            pc += 1
+            opcode = code[pc]
+
+    def _dispatch_table(self) -> List[Callable[[int], None]]:
+        stack, memory, execute = self.stack, self.memory, self.execute
+        push, pop = stack.append, stack.pop
+
+        def swap(_):
+            stack[-1], stack[-2] = stack[-2], stack[-1]
+        def drop(_):
+            pop()
+        def dup(_):
+            push(stack[-1])
+        def over(_):
+            push(stack[-2])
+        def rot_minus(_):
+            top, snd, trd = pop(), pop(), pop()
+            stack.extend((snd, top, trd))
+        def rot_plus(_):
+            top, snd, trd = pop(), pop(), pop()
+            stack.extend((top, trd, snd))
+
+        def binary(funcname: str):
+            op, modulo = ARITHMETIC[funcname]
+            def f(_):
+                push(op(pop() % modulo, pop() % modulo) % modulo)
+            return f
+        def comparison(funcname: str):
+            op = COMPARISONS[funcname]
+            def f(_):
+                push(op(pop() % 256, pop() % 256))
+            return f
+        def increment(delta: int, modulo: int):
+            def f(_):
+                stack[-1] = (stack[-1] + delta) % modulo
+            return f
+
+        def if_(_):
+            else_, then_, cond = pop(), pop(), pop()
+            execute(then_ if cond else else_)
+        def while_(_):
+            body, cond = pop(), pop()
+            while True:
+                execute(cond)
+                if not pop():
+                    break
+                execute(body)
+        def indexed_iter(_):
+            quote = pop()
+            end, start = pop(), pop()
+            for i in range(start, end):
+                push(i % 256)
+                execute(quote)
+        def eval_(_):
+            execute(pop())
+
+        def store_at(_):
+            address = pop()
+            obj = pop()
+            assert isinstance(obj, int) and 0 <= obj <= 256
+            memory[address] = obj
+        def retrieve_from(_):
+            stack[-1] = memory.get(stack[-1], 0)
+        def clear(_):
+            self.clear()
+        def show(_):
+            print(stack)
+
+        implementations: Dict[str, Callable[[int], None]] = {
+            "swap": swap, "drop": drop, "dup": dup, "over": over, "rot-": rot_minus, "rot+": rot_plus,
+            **{funcname: increment(*INCREMENTS[funcname]) for funcname in INCREMENTS},
+            **{funcname: binary(funcname) for funcname in ARITHMETIC},
+            **{funcname: comparison(funcname) for funcname in COMPARISONS},
+            "if": if_, "while": while_, "indexed-iter": indexed_iter, "eval": eval_,
+            "store-at": store_at, "retrieve-from": retrieve_from, "__clear": clear, ":s": show,
+        }
+
+        table: List[Callable[[int], None]] = [None] * len(OPNAMES)
+        table[PUSH] = push
+        table[PUSH_QUOTE] = push
+        table[CALL] = execute
+        for funcname, opcode in OPCODES.items():
+            table[opcode] = implementations[funcname]
+        return table
@@ -0,0 +1,203 @@
+import copy
+import os
+from typing import *
+
+from forfait.astnodes import AstNode, Funcdef, Funcall, Quote, Sequence
+from forfait.cache import signature
+from forfait.data_structures.graph import Graph
+from forfait.my_exceptions import ZException
+from forfait.parser.firstphase import FirstPhase
+from forfait.parser.parser_exceptions import ZEmptyFile
+from forfait.stdlibs.basic_stdlib import get_stdlib
+from forfait.ztypes.context import Context
+from forfait.ztypes.ztypes import ZTFunction
+
+
+class ZModuleError(ZException):
+    pass
+
+
+def qualified(module: str, funcname: str) -> str:
+    """
+    :return: the name of a word defined by a module, in a program made of several modules
+    """
+    return f"{module}.{funcname}"
+
+
+def rename(node: AstNode, names: Dict[str, str]) -> AstNode:
+    """
+    :return: `node`, where the calls of the words in `names` call their new names instead
+    """
+    if isinstance(node, Sequence):
+        return Sequence([rename(f, names) for f in node.funcs])
+    if isinstance(node, Quote):
+        quote = copy.copy(node)
+        quote.body = rename(node.body, names)
+        return quote
+    if isinstance(node, Funcdef):
+        return Funcdef(names.get(node.funcname, node.funcname), rename(node.funcbody, names))
+    if type(node) is Funcall and node.funcname in names:
+        funcall = copy.copy(node)
+        funcall.funcname = names[node.funcname]
+        return funcall
+    return node
+
+
+class Module:
+    def __init__(self, name: str, source: str):
+        self.name = name
+        self.source = source
+        self.imports: List[str] = list()             # in the order of the `import`s
+        self.nodes: List[AstNode] = list()           # typed AST
+        self.exports: Dict[str, ZTFunction] = dict()  # the words defined by the module ~~> type
+
+    def signatures(self) -> Dict[str, str]:
+        return {funcname: signature(t) for funcname, t in self.exports.items()}
+
+
+class ModuleGraph:
+    """
+    The modules of a program, each typechecked once in its own `Context`, with the words
+    exported by the modules it imports.
+
+    A module `name` is the source registered with `set_source`, or the file `name.forf` in one
+    of the `paths`. It exports the words it defines (not the ones it imports), and is
+    typechecked the first time it is imported. When its source changes, only the module is
+    typechecked again, and then, in dependency order, the modules importing it, as long as
+    the types of the words they import change.
+    """
+    def __init__(self, paths: Iterable[str]=(), ctx_factory: Callable[[], Context]=get_stdlib):
+        self.paths = list(paths)
+        self.ctx_factory = ctx_factory
+
+        self.sources: Dict[str, str] = dict()
+        self.modules: Dict[str, Module] = dict()
+        self.importers: Dict[str, Set[str]] = dict()  # module ~~> the modules importing it
+        self.loading: List[str] = list()              # the modules being typechecked, importers first
+
+        self.typechecked: int = 0  # number of modules typechecked so far
+
+    def source(self, name: str) -> str:
+        if name in self.sources:
+            return self.sources[name]
+        for path in self.paths:
+            filename = os.path.join(path, f"{name}.forf")
+            if os.path.isfile(filename):
+                with open(filename) as f:
+                    return f.read()
+        raise ZModuleError(f"Module {name} not found in {self.paths}")
+
+    def load(self, name: str) -> Module:
+        """
+        :return: the module, typechecked along with the modules it imports if needed
+        """
+        if name not in self.modules:
+            self.modules[name] = self._typecheck(name, self.source(name))
+        return self.modules[name]
+
+    def set_source(self, name: str, source: str) -> List[str]:
+        """
+        Changes the source of a module, and typechecks again the modules affected by the change.
+        :return: the names of the modules typechecked again, in order
+        """
+        self.sources[name] = source
+        if name not in self.modules:
+            return []
+
+        dependents = self.dependents(name)
+        graph = Graph()
+        for module in dependents:
+            graph.add_node(module)
+            for importer in self.importers.get(module, ()):
+                graph.add_edge(module, importer)
+
+        changed, typechecked = set(), list()  # changed: the modules whose exports changed
+        for module in graph.ordered_visit():
+            old = self.modules[module]
+            if module != name and not any(imported in changed for imported in old.imports):
+                continue
+            self.modules[module] = self._typecheck(module, self.source(module))
+            typechecked.append(module)
+            if self.modules[module].signatures() != old.signatures():
+                changed.add(module)
+        return typechecked
+
+    def dependents(self, name: str) -> Set[str]:
+        """
+        :return: the module and the modules importing it, directly or not
+        """
+        dependents, frontier = {name}, [name]
+        while len(frontier) > 0:
+            for importer in self.importers.get(frontier.pop(), ()):
+                if importer not in dependents:
+                    dependents.add(importer)
+                    frontier.append(importer)
+        return dependents
+
+    def linked(self, name: str) -> List[AstNode]:
+        """
+        :return: the nodes of the module, where the words it defines and the ones it imports have
+        the names given by `qualified`, so that the modules of a program can run in the same
+        dictionary: the words of a module only call its own words, or the ones it imports
+        """
+        module = self.load(name)
+        names: Dict[str, str] = dict()
+        for imported in module.imports:
+            names.update({funcname: qualified(imported, funcname) for funcname in self.load(imported).exports})
+
+        nodes = list()
+        for node in module.nodes:
+            if isinstance(node, Funcdef):
+                # from its own definition on, which may be recursive
+                names[node.funcname] = qualified(name, node.funcname)
+            nodes.append(rename(node, names))
+        return nodes
+
+    def program(self, name: str) -> List[Module]:
+        """
+        :return: the module and all the modules it imports, each one after its imports
+        """
+        order, visited = list(), set()
+
+        def visit(module: Module):
+            visited.add(module.name)
+            for imported in module.imports:
+                if imported not in visited:
+                    visit(self.load(imported))
+            order.append(module)
+
+        visit(self.load(name))
+        return order
+
+    ##################################################
+
+    def _typecheck(self, name: str, source: str) -> Module:
+        module = Module(name, source)
+        # the modules which would be on a cycle if imported (when typechecking `name` again)
+        dependents = self.dependents(name) if name in self.modules else {name}
+
+        def importer(imported: str) -> Dict[str, ZTFunction]:
+            if imported in self.loading:
+                cycle = self.loading[self.loading.index(imported):] + [imported]
+                raise ZModuleError(f"Import cycle: {' ==> '.join(cycle)}")
+            if imported in dependents:
+                raise ZModuleError(f"Import cycle: {name} imports {imported}, which imports {name}")
+            module.imports.append(imported)
+            return self.load(imported).exports
+
+        ctx = self.ctx_factory()
+        self.loading.append(name)
+        try:
+            module.nodes = FirstPhase(ctx, verbose=False, importer=importer).parse_and_typecheck(source)
+        except ZEmptyFile:
+            pass  # only imports
+        finally:
+            self.loading.pop()
+
+        module.exports = {node.funcname: ctx.user_types[node.funcname] for node in module.nodes if isinstance(node, Funcdef)}
+        for imported in self.modules[name].imports if name in self.modules else ():
+            self.importers[imported].discard(name)
+        for imported in module.imports:
+            self.importers.setdefault(imported, set()).add(name)
+        self.typechecked += 1
+        return module
@@ -1,10 +1,14 @@
+import copy
 import logging
 from typing import *
 from typing import List
 
 from forfait.astnodes import Sequence, Number, Funcall, AstNode, Funcdef, Quote, Boolean
+from forfait.partial_evaluator import PartialEvaluator
+from forfait.peephole import Rule, RuleSet, Rewriter, load_rules, composition
+from forfait.stdlibs.basic_rules import BASIC_RULES
 from forfait.ztypes.context import Context
-from forfait.ztypes.ztypes import ZTBase
+from forfait.ztypes.ztypes import ZTFunction, ZTFuncHelper, ZTRowGeneric
 
 class PeepholeOptimization:
     def __init__(self, arity: int, checker: Callable, generator: Callable[[List[Funcall]], None]):
@@ -28,81 +32,161 @@ class PeepholeOptimization:
             return stream.pop(0)
 
 
-#####################################################
+# the rules which the optimizer runs by default; a `PeepholeOptimization` is for the rewrites
+# which don't fit in a rule
+stdlib_peeps: RuleSet = load_rules(BASIC_RULES)
 
-## If:
-##   F(F^-1(x)) = x,
-## remove F and F^-1
-def inverse_of_inverse2_check(top: Funcall, snd: Funcall):
-    match top.funcname, snd.funcname:
-        case ("swap", "swap") | ("dup", "drop") | ("over", "drop"):
-            return True
-    return False
-
-def inverse_of_inverse2_do(stream: List[Funcall]):
-    stream.pop(0)
-    stream.pop(0)
-
-inverse_of_inverse2 = PeepholeOptimization(
-    2,
-    inverse_of_inverse2_check,
-    inverse_of_inverse2_do
-)
-
-#######################################################
-
-def compiletime_arithmetic_do(stream: List[Funcall]):
-    left, right, op = stream.pop(0), stream.pop(0), stream.pop(0)
-
-    assert isinstance(left, Number)
-    assert isinstance(right, Number)
-
-    match op.funcname:
-        case "+u8":
-            stream.insert(0, Number((left.n + right.n) % 256, ZTBase.U8))
-        case "-u8":
-            stream.insert(0, Number((left.n - right.n) % 256, ZTBase.U8))
-        case "*u8":
-            stream.insert(0, Number((left.n * right.n) % 256, ZTBase.U8))
-        case "/u8":
-            stream.insert(0, Number((left.n // right.n) % 256, ZTBase.U8))
-        case "<u8":
-            stream.insert(0, Boolean(left.n < right.n))
-        case "<=u8":
-            stream.insert(0, Boolean(left.n <= right.n))
-        case ">u8":
-            stream.insert(0, Boolean(left.n > right.n))
-        case ">=u8":
-            stream.insert(0, Boolean(left.n >= right.n))
-        case "==u8":
-            stream.insert(0, Boolean(left.n == right.n))
-        case "!=u8":
-            stream.insert(0, Boolean(left.n != right.n))
-        case _:
-            raise Exception(f"Optimization on unknown op: {op}")
-
-compiletime_arithmetic = PeepholeOptimization(
-    3,
-    lambda left, right, op:
-        isinstance(left, Number) and isinstance(right, Number) and op.funcname in {
-            "+u8", "-u8", "*u8", "/u8", ">u8", ">=u8", "<u8", "<=u8", "==u8", "!=u8"
-        },
-    compiletime_arithmetic_do
-)
+##########################################################
+
+# builtins without side effects, which always terminate (and never fail, unlike `/u8`): a call
+# whose results are never used can be removed
+PURE_BUILTINS: Set[str] = {
+    "dup", "drop", "swap", "over", "rot+", "rot-", "identity", "u16", "retrieve-from",
+    "++u8", "--u8", "+u8", "-u8", "*u8", ">u8", "<u8", ">=u8", "<=u8", "==u8", "!=u8",
+    "++u16", "--u16", "+u16", "-u16", "*u16",
+}
+
+# builtins which read the whole stack
+OBSERVERS: Set[str] = {":s"}
+
+
+def eliminate_dead_code(funcs: List[Funcall], is_pure: Callable[[Funcall], bool],
+                        is_opaque: Callable[[Funcall], bool]) -> List[Funcall]:
+    """
+    Removes the pure funcalls whose results are never used.
+
+    The sequence is run on a symbolic stack, where each value records the funcall pushing it
+    and the one popping it (as given by their `arity_in`/`arity_out`); the values found on the
+    stack at the start or left there at the end are used elsewhere. A set of pure funcalls can
+    be removed when they only pop values pushed by the set, and their values are only popped
+    by the set: the other funcalls pop the same values without them. The largest such set is
+    found by starting from every pure funcall, and keeping those which break the condition.
+
+    :param is_opaque: whether a funcall has a stack effect which can't be known from its arity
+    (e.g. `eval`); it is assumed to use the whole stack
+    """
+    EXTERNAL = -1  # the producer (or consumer) of the values used elsewhere
+
+    producer: List[int] = list()  # value ~~> index of the funcall pushing it
+    consumer: List[int] = list()  # value ~~> index of the funcall popping it
+    inputs: List[List[int]] = [list() for _ in funcs]
+    outputs: List[List[int]] = [list() for _ in funcs]
+
+    def value(i: int) -> int:
+        producer.append(i)
+        consumer.append(EXTERNAL)
+        return len(producer) - 1
+
+    stack: List[int] = list()
+    for i, f in enumerate(funcs):
+        if is_opaque(f):
+            for v in stack:
+                consumer[v] = i
+            inputs[i], stack = stack, list()
+            continue
+
+        arity_in, arity_out = (0, 1) if isinstance(f, Quote) else (f.arity_in, f.arity_out)
+        for _ in range(arity_in):
+            v = stack.pop() if len(stack) > 0 else value(EXTERNAL)
+            consumer[v] = i
+            inputs[i].append(v)
+        outputs[i] = [value(i) for _ in range(arity_out)]
+        stack.extend(outputs[i])
+
+    removable = [is_pure(f) and not is_opaque(f) for f in funcs]
+    worklist = list(range(len(funcs)))
+    while len(worklist) > 0:
+        i = worklist.pop()
+        if not removable[i]:
+            continue
+        if any(producer[v] == EXTERNAL or not removable[producer[v]] for v in inputs[i]) or \
+           any(consumer[v] == EXTERNAL or not removable[consumer[v]] for v in outputs[i]):
+            removable[i] = False
+            worklist.extend(producer[v] for v in inputs[i] if producer[v] != EXTERNAL)
+            worklist.extend(consumer[v] for v in outputs[i] if consumer[v] != EXTERNAL)
+
+    return [f for f, dead in zip(funcs, removable) if not dead]
 
 ##########################################################
 
-stdlib_peeps = [compiletime_arithmetic, inverse_of_inverse2]
+# the largest body (in words, counting those of its quotations) which is inlined
+INLINE_BUDGET = 16
+
+
+def size(funcs: List[Funcall]) -> int:
+    return sum(1 + size(f.body.funcs) if isinstance(f, Quote) else 1 for f in funcs)
+
+
+def calls(funcs: List[Funcall], funcname: str) -> bool:
+    """
+    :return: whether `funcname` is called in `funcs`, or in the quotations among them
+    """
+    return any(calls(f.body.funcs, funcname) if isinstance(f, Quote) else f.funcname == funcname for f in funcs)
+
+
+def called(funcs: List[Funcall]) -> Set[str]:
+    """
+    :return: the names of the words called in `funcs`, or in the quotations among them
+    """
+    return set().union(*(called(f.body.funcs) if isinstance(f, Quote) else {f.funcname} for f in funcs))
 
 ##########################################################
 
 
 class Optimizer:
-    def __init__(self, ctx: Context, user_peep_optimizations: Optional[list[PeepholeOptimization]]=None):
+    def __init__(self, ctx: Context, user_peep_optimizations: Optional[Iterable[PeepholeOptimization | Rule]]=None, *,
+                 rules: Optional[RuleSet]=None, dead_code=True, inline=True, inline_budget=INLINE_BUDGET,
+                 partial_evaluation=True, redefinable=False):
+        """
+        :param user_peep_optimizations: rewrites added to the rules: `PeepholeOptimization`s, which
+        run after them, or `Rule`s (e.g. a `RuleSet`)
+        :param rules: the rewrite rules, `stdlib_peeps` by default
+        :param redefinable: whether the code optimized by a later call may redefine the words (e.g.
+        in an interpreter session). The bodies of words and quotations outlive the call, so they
+        call the user-defined words instead of inlining them, or removing them as dead code; only
+        the code run at once does
+        """
         self.ctx = ctx
-        self.peep_opts = stdlib_peeps if user_peep_optimizations is None else stdlib_peeps + user_peep_optimizations
+        self.rules = stdlib_peeps if rules is None else rules
+        self.peep_opts: List[PeepholeOptimization] = list()
+        user_rules = list()
+        for x in () if user_peep_optimizations is None else user_peep_optimizations:
+            if not isinstance(x, Rule):
+                self.peep_opts.append(x)
+            elif not any(x is rule for rule in self.rules.rules):
+                user_rules.append(x)
+        if len(user_rules) > 0:
+            self.rules = self.rules + RuleSet(user_rules)
+        self.rewriter = Rewriter(self.rules, ctx, self.peep_opts)
+
+        self.dead_code = dead_code        # whether dead code is eliminated
+        self.pure_words: Set[str] = set()  # the user-defined words made only of pure funcalls
+
+        self.inlining = inline             # whether small words and quotations are inlined
+        self.inline_budget = inline_budget
+        self.definitions: Dict[str, List[Funcall]] = dict()  # the (optimized) bodies of the words to inline
+        # the words defined more than once: a call runs the definition found when it is run, so
+        # they are neither inlined nor pure
+        self.defined: Set[str] = set()
+        self.redefined: Set[str] = set()
+        self.callers: Dict[str, Set[str]] = dict()  # word ~~> the words whose bodies call it
+
+        self.redefinable = redefinable
+        self.in_body = 0  # the depth of the bodies of words and quotations being optimized
+
+        # runs the words whose inputs are literals, if any
+        self.evaluator: Optional[PartialEvaluator] = PartialEvaluator() if partial_evaluation else None
 
     def optimize(self, astnodes: List[AstNode]) -> List[AstNode]:
+        for node in astnodes:
+            if isinstance(node, Funcdef):
+                if node.funcname in self.defined:
+                    self.redefined.add(node.funcname)
+                self.defined.add(node.funcname)
+        for funcname in self.redefined:
+            self.definitions.pop(funcname, None)
+            self.pure_words.discard(funcname)
+
         optimized = list()
 
         for node in astnodes:
@@ -133,48 +217,184 @@ class Optimizer:
 
     def optimize_quote(self, quote: Quote) -> Quote:
         # TODO: se quote è vuota, non ritornare niente
-        return Quote(self.optimize_sequence(quote.body))
+        self.in_body += 1
+        try:
+            optimized = Quote(self.optimize_sequence(quote.body), quote.position)
+        finally:
+            self.in_body -= 1
+        # the optimizations keep the type of the body
+        optimized.type, optimized.arity_in, optimized.arity_out = quote.type, quote.arity_in, quote.arity_out
+        return optimized
 
     def optimize_funcdef(self, fdef: Funcdef) -> Funcdef:
-        return Funcdef(fdef.funcname, self.optimize_astnode(fdef.funcbody))
+        # the words calling the previous definition, if any, inlined it or assumed it pure
+        self.forget(fdef.funcname)
+        source = fdef.funcbody.funcs if isinstance(fdef.funcbody, Sequence) else [fdef.funcbody]
+        for callee in called(source):
+            self.callers.setdefault(callee, set()).add(fdef.funcname)
+
+        self.in_body += 1
+        try:
+            body = self.optimize_astnode(fdef.funcbody)
+        finally:
+            self.in_body -= 1
+        redefined = fdef.funcname in self.redefined
+        # a recursive word isn't pure, since it isn't while its body is checked
+        if not redefined and all(self.is_pure(f) for f in (body.funcs if isinstance(body, Sequence) else [body])):
+            self.pure_words.add(fdef.funcname)
+        else:
+            self.pure_words.discard(fdef.funcname)
+        funcs = body.funcs if isinstance(body, Sequence) else [body]
+        # a body calling words (when they are redefinable) is inlined if they are, so that the
+        # words inlined into each other are never recursive
+        inlinable = all(w in self.definitions for w in called(funcs) & self.defined) if self.redefinable else True
+        if not redefined and inlinable and size(funcs) <= self.inline_budget and not calls(funcs, fdef.funcname):
+            self.definitions[fdef.funcname] = funcs
+        else:
+            self.definitions.pop(fdef.funcname, None)
+        return Funcdef(fdef.funcname, body)
+
+    def forget(self, funcname: str):
+        """
+        Neither inlines nor assumes pure `funcname` and the words calling it, directly or not.
+        """
+        forgotten, worklist = set(), [funcname]
+        while len(worklist) > 0:
+            word = worklist.pop()
+            if word not in forgotten:
+                forgotten.add(word)
+                self.definitions.pop(word, None)
+                self.pure_words.discard(word)
+                worklist.extend(self.callers.get(word, ()))
 
     def optimize_sequence(self, seq: Sequence) -> Sequence:
         funcs: list[Funcall] = [self.optimize_astnode(x) for x in seq.funcs]
 
         logging.debug(f"Before optimization: {' '.join(str(x) for x in funcs)}")
-
+        funcs = self.optimization_round(funcs)
         while True:
-            optimized = self.optimization_round(funcs)
-            if optimized == funcs:
+            # inlining, evaluating and removing dead code may enable rewrites, and the other way round
+            inlined = self.inline(funcs) if self.inlining else funcs
+            evaluated = self.evaluator.evaluate(inlined) if self.evaluator is not None else inlined
+            live = eliminate_dead_code(evaluated, self.is_removable, self.is_opaque) if self.dead_code else evaluated
+            if inlined is funcs and evaluated is inlined and len(live) == len(funcs):
                 break
-            logging.debug(f"Optimization round result: {' '.join(str(x) for x in optimized)}")
-            funcs = optimized
-
+            funcs = self.optimization_round(live)
         return Sequence(funcs)
 
-    #################################################################
+    def inline(self, funcs: List[Funcall]) -> List[Funcall]:
+        """
+        Replaces the calls of the words in `self.definitions` with their bodies, and the
+        quotations run by `eval` (or by `if`, on a boolean literal) with their bodies, if they
+        are within the budget. The definitions are already inlined (or, if the words are redefinable,
+        only call inlinable words), and a recursive word is never inlined, so the expansion ends.
 
-    def optimization_round(self, funcs: list[Funcall]) -> list[Funcall]:
+        :return: `funcs` itself if nothing was inlined
         """
-        A single round of optimization on a Sequence of funcall.
-        Iterates over all peephole optimizations in self.peeps
+        out: List[Funcall] = list()
+        changed = False
+        words = self.definitions if not (self.redefinable and self.in_body > 0) else dict()
+        for f in funcs:
+            if type(f) is Funcall and f.funcname in words:
+                window, body = [f], self.definitions[f.funcname]
+            elif f.funcname == "eval" and len(out) >= 1 and isinstance(out[-1], Quote):
+                window, body = [out[-1], f], out[-1].body.funcs
+            elif f.funcname == "if" and len(out) >= 3 and isinstance(out[-3], Boolean) and \
+                    isinstance(out[-2], Quote) and isinstance(out[-1], Quote):
+                window, body = out[-3:] + [f], (out[-2] if out[-3].b else out[-1]).body.funcs
+            else:
+                out.append(f)
+                continue
+
+            if size(body) > self.inline_budget or any(x.type is None for x in window + body):
+                out.append(f)
+                continue
+            nodes = self._spliced(body, window)
+            if nodes is None:
+                out.append(f)
+                continue
+            del out[len(out) + 1 - len(window):]
+            out.extend(nodes)
+            changed = True
+        return out if changed else funcs
+
+    def _spliced(self, body: List[Funcall], window: List[Funcall]) -> Optional[List[Funcall]]:
         """
-        local_copy: list[Funcall] = funcs[:]
-        out: list[Funcall] = list()
-
-        # for each peephole optimization...
-        for optimization in self.peep_opts:
-            # while there are enough funcalls to "sustain" the optimization arity...
-            while len(local_copy) >= optimization.arity:
-                # out_funcall is the possible name of the function to add to `out`
-                out_funcall = optimization.try_optimization(local_copy)
-
-                # no optimization was possible => add first funcall to out:
-                if out_funcall is not None:
-                    out.append(out_funcall)
+        :return: copies of the funcalls of `body`, typed as they are where they replace `window`
+        (e.g. a polymorphic word gets the types of the call), or None if they can't be typed
+        """
+        ctx = self.rewriter.scratch
+        nodes = list()
+        for x in body:
+            if isinstance(x, Number):
+                node = Number(x.n, x.type.right.types[-1])
+            elif isinstance(x, Boolean):
+                node = Boolean(x.b)
+            elif isinstance(x, Quote):
+                # the body of the quotation is shared
+                node = copy.copy(x)
+                node.type = self._fresh_type(x, ctx)
+            else:
+                node = Funcall(x.funcname, self._fresh_type(x, ctx))
+            nodes.append(node)
+        if len(nodes) == 0:
+            return nodes
+
+        # the call of a word has the types of the call site
+        window_types = [ctx.fresh_type(x.type) if x.funcname in self.definitions else self._fresh_type(x, ctx) for x in window]
+        try:
+            composition([x.type for x in nodes], ctx).unify(composition(window_types, ctx), ctx)
+            for node in nodes:
+                Funcall.finally_annotate_quotes(node, ctx)
+        except Exception:  # the occur check raises an `Exception`
+            # e.g. quotations of quotations, whose types share row variables
+            return None
+        finally:
+            ctx.clear_generic_subs()
+        return nodes
+
+    def _fresh_type(self, f: Funcall, ctx: Context) -> ZTFunction:
+        """
+        The annotated types of the funcalls keep the row variables of the program, which are
+        distinct stacks here (e.g. in the type of `eval`, the stack of the quotation is the
+        same row as the stack below it): words get their declared types instead.
+        """
+        if isinstance(f, Quote):
+            row = ZTRowGeneric("Q")
+            return ZTFuncHelper(row, [], row, [ctx.fresh_type(f.type.right.types[-1])])
+        if f.funcname in self.ctx.builtin_types:
+            return ctx.fresh_builtin_type(f.funcname)
+        if f.funcname in self.ctx.user_types:
+            return self.ctx.get_userdefined_type(f.funcname)
+        return ctx.fresh_type(f.type)
+
+    def is_pure(self, f: Funcall) -> bool:
+        return isinstance(f, (Number, Boolean, Quote)) or f.funcname in PURE_BUILTINS or f.funcname in self.pure_words
+
+    def is_removable(self, f: Funcall) -> bool:
+        """
+        :return: whether `f` can be removed as dead code: a body which outlives the call calls
+        the user-defined words as they will be defined then
+        """
+        if self.redefinable and self.in_body > 0 and type(f) is Funcall and f.funcname in self.pure_words:
+            return False
+        return self.is_pure(f)
 
-            local_copy = out + local_copy # must add also remaining `opt.arity` elements to `out`
-            out = list()
+    def is_opaque(self, f: Funcall) -> bool:
+        if isinstance(f, (Number, Boolean, Quote)):
+            return False
+        if f.funcname in OBSERVERS:
+            return True
+        # the declared type tells whether the stack below the arguments is left as it is, and
+        # whether the word runs quotations, which may use the whole stack
+        t = self.ctx.builtin_types.get(f.funcname) or self.ctx.user_types.get(f.funcname)
+        return t is None or t.left.row_var != t.right.row_var or any(isinstance(x, ZTFunction) for x in t.left.types)
 
-        return local_copy
+    #################################################################
 
+    def optimization_round(self, funcs: list[Funcall]) -> list[Funcall]:
+        """
+        Rewrites a Sequence of funcalls with the rules (and the peephole optimizations), in a
+        single pass which leaves nothing else to rewrite; see `Rewriter`.
+        """
+        return self.rewriter.rewrite(funcs)
@@ -1,24 +1,36 @@
-from typing import List
+from typing import List, Iterator, Optional, Callable, Dict
 
 from forfait.my_exceptions import ZException
+from forfait.parser.lexer import Token, tokenize, strip_comments
 from forfait.parser.parser_typesignature import parse_base_type
 from forfait.parser.parser_exceptions import *
 from forfait.ztypes.context import Context
-from forfait.ztypes.ztypes import ZTBase, ZType
+from forfait.ztypes.ztypes import ZTBase, ZType, ZTFuncHelper, ZTRowGeneric, ZTFunction
 from forfait.astnodes import AstNode, Funcall, Funcdef, Sequence, Quote, Number, Boolean
 
 import logging
 logging.basicConfig(level=logging.INFO, format="[%(levelname)s]:%(message)s")
 
 
+# token closing the block opened by the key
+_CLOSING_TOKEN = {"[|": "|]", ":": ";"}
+
 
 class FirstPhase:
     """
     Class that parses and performs typechecking on raw source code.
+
+    `import name` (at the top level) adds the words exported by a module to the context; the
+    `importer` gives their types, see `forfait.modules.ModuleGraph`.
     """
-    def __init__(self, ctx: Context, verbose=True):
+    def __init__(self, ctx: Context, verbose=True, importer: Optional[Callable[[str], Dict[str, ZTFunction]]]=None):
         self.ctx = ctx
         self.verbose = verbose
+        self.importer = importer
+
+        # the user-defined word being parsed, which may call itself, and its recursive calls
+        self.recursive: Optional[Funcall] = None
+        self.recursive_calls: List[Funcall] = list()
 
 
     def parse_and_typecheck(self, code: str) -> list[AstNode]:
@@ -31,11 +43,13 @@ class FirstPhase:
         """
         Entry point for parsing.
         """
-        preproc = self.preprocess(code)  # TODO
-        tokens  = self.tokenize(code)
-        nodes   = self.parse_tokens(tokens)
+        tokens = self.tokenize(code)
+        nodes  = self.parse_tokens(tokens)
+
+        if len(nodes) == 0:
+            raise ZEmptyFile("The file does not contain computable expressions.")
 
-        return self.compress_ast(nodes)
+        return nodes
 
 
     def typechecker(self, program: list[AstNode]) -> list[AstNode]:
@@ -74,66 +88,84 @@ class FirstPhase:
     ##################################################
 
     def preprocess(self, code:str) -> str:
-        out = str()
-
-        start_comment = code.find("((")
-        end_comment   = 0
-
-        while start_comment != -1:
-            out += code[end_comment:start_comment]
-
-            closing_comment = code.find("))")
-            if closing_comment == -1:
-                raise ZParserError(f"Opening comment without closing parenhesis\n{code[start_comment:start_comment+50]}...")
-
-            end_comment   = closing_comment + 2
-            start_comment = code.find("((")
-
-        return out + code[end_comment:]
+        """
+        Removes (possibly nested) comments from the source code. Not needed before
+        `tokenize`, as the lexer already skips comments in the same pass.
+        """
+        return strip_comments(code)
 
 
     ##################################################
 
-    def tokenize(self, code: str) -> List[str]:
+    def tokenize(self, code: str) -> Iterator[Token]:
         """
-        Splits source code in a list of funcalls
+        Splits source code in a stream of tokens (comments are discarded by the lexer)
         """
-        funcalls: List[str]  = list()
-        for line in code.split("\n"):
-            funcalls += [foo for foo in line.strip().split(" ") if foo != ""]
-        return funcalls
+        return tokenize(code)
 
 
-    def parse_tokens(self, tokens: List[str]) -> List[AstNode]:
+    def parse_tokens(self, tokens: Iterator[Token], opening: Optional[Token]=None) -> List[AstNode]:
         """
-        Procedure for interpreting the meaning of each token
-        """
-        if len(tokens) == 0:
-            raise ZEmptyFile("The file does not contain computable expressions.")
+        Recursive-descent procedure for interpreting the meaning of each token.
 
-        ast: List[AstNode] = list()
+        Consumes `tokens` up to the token closing `opening` (`|]` for a `[|`, `;` for
+        a `:`) or, at top level, up to the end of the stream. Consecutive funcalls are
+        directly grouped into a `Sequence`, so that each token is visited exactly once.
+        """
+        closing = None if opening is None else _CLOSING_TOKEN[opening.text]
 
-        while len(tokens) > 0:
-            token = tokens.pop(0)
+        ast: List[AstNode]   = list()
+        funcs: List[Funcall] = list()  # funcalls of the Sequence being built
 
-            match token:
+        for token in tokens:
+            match token.text:
                 # case "declare":  # macro for declaring variables
                 #     ast.extend(self.parse_declare(tokens))
                 case "[|":
-                    ast.append(self.parse_quotation(tokens))
+                    funcs.append(self.parse_quotation(tokens, token))
                 case ":":
-                    ast.append(self.parse_funcdef(tokens))
+                    if opening is not None:
+                        raise ZForbiddenNestedFuncdef(f"Nested funcdef at {token.position()}")
+                    if len(funcs) > 0:
+                        ast.append(Sequence(funcs))
+                        funcs = list()
+                    ast.append(self.parse_funcdef(tokens, token))
+                case "import":
+                    if opening is not None:
+                        raise ZParserError(f"Import not at the top level (at {token.position()})")
+                    self.parse_import(tokens, token)
+                case "|]" | ";" if token.text == closing:
+                    if len(funcs) > 0:
+                        ast.append(Sequence(funcs))
+                    return ast
+                case "|]":
+                    raise ZParserError(f"Found '|]' without relative '[|' (at {token.position()})")
+                case ";":
+                    raise ZParserError(f"Found ';' without relative ':' (at {token.position()})")
                 case _:
-                    ast.append(self.parse_funcall(token))
+                    funcs.append(self.parse_funcall(token))
+
+        if opening is not None:
+            if closing == ";":
+                raise ZNoEndToFuncDef(f"Funcdef at {opening.position()} has no ending ';'")
+            raise ZParserError(f"Found '[|' without relative '|]' (at {opening.position()})")
 
-        return self.compress_ast(ast)
+        if len(funcs) > 0:
+            ast.append(Sequence(funcs))
+        return ast
 
 
-    def parse_funcall(self, funcname: str) -> Funcall:
+    def parse_funcall(self, token: Token) -> Funcall:
+        funcname = token.text
+
         if funcname in self.ctx.builtin_types:
             return Funcall(funcname, self.ctx.fresh_builtin_type(funcname))
         if funcname in self.ctx.user_types:
             return Funcall(funcname, self.ctx.get_userdefined_type(funcname))
+        if self.recursive is not None and funcname == self.recursive.funcname:
+            # a recursive call: the same (monomorphic) type as the word being defined
+            self.recursive_calls.append(Funcall(funcname, self.recursive.type))
+            return self.recursive_calls[-1]
         if funcname in ["true", "false"]:
             return Boolean(funcname == "true")
 
@@ -142,90 +174,56 @@ class FirstPhase:
         except ValueError:
             pass
 
-        raise ZUnknownFunction(funcname)
+        raise ZUnknownFunction(f"{funcname} (at {token.position()})")
 
 
-    def parse_funcdef(self, tokens: List[str]) -> Funcdef:
-        try:
-            idx = tokens.index(";")  # implies: no nested functions
-        except ValueError as _:
-            raise ZNoEndToFuncDef(" ".join(tokens))
+    def parse_funcdef(self, tokens: Iterator[Token], opening: Token) -> Funcdef:
+        funcname: Optional[Token] = next(tokens, None)
+        if funcname is None or funcname.text == ";":
+            raise ZNoEndToFuncDef(f"Funcdef at {opening.position()} has no name")
 
+        self.recursive = Funcall(funcname.text, ZTFuncHelper(ZTRowGeneric("R"), [], ZTRowGeneric("T"), []))
+        self.recursive_calls = list()
         try:
-            tokens[:idx].index(":")  # actually check for no nested functions
-        except ValueError as _:
-            pass
-        else:
-            raise ZForbiddenNestedFuncdef(" ".join(tokens))
-
-
-        # esaurisci il body della funzione
-        funcbody_tokens = list()
-        for _ in range(idx):
-            funcbody_tokens.append(tokens.pop(0))
-        tokens.pop(0) # pop del ";"
-
-        # costruisci istanza
-        funcname: str      = funcbody_tokens.pop(0)
-        ast: List[Funcall] = self.parse_tokens(funcbody_tokens)
-
+            ast: List[AstNode] = self.parse_tokens(tokens, opening)
+        finally:
+            recursive, self.recursive = self.recursive, None
+        if len(ast) == 0:
+            raise ZParserError(f"Funcdef {funcname} (at {opening.position()}) has an empty body")
         assert len(ast) == 1 and isinstance(ast[0], Sequence), " ".join([str(s) for s in ast])
-        # assert all(isinstance(n, Funcall) for n in ast), " ".join([str(s) for s in ast])
 
-        # funcdef_obj = Funcdef(funcname, Sequence(ast))
-        funcdef_obj = Funcdef(funcname, ast[0])
-        self.ctx.user_types[funcname] = funcdef_obj.typeof(self.ctx)
+        funcdef_obj = Funcdef(funcname.text, ast[0])
+        funcdef_type = funcdef_obj.typeof(self.ctx)
+        if len(self.recursive_calls) > 0:
+            # recursion is monomorphic, as in Algorithm W: every call has the type of the whole body
+            recursive.type.unify(funcdef_type, self.ctx)
+            funcdef_type = self.ctx.resolve(funcdef_type)
+            for funcall in self.recursive_calls:
+                funcall.type = funcdef_type
+                funcall.arity_in, funcall.arity_out = funcdef_type.left.arity(), funcdef_type.right.arity()
+        self.ctx.add_userfunction_type(funcname.text, funcdef_type)
 
         return funcdef_obj
 
 
-    def parse_quotation(self, tokens) -> Quote:
-        depth = 1
-        quote_block = list()
+    def parse_import(self, tokens: Iterator[Token], opening: Token):
+        name: Optional[Token] = next(tokens, None)
+        if name is None:
+            raise ZParserError(f"Import at {opening.position()} has no module name")
+        if self.importer is None:
+            raise ZParserError(f"Can't import {name} (at {opening.position()}) outside of a module")
 
-        while not (depth == 1 and tokens[0] == "|]"):
-            t = tokens.pop(0)
-            quote_block.append(t)
+        for funcname, t in self.importer(name.text).items():
+            self.ctx.add_userfunction_type(funcname, t)
 
-            match t:
-                case "[|":
-                    depth += 1
-                case "|]":
-                    depth -= 1
-                    if depth <= 0:
-                        raise ZParserError("Found '|]' without relative '[|'")
-                case _:
-                    pass
 
-        tokens.pop(0)  # removes |]
+    def parse_quotation(self, tokens: Iterator[Token], opening: Token) -> Quote:
+        ast: List[AstNode] = self.parse_tokens(tokens, opening)
 
-        # avoid Sequence { Sequence { ... } } problem
-        parsed_body = self.compress_ast(self.parse_tokens(quote_block))
-        if len(parsed_body) == 1 and isinstance(parsed_body[0], Sequence):
-            return Quote(parsed_body[0])
-        else:
-            return Quote(Sequence(self.parse_tokens(quote_block)))
+        # a quotation can only contain funcalls, hence a single Sequence (or none, if it is empty)
+        return Quote(ast[0] if len(ast) > 0 else Sequence([]), opening.position())
 
 
-    def compress_ast(self, l: List[AstNode]):
-        """
-        Transforms a list of consecutive Funcalls into a Sequence
-        """
-        out = list()
-        temp = list()
-        for f in l:
-            if isinstance(f, Funcall):
-                temp.append(f)
-            else:
-                if len(temp) > 0:
-                    out.append(Sequence(temp))
-                    temp = []
-                out.append(f)
-
-        if len(temp) > 0:
-            out.append(Sequence(temp))
-        return out
-
     # def parse_declare(self, tokens: List[str]) -> List[str]:
     #     name = tokens.pop(0)
     #     type = self.parse_type_signature(tokens)
@@ -0,0 +1,114 @@
+import re
+from typing import *
+
+from forfait.parser.parser_exceptions import ZUnterminatedComment, ZUnopenedComment
+
+
+class Token:
+    """
+    A single word of source code, together with its position (1-based line and column)
+    in the original text.
+    """
+    __slots__ = ("text", "line", "column")
+
+    def __init__(self, text: str, line: int, column: int):
+        self.text = text
+        self.line = line
+        self.column = column
+
+    def position(self) -> str:
+        return f"{self.line}:{self.column}"
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f"Token({self.text!r}, {self.position()})"
+
+
+# One alternative per lexeme class; the order matters, as comment delimiters
+# must win over the generic "word" alternative.
+_LEXEME = re.compile(r"""
+      (?P<newline>\r\n|\n|\r)
+    | (?P<blank>[ \t\f\v]+)
+    | (?P<open_comment>\(\()
+    | (?P<close_comment>\)\))
+    | (?P<word>(?:(?!\(\(|\)\))\S)+)
+""", re.VERBOSE)
+
+
+def tokenize(code: str) -> Iterator[Token]:
+    """
+    Single pass over the source code, yielding one `Token` for each word.
+
+    Words are separated by any whitespace (spaces, tabs, LF, CR or CRLF line endings);
+    everything between `((` and `))` is a comment and is skipped. Comments may be nested.
+    """
+    line, line_start = 1, 0
+    open_comments: List[Token] = list()  # positions of the currently open `((`
+
+    for m in _LEXEME.finditer(code):
+        kind = m.lastgroup
+
+        if kind == "newline":
+            line, line_start = line + 1, m.end()
+        elif kind == "blank":
+            pass
+        elif kind == "open_comment":
+            open_comments.append(Token("((", line, m.start() - line_start + 1))
+        elif kind == "close_comment":
+            if len(open_comments) == 0:
+                raise ZUnopenedComment(
+                    f"Closing comment at {line}:{m.start() - line_start + 1} without opening parenthesis"
+                )
+            open_comments.pop()
+        elif len(open_comments) == 0:
+            yield Token(m.group(), line, m.start() - line_start + 1)
+
+    if len(open_comments) > 0:
+        raise ZUnterminatedComment(
+            f"Opening comment at {open_comments[-1].position()} without closing parenthesis"
+        )
+
+
+_COMMENT_OR_NEWLINE = re.compile(r"\(\(|\)\)|\r\n|\n|\r")
+
+
+def strip_comments(code: str) -> str:
+    """
+    Returns `code` with every (possibly nested) comment replaced by a blank.
+    Newlines inside comments are kept, so that line numbers do not change.
+    """
+    out: List[str] = list()
+    line, line_start = 1, 0
+    open_comments: List[Token] = list()
+    copy_from = 0  # start of the source chunk not yet copied to `out`
+
+    for m in _COMMENT_OR_NEWLINE.finditer(code):
+        delimiter = m.group()
+
+        if delimiter == "((":
+            if len(open_comments) == 0:
+                out.append(code[copy_from:m.start()])
+                out.append(" ")
+            open_comments.append(Token("((", line, m.start() - line_start + 1))
+        elif delimiter == "))":
+            if len(open_comments) == 0:
+                raise ZUnopenedComment(
+                    f"Closing comment at {line}:{m.start() - line_start + 1} without opening parenthesis"
+                )
+            open_comments.pop()
+            if len(open_comments) == 0:
+                copy_from = m.end()
+        else:
+            line, line_start = line + 1, m.end()
+            if len(open_comments) > 0:
+                out.append(delimiter)
+
+    if len(open_comments) > 0:
+        raise ZUnterminatedComment(
+            f"Opening comment at {open_comments[-1].position()} without closing parenthesis"
+        )
+
+    out.append(code[copy_from:])
+    return "".join(out)
@@ -11,4 +11,9 @@ class ZUnknownFunction(ZParserError):
 class ZNoEndToFuncDef(ZParserError):
     pass
 class ZForbiddenNestedFuncdef(ZParserError):
+    pass
+class ZUnterminatedComment(ZParserError):
+    pass
+
+class ZUnopenedComment(ZParserError):
     pass
\ No newline at end of file
@@ -0,0 +1,158 @@
+from typing import *
+
+from forfait.astnodes import Funcall, Number, Boolean, Quote
+from forfait.stdlibs.basic_semantics import OPERATIONS, evaluate
+from forfait.ztypes.ztypes import ZTBase
+
+
+# the most words run to evaluate a single word of the program (e.g. a loop)
+FUEL = 10_000
+
+# stack shufflers: funcname ~~> (number of values, positions of the values pushed back, from
+# the deepest one)
+SHUFFLERS: Dict[str, Tuple[int, Tuple[int, ...]]] = {
+    "dup": (1, (0, 0)), "drop": (1, ()), "swap": (2, (1, 0)), "over": (2, (0, 1, 0)),
+    "rot+": (3, (2, 0, 1)), "rot-": (3, (1, 2, 0)), "identity": (1, (0,)),
+}
+
+Constant = Union[Number, Boolean, Quote]
+
+
+class _Stuck(Exception):
+    """
+    The word can't be evaluated: an input isn't known, it has side effects, it would fail at
+    runtime, or it runs out of fuel.
+    """
+
+
+class PartialEvaluator:
+    """
+    Runs at compile time the words whose inputs are known literals, and replaces them with the
+    literals they leave on the stack.
+
+    The sequence is run on a stack of the literals (numbers, booleans and quotations) which
+    precede the current word: a word is evaluated if it only pops values of that stack, and
+    its results are pushed on it. Otherwise the stack is emitted as it is, followed by the word,
+    and it starts again empty. E.g. `3 dup *u8 1 +u8` is `10`, and `2 5 swap -u8` is `253` (2 - 5).
+
+    `if`, `eval`, `while` and `indexed-iter` are evaluated when their quotations (and condition
+    or bounds) are on the stack, by running the quotations on it: they are evaluated as a whole,
+    or not at all, so the words left in the program are always words of the program. Memory
+    accesses and `:s` are never evaluated.
+
+    The loops leave the stack as they find it (see their types), so evaluating a word never
+    gives more literals than the words of the quotations it runs.
+
+    :param fuel: the most words run to evaluate a word
+    """
+    def __init__(self, fuel: int=FUEL):
+        self.fuel = fuel
+        self.remaining = 0
+
+    def evaluate(self, funcs: List[Funcall]) -> List[Funcall]:
+        """
+        :return: `funcs` itself if nothing was evaluated
+        """
+        out: List[Funcall] = list()
+        stack: List[Constant] = list()
+        changed = False
+        for f in funcs:
+            if isinstance(f, (Number, Boolean, Quote)):
+                stack.append(f)
+                continue
+            try:
+                stack = self.run(f, stack)
+                changed = True
+            except _Stuck:
+                out.extend(stack)
+                out.append(f)
+                stack = list()
+        out.extend(stack)
+        return out if changed else funcs
+
+    def run(self, f: Funcall, stack: List[Constant]) -> List[Constant]:
+        """
+        :return: the stack after `f`
+        :raise _Stuck: if `f` can't be evaluated; `stack` is left as it is
+        """
+        self.remaining = self.fuel
+        if f.funcname in ("if", "eval", "while", "indexed-iter"):
+            # they may fail after changing the stack
+            out = stack[:]
+            self._step(f, out)
+            return out
+        self._step(f, stack)
+        return stack
+
+    ##################################################
+
+    def _run_body(self, quote: Constant, stack: List[Constant]):
+        if not isinstance(quote, Quote):
+            raise _Stuck()
+        for f in quote.body.funcs:
+            if isinstance(f, (Number, Boolean, Quote)):
+                stack.append(f)
+            else:
+                self._step(f, stack)
+
+    def _step(self, f: Funcall, stack: List[Constant]):
+        """
+        Runs `f` on `stack`; the simple words check their inputs before changing the stack.
+        """
+        self.remaining -= 1
+        if self.remaining < 0:
+            raise _Stuck()
+
+        funcname = f.funcname
+        if funcname in SHUFFLERS:
+            arity, positions = SHUFFLERS[funcname]
+            if len(stack) < arity:
+                raise _Stuck()
+            values = stack[len(stack) - arity:]
+            stack[len(stack) - arity:] = [values[i] for i in positions]
+        elif funcname in OPERATIONS:
+            arity = OPERATIONS[funcname].arity
+            operands = [_number(stack, depth) for depth in range(1, arity + 1)]
+            try:
+                value = evaluate(funcname, operands)
+            except ArithmeticError:
+                raise _Stuck()  # a division by zero, at runtime
+            stack[len(stack) - arity:] = [value]
+        elif funcname == "eval":
+            if len(stack) < 1:
+                raise _Stuck()
+            self._run_body(stack.pop(), stack)
+        elif funcname == "if":
+            if len(stack) < 3 or not isinstance(stack[-3], Boolean):
+                raise _Stuck()
+            else_, then_, cond = stack.pop(), stack.pop(), stack.pop()
+            self._run_body(then_ if cond.b else else_, stack)
+        elif funcname == "while":
+            if len(stack) < 2:
+                raise _Stuck()
+            body, cond = stack.pop(), stack.pop()
+            while True:
+                self._run_body(cond, stack)
+                if len(stack) < 1 or not isinstance(stack[-1], Boolean):
+                    raise _Stuck()
+                if not stack.pop().b:
+                    break
+                self._run_body(body, stack)
+        elif funcname == "indexed-iter":
+            if len(stack) < 3:
+                raise _Stuck()
+            body = stack.pop()
+            end, start = _number(stack, 1), _number(stack, 2)
+            del stack[-2:]
+            for i in range(start.n, end.n):
+                stack.append(Number(i % 256, ZTBase.U8))
+                self._run_body(body, stack)
+        else:
+            raise _Stuck()
+
+
+def _number(stack: List[Constant], depth: int) -> Number:
+    if len(stack) < depth or not isinstance(stack[-depth], Number):
+        raise _Stuck()
+    return stack[-depth]
+
@@ -0,0 +1,361 @@
+import re
+from typing import *
+
+from forfait.astnodes import AstNode, Funcall, Number, Boolean
+from forfait.my_exceptions import ZException
+from forfait.stdlibs.basic_semantics import OPERATIONS
+from forfait.stdlibs.basic_stdlib import STDLIB
+from forfait.ztypes.context import Context
+from forfait.ztypes.ztypes import ZTBase, ZTGeneric, ZTFunction, type_of_application_rowpoly
+
+
+class ZRuleError(ZException):
+    pass
+
+
+# the trie keys of literals; words are keyed by their name, quotations (whose name is None) by
+# nothing, so no pattern matches them
+NUMBER  = "#number"
+BOOLEAN = "#boolean"
+
+EMPTY = "ε"
+
+_VARIABLE = re.compile(r"([A-Z][A-Z0-9_]*)(?::(u8|u16|bool))?")
+_NUMBER   = re.compile(r"[0-9]+")
+
+
+def fold(funcname: str, *operands: Union[int, bool]) -> Union[int, bool]:
+    """
+    :param operands: from the top of the stack down
+    :return: the value the builtin `funcname` computes from the operands (see
+    `basic_semantics.OPERATIONS`)
+    """
+    return OPERATIONS[funcname].apply(*operands)
+
+# the functions the expressions of the rules may call
+FUNCTIONS: Dict[str, Callable] = {"fold": fold}
+
+
+def key(node: Funcall) -> Optional[str]:
+    if type(node) is Number:
+        return NUMBER
+    if type(node) is Boolean:
+        return BOOLEAN
+    return node.funcname
+
+
+class Rule:
+    """
+    A rewrite rule `pattern => replacement [where guard]`, compiled to a function which matches
+    a window of funcalls as long as the pattern.
+
+    A pattern is made of:
+        - words, e.g. `swap`, which match a call of that word;
+        - number literals and `true`/`false`, which match the same literal;
+        - variables, e.g. `N`, which match a number literal and are bound to its value; with a
+          type, e.g. `N:u16`, they match a literal of that type (`B:bool` matches a boolean).
+          A variable used twice must match the same value twice.
+    A replacement is `ε`, or made of words, literals, variables (the literal they matched) and
+    Python expressions in parentheses on the variables, e.g. `(N+M)%256`, whose value is a new
+    number (or boolean) literal. The guard is a Python expression on the variables too.
+    Expressions may call `fold(word, operand, ...)`, the value that the arithmetic builtin `word`
+    computes from the operands (from the top of the stack down), e.g. `N M +u8 => (fold('+u8', M, N))`.
+    The rule doesn't match if an expression raises an `ArithmeticError`.
+    """
+    def __init__(self, pattern: List[str], replacement: List[str], guard: Optional[str]=None, line: int=0):
+        self.pattern = pattern
+        self.replacement = replacement
+        self.guard = guard
+        self.line = line
+
+        self.keys: List[str] = list()   # of the trie, for each item of the pattern
+        self.words: List[str] = list()  # the new words of the replacement
+        self.match: Callable[[List[Funcall]], Optional[List[Union[AstNode, str, int, bool]]]] = self._compile()
+
+    def __str__(self):
+        guard = "" if self.guard is None else f" where {self.guard}"
+        return f"{' '.join(self.pattern)} => {' '.join(self.replacement) or EMPTY}{guard}"
+
+    def _error(self, message: str) -> ZRuleError:
+        return ZRuleError(f"{message}, in rule `{self}` (line {self.line})")
+
+    def _compile(self) -> Callable:
+        """
+        :return: the matcher of the rule: given the window, the list of its replacement items
+        (the nodes of the window which are kept, the names of new words and the values of new
+        literals), or None if the rule doesn't match.
+        The trie already checked the kind of each item of the window (word, number, boolean).
+        """
+        if len(self.pattern) == 0:
+            raise self._error("Empty pattern")
+
+        lines, variables = list(), dict()  # variable ~~> index of the window node it is bound to
+        for i, item in enumerate(self.pattern):
+            if (variable := _VARIABLE.fullmatch(item)) is not None:
+                name, typename = variable.groups()
+                is_bool = typename == "bool"
+                self.keys.append(BOOLEAN if is_bool else NUMBER)
+                value = f"w[{i}].{'b' if is_bool else 'n'}"
+                if name in variables:
+                    lines.append(f"if {value} != {name}: return None")
+                    continue
+                variables[name] = i
+                lines.append(f"{name} = {value}")
+                if typename is not None and not is_bool:
+                    lines.append(f"if w[{i}].type.right.types[-1] is not {typename.upper()}: return None")
+            elif _NUMBER.fullmatch(item) is not None:
+                self.keys.append(NUMBER)
+                lines.append(f"if w[{i}].n != {int(item)}: return None")
+            elif item in ("true", "false"):
+                self.keys.append(BOOLEAN)
+                lines.append(f"if w[{i}].b is not {item == 'true'}: return None")
+            elif item == EMPTY or item.startswith("("):
+                raise self._error(f"Unexpected {item} in the pattern")
+            else:
+                self.keys.append(item)
+
+        replacement = list()
+        for item in self.replacement:
+            if item in variables:
+                replacement.append(f"w[{variables[item]}]")
+            elif _NUMBER.fullmatch(item) is not None:
+                replacement.append(str(int(item)))
+            elif item in ("true", "false"):
+                replacement.append(str(item == "true"))
+            elif item.startswith("("):
+                replacement.append(self._expression(item, variables))
+            elif _VARIABLE.fullmatch(item) is not None:
+                raise self._error(f"Unbound variable {item}")
+            else:
+                self.words.append(item)
+                replacement.append(repr(item))
+
+        guard = [] if self.guard is None else [f"if not {self._expression(self.guard, variables)}: return None"]
+        source = "\n".join([
+            "def match(w):",
+            *(f"    {line}" for line in lines),
+            "    try:",
+            *(f"        {line}" for line in guard),
+            f"        return [{', '.join(replacement)}]",
+            "    except ArithmeticError:",
+            "        return None",
+        ])
+        namespace = {"__builtins__": {}, "ArithmeticError": ArithmeticError, "U8": ZTBase.U8, "U16": ZTBase.U16, **FUNCTIONS}
+        exec(compile(source, f"<rule at line {self.line}>", "exec"), namespace)
+        return namespace["match"]
+
+    def _expression(self, expression: str, variables: Dict[str, int]) -> str:
+        try:
+            names = compile(expression, "<rule>", "eval").co_names
+        except SyntaxError as e:
+            raise self._error(f"Invalid expression {expression}") from e
+        unbound = [name for name in names if name not in variables and name not in FUNCTIONS]
+        if len(unbound) > 0:
+            raise self._error(f"Unbound variables {', '.join(unbound)} in {expression}")
+        return f"({expression})"
+
+
+class _Trie:
+    __slots__ = ("children", "rules")
+
+    def __init__(self):
+        self.children: Dict[str, _Trie] = dict()
+        self.rules: List[Rule] = list()
+
+
+class RuleSet:
+    """
+    Rewrite rules, in a trie of their patterns reversed: walking it from the last funcall of a
+    sequence backwards gives every rule whose pattern ends there.
+    """
+    def __init__(self, rules: Iterable[Rule]=()):
+        self.rules: List[Rule] = list()
+        self.trie = _Trie()
+        self.max_length = 0  # of the patterns
+        for rule in rules:
+            self.add(rule)
+
+    def add(self, rule: Rule):
+        self.rules.append(rule)
+        node = self.trie
+        for k in reversed(rule.keys):
+            node = node.children.setdefault(k, _Trie())
+        node.rules.append(rule)
+        self.max_length = max(self.max_length, len(rule.keys))
+
+    def __add__(self, other: "RuleSet") -> "RuleSet":
+        return RuleSet(self.rules + other.rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __iter__(self) -> Iterator[Rule]:
+        return iter(self.rules)
+
+
+def load_rules(text: str, ctx: Context=STDLIB) -> RuleSet:
+    """
+    Parses and compiles rules, one per line (`#` starts a comment).
+    :param ctx: the words of the replacements must be builtins of the context
+    """
+    rules = RuleSet()
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        line = line.split("#", 1)[0].strip()
+        if line == "":
+            continue
+        if line.count("=>") != 1:
+            raise ZRuleError(f"Expected `pattern => replacement` at line {line_number}: {line}")
+
+        pattern, replacement = line.split("=>")
+        replacement, _, guard = replacement.partition(" where ")
+        rule = Rule(pattern.split(), _split_replacement(replacement, line_number), guard.strip() or None, line_number)
+        for funcname in rule.words:
+            if funcname not in ctx.builtin_types:
+                raise rule._error(f"Unknown builtin {funcname}")
+        rules.add(rule)
+    return rules
+
+
+def _split_replacement(replacement: str, line_number: int) -> List[str]:
+    # items are separated by spaces, except inside parentheses
+    items, depth, item = list(), 0, ""
+    for c in replacement.strip():
+        if c.isspace() and depth == 0:
+            if item != "":
+                items.append(item)
+            item = ""
+            continue
+        depth += {"(": 1, ")": -1}.get(c, 0)
+        if depth < 0:
+            raise ZRuleError(f"Unbalanced parentheses at line {line_number}")
+        item += c
+    if depth != 0:
+        raise ZRuleError(f"Unbalanced parentheses at line {line_number}")
+    if item != "":
+        items.append(item)
+    return [] if items == [EMPTY] else items
+
+
+##################################################
+
+class Rewriter:
+    """
+    Rewrites sequences of funcalls in a single left-to-right pass.
+
+    Each funcall is moved from the input to the output, then the rules whose pattern ends with
+    it are looked up in the trie, walking back at most as many funcalls as the longest pattern:
+    the longest pattern which matches wins, then the first rule in order. The matched funcalls
+    are removed from the output, and the replacement is put back in front of the input, so that
+    it is matched again along with what precedes it (e.g. after `1 2 3 +u8` becomes `1 5`,
+    a following `+u8` folds `1 5 +u8`). Each funcall is thus matched against a bounded window,
+    and rewriting takes linear time, as long as the replacement of a rule is shorter than (or
+    simpler than) its pattern: rules which undo each other loop forever.
+
+    The hand-written `PeepholeOptimization`s, if any, are tried after the rules at each position.
+    """
+    def __init__(self, rules: RuleSet, ctx: Context, peep_optimizations: Iterable=()):
+        self.rules = rules
+        self.peep_optimizations = list(peep_optimizations)
+        # where the new words of the replacements are typechecked
+        self.scratch = Context(ctx.builtin_types, ctx.builtin_schemes)
+
+    def rewrite(self, funcs: List[Funcall]) -> List[Funcall]:
+        out: List[Funcall] = list()
+        keys: List[Optional[str]] = list()
+        pending = funcs[::-1]
+        children = self.rules.trie.children
+
+        while len(pending) > 0:
+            node = pending.pop()
+            out.append(node)
+            keys.append(key(node))
+            # most funcalls don't end any pattern
+            if keys[-1] not in children and len(self.peep_optimizations) == 0:
+                continue
+
+            match = self._match(out, keys)
+            if match is not None:
+                start, replacement = match
+                del out[start:]
+                del keys[start:]
+                pending.extend(reversed(replacement))
+        return out
+
+    def _match(self, out: List[Funcall], keys: List[Optional[str]]) -> Optional[Tuple[int, List[Funcall]]]:
+        """
+        :return: where the match starts in `out`, and the funcalls replacing the matched ones
+        """
+        candidates, trie = list(), self.rules.trie
+        for i in range(len(out) - 1, max(-1, len(out) - 1 - self.rules.max_length), -1):
+            trie = trie.children.get(keys[i])
+            if trie is None:
+                break
+            if len(trie.rules) > 0:
+                candidates.append((i, trie.rules))
+
+        for start, rules in reversed(candidates):
+            window = out[start:]
+            for rule in rules:
+                replacement = rule.match(window)
+                if replacement is not None:
+                    return start, self._nodes(rule, replacement, window)
+
+        for optimization in self.peep_optimizations:
+            if len(out) >= optimization.arity and optimization.check(out[-optimization.arity:]):
+                stream = out[-optimization.arity:]
+                optimization.generator(stream)
+                return len(out) - optimization.arity, stream
+        return None
+
+    def _nodes(self, rule: Rule, replacement: List[Union[AstNode, str, int, bool]], window: List[Funcall]) -> List[Funcall]:
+        if all(isinstance(x, AstNode) for x in replacement):
+            return replacement
+
+        # a single literal takes the place of the value the matched funcalls leave on the stack
+        top = window[-1].type.right.types[-1] if len(window[-1].type.right.types) > 0 else None
+        if len(replacement) == 1 and isinstance(replacement[0], bool):
+            return [Boolean(replacement[0])]
+        if len(replacement) == 1 and isinstance(replacement[0], int) and top in (ZTBase.U8, ZTBase.U16):
+            return [Number(replacement[0], top)]
+        return self._typed(rule, replacement, window)
+
+    def _typed(self, rule: Rule, replacement: List[Union[AstNode, str, int, bool]], window: List[Funcall]) -> List[Funcall]:
+        """
+        :return: the replacement, where the types of the new words and literals are found by
+        unifying the type of the whole replacement with the type of the window
+        """
+        ctx = self.scratch
+        # the types of the nodes of the program get fresh generics, since they may share some
+        # (e.g. the row variable of consecutive funcalls) which are distinct stacks here
+        nodes, new, types = list(), list(), list()
+        for x in replacement:
+            if isinstance(x, AstNode):
+                nodes.append(x)
+                types.append(ctx.fresh_type(x.type))
+                continue
+            if isinstance(x, str):
+                node = Funcall(x, ctx.fresh_builtin_type(x))
+            elif isinstance(x, bool):
+                node = Boolean(x)
+            else:
+                node = Number(x, ZTGeneric("N"))
+            nodes.append(node)
+            new.append(node)
+            types.append(node.type)
+
+        try:
+            composition(types, ctx).unify(composition([ctx.fresh_type(node.type) for node in window], ctx), ctx)
+            for node in new:
+                node.finally_annotate_quotes(ctx)
+        except Exception as e:  # the occur check raises an `Exception`
+            raise ZRuleError(f"Rule `{rule}` (line {rule.line}) changes the type of `{' '.join(str(x) for x in window)}`") from e
+        finally:
+            ctx.clear_generic_subs()
+        return nodes
+
+
+def composition(types: List[ZTFunction], ctx: Context) -> ZTFunction:
+    t = types[0]
+    for other in types[1:]:
+        t = type_of_application_rowpoly(t, other, ctx)
+    return t
@@ -1,6 +1,7 @@
 # from typing import *
 
 from forfait.astnodes import Funcall, Sequence, Number, Quote, Boolean, ZConstant
+from forfait.stdlibs.basic_semantics import OPERATIONS, evaluate
 from forfait.ztypes.ztypes import ZType, ZTBase, ZTFunc, ZTGeneric, ZTFunction
 
 
@@ -37,7 +38,7 @@ class Phi(Register):
 ##############################
 
 def is_constant(x: Register | Funcall | Quote | Number):
-    return isinstance(x, Number)
+    return isinstance(x, Number | Boolean)
 
 class SSA_Instr:
     pass
@@ -85,38 +86,27 @@ class SSA_Binop(SSA_Instr):
         return is_constant(self.op1) and is_constant(self.op2)
 
     def calculate_constant(self) -> ZConstant:
-        # TODO: optimizations on boolean functions e.g. AND
-        assert isinstance(self.op1, Number)
-        assert isinstance(self.op2, Number)
-
-        arg1 = self.op1.n % (65536 if self.op1.type.right.types[-1] == ZTBase.U16 else 256)
-        arg2 = self.op2.n % (65536 if self.op2.type.right.types[-1] == ZTBase.U16 else 256)
-
-        funcname = self.func.funcname
-
-        if funcname in ["+u8", "+u16"]:
-            out = (arg1 + arg2) % (65536 if self.func.type.right.types[-1] == ZTBase.U16 else 256)
-        elif funcname in ["-u8", "-u16"]:
-            out = (arg1 - arg2) % (65536 if self.func.type.right.types[-1] == ZTBase.U16 else 256)
-        elif funcname in ["*u8", "*u16"]:
-            out = (arg1 * arg2) % (65536 if self.func.type.right.types[-1] == ZTBase.U16 else 256)
-        elif funcname in ["/u8", "/u16"]:
-            out = (arg1 // arg2) % (65536 if self.func.type.right.types[-1] == ZTBase.U16 else 256)
-        elif funcname in ["<=u8", "<=u16"]:
-            return Boolean(arg1 <= arg2)
-        elif funcname in ["<u8", "<u16"]:
-            return Boolean(arg1 < arg2)
-        elif funcname in [">=u8", ">=u16"]:
-            return Boolean(arg1 >= arg2)
-        elif funcname in [">u8", ">u16"]:
-            return Boolean(arg1 > arg2)
-        elif funcname in ["==u8", "==u16"]:
-            return Boolean(arg1 == arg2)
-        else:
-            # TODO: trasformarlo in logger.info()
-            raise Exception(f"Can't perform constant propagation on:\n\t{self}\nbecause this optimization is not implemented for function: {self.func}")
+        """
+        :raise ArithmeticError: if the operator fails at runtime (a division by zero)
+        """
+        # the top of the stack (op2) comes first
+        return evaluate(self.func.funcname, (self.op2, self.op1))
+
+
+class SSA_Unop(SSA_Instr):
+    def __init__(self, r: Register, func: Funcall, op):
+        self.r = r
+        self.func = func
+        self.op = op
+
+    def __str__(self):
+        return f"({self.r}) <- {self.func.funcname}({self.op})"
 
-        return Number(out, self.func.type.right.types[-1])
+    def defacto_constant(self) -> bool:
+        return is_constant(self.op)
+
+    def calculate_constant(self) -> ZConstant:
+        return evaluate(self.func.funcname, (self.op,))
 
 
 class SSA_Jump_Cond(SSA_Instr):
@@ -147,6 +137,7 @@ class CFG:
 
         self.instructions: list[SSA_Instr] = list()
         self.final_vstack: list[Register] = list()
+        self.phis: list[Phi] = list()  # r1 comes from entering_cfgs[0], r2 from entering_cfgs[1]
 
         self.entering_cfgs: list["CFG"] = list()
         self.exiting_cfgs: list["CFG"] = list()
@@ -230,9 +221,17 @@ def most_concrete_type(t1: ZType, t2: ZType):
 
 mcu = most_concrete_type
 
+# builtins which are turned into a SSA_Binop, or a SSA_Unop (`u16` is a SSA_Cast)
+BINOPS = [funcname for funcname, operation in OPERATIONS.items() if operation.arity == 2]
+UNOPS = [funcname for funcname, operation in OPERATIONS.items() if operation.arity == 1 and funcname != "u16"]
+
 VStack = list[Register]
 
 def SSA_ification(astnode: Sequence, start_vstack:VStack=None) -> tuple[CFG, VStack]:
+    start_cfg, _, vstack = SSA_ification_with_exit(astnode, start_vstack)
+    return start_cfg, vstack
+
+def SSA_ification_with_exit(astnode: Sequence, start_vstack:VStack=None) -> tuple[CFG, CFG, VStack]:
     """
     Given an `Astnode` `Sequence`, calculates its SSA representation.
 
@@ -245,7 +244,8 @@ def SSA_ification(astnode: Sequence, start_vstack:VStack=None) -> tuple[CFG, VSt
     :param astnode: `Astnode` to transform
     :param start_vstack: Used in nested calls of this function: when a block requires some elements already on
     the stack, they will be found here.
-    :return:
+    :return: the first block, the last block (the one where the execution ends) and the final vstack.
+    Each block ends with a jump to the next one, except the last block.
     """
     assert isinstance(astnode, Sequence), "sissify only for sequences atm"
 
@@ -312,6 +312,19 @@ def SSA_ification(astnode: Sequence, start_vstack:VStack=None) -> tuple[CFG, VSt
                     vstack.append(reg_new_snd)
                     vstack.append(reg_new_fst)
 
+                case "over":
+                    reg = Register(funcall.type.right.types[-1])
+
+                    program.append( SSA_Copy(reg, vstack[-2]) )
+                    vstack.append( reg )
+
+                case "rot-":
+                    # registers are never overwritten, so a permutation needs no copy
+                    vstack[-3], vstack[-2], vstack[-1] = vstack[-2], vstack[-1], vstack[-3]
+
+                case "rot+":
+                    vstack[-3], vstack[-2], vstack[-1] = vstack[-1], vstack[-3], vstack[-2]
+
                 case "u16":
                     reg = Register(funcall.type.right.types[-1]) # ie. u16
                     program.append( SSA_Cast(reg, vstack.pop(), funcall.type.right.types[-1]))
@@ -336,8 +349,8 @@ def SSA_ification(astnode: Sequence, start_vstack:VStack=None) -> tuple[CFG, VSt
 
                     # visit `then` and `else` quotations; for each, build instructions and vstack
                     import copy
-                    then_cfg, then_vstack = SSA_ification(then_reg.quote.body, copy.copy(vstack))
-                    else_cfg, else_vstack = SSA_ification(else_reg.quote.body, copy.copy(vstack))
+                    then_cfg, then_exit, then_vstack = SSA_ification_with_exit(then_reg.quote.body, copy.copy(vstack))
+                    else_cfg, else_exit, else_vstack = SSA_ification_with_exit(else_reg.quote.body, copy.copy(vstack))
 
                     # add, as last instruction to current CFG, the jump SSA instruction
                     program.append(SSA_Jump_Cond(cond_reg, then_cfg, else_cfg))
@@ -355,10 +368,12 @@ def SSA_ification(astnode: Sequence, start_vstack:VStack=None) -> tuple[CFG, VSt
 
                     # create new CFG
                     curr_cfg = CFG()
-                    curr_cfg.add_entering_cfg(then_cfg)
-                    curr_cfg.add_entering_cfg(else_cfg)
-                    then_cfg.add_exiting_cfg(curr_cfg)
-                    else_cfg.add_exiting_cfg(curr_cfg)
+                    curr_cfg.add_entering_cfg(then_exit)
+                    curr_cfg.add_entering_cfg(else_exit)
+                    then_exit.add_exiting_cfg(curr_cfg)
+                    else_exit.add_exiting_cfg(curr_cfg)
+                    then_exit.instructions.append(SSA_Jump_Uncond(curr_cfg))
+                    else_exit.instructions.append(SSA_Jump_Uncond(curr_cfg))
 
                     # create phi nodes in new CFG
                     assert len(then_vstack) == len(else_vstack), "if branches return different num of args!"
@@ -377,6 +392,7 @@ def SSA_ification(astnode: Sequence, start_vstack:VStack=None) -> tuple[CFG, VSt
                             # vstack.append(Phi(then_candidate_type, r1, r2))
                             assert r1.type == r2.type, f"{r1}, {r2}"
                         vstack.append(Phi(r1.type, r1, r2))
+                        curr_cfg.phis.append(vstack[-1])
 
                 case "eval":
                     import copy
@@ -386,9 +402,10 @@ def SSA_ification(astnode: Sequence, start_vstack:VStack=None) -> tuple[CFG, VSt
                     assert isinstance(quote_reg, RegisterQuote)
 
                     # evaluates a new cfg for inside of quote
-                    quote_body_cfg, new_vstack = SSA_ification(quote_reg.quote.body, copy.copy(vstack))
+                    quote_body_cfg, quote_body_exit, new_vstack = SSA_ification_with_exit(quote_reg.quote.body, copy.copy(vstack))
 
                     # end current block
+                    program.append(SSA_Jump_Uncond(quote_body_cfg))
                     curr_cfg.instructions += program
                     curr_cfg.final_vstack = vstack
                     program = list()
@@ -400,18 +417,22 @@ def SSA_ification(astnode: Sequence, start_vstack:VStack=None) -> tuple[CFG, VSt
 
                     # new block
                     curr_cfg = CFG()
-                    curr_cfg.add_entering_cfg(quote_body_cfg)
-                    quote_body_cfg.add_exiting_cfg(curr_cfg)
+                    curr_cfg.add_entering_cfg(quote_body_exit)
+                    quote_body_exit.add_exiting_cfg(curr_cfg)
+                    quote_body_exit.instructions.append(SSA_Jump_Uncond(curr_cfg))
 
 
                 case _:
-                    if funcall.funcname in ["+u8", "-u8", "*u8", "/u8", "+u16", "-u16", "*u16", "/u16",
-                                            "<u8", "<=u8", ">u8", ">=u8", "<u16", "<=u16", ">u16", ">=u16"]:
+                    if funcall.funcname in BINOPS:
                         reg = Register(funcall.type.right.types[-1])
                         snd = vstack.pop()
                         fst = vstack.pop()
                         program.append(SSA_Binop(reg, funcall, fst, snd))
                         vstack.append(reg)
+                    elif funcall.funcname in UNOPS:
+                        reg = Register(funcall.type.right.types[-1])
+                        program.append(SSA_Unop(reg, funcall, vstack.pop()))
+                        vstack.append(reg)
                     else:
                         raise Exception(f"Not yet implemented: SSAfication of funcall {funcall}")
 
@@ -421,7 +442,7 @@ def SSA_ification(astnode: Sequence, start_vstack:VStack=None) -> tuple[CFG, VSt
     curr_cfg.instructions += program
     curr_cfg.final_vstack = vstack
 
-    return start_cfg, vstack
+    return start_cfg, curr_cfg, vstack
 
 
 def constant_propagation(start_cfg: CFG) -> CFG:
@@ -456,14 +477,33 @@ def constant_propagation_single_cfg(cfg: CFG, subs: dict[Register, Funcall]) ->
             if instr.op2 in subs:
                 instr.op2 = subs[instr.op2]
 
+            if instr.defacto_constant():
+                try:
+                    const = instr.calculate_constant()
+                except ArithmeticError:
+                    continue # it is left to fail at runtime
+                cfg.instructions[i] = SSA_Constant(instr.r, const)
+                subs[instr.r] = const
+
+        elif isinstance(instr, SSA_Unop):
+            if instr.op in subs:
+                instr.op = subs[instr.op]
+
             if instr.defacto_constant():
                 const = instr.calculate_constant()
                 cfg.instructions[i] = SSA_Constant(instr.r, const)
                 subs[instr.r] = const
 
+        elif isinstance(instr, SSA_Cast):
+            if instr.old_reg in subs:
+                const = evaluate("u16", (subs[instr.old_reg],))
+                cfg.instructions[i] = SSA_Constant(instr.new_reg, const)
+                subs[instr.new_reg] = const
+
         elif isinstance(instr, SSA_Copy):
             if instr.src_reg in subs:
                 cfg.instructions[i] = SSA_Constant(instr.r, subs[instr.src_reg])
+                subs[instr.r] = subs[instr.src_reg]
 
         else:
             pass # TODO
@@ -0,0 +1,34 @@
+## The peephole rules of the stdlib, see `forfait.peephole.Rule` for the syntax.
+## As in `Interpreter`, `N M -u8` is M - N and `N M /u8` is M // N.
+from forfait.stdlibs.basic_semantics import OPERATIONS
+
+BASIC_RULES = """
+# F(F^-1(x)) = x
+swap swap => ε
+dup drop  => ε
+over drop => ε
+rot+ rot- => ε
+rot- rot+ => ε
+rot+ rot+ => rot-
+rot- rot- => rot+
+++u8 --u8   => ε
+--u8 ++u8   => ε
+++u16 --u16 => ε
+--u16 ++u16 => ε
+
+# shufflers on literals
+N M swap => M N
+N M over => N M N
+N dup    => N N
+N drop   => ε
+B:bool dup  => B B
+B:bool drop => ε
+"""
+
+# constant folding: the arithmetic, comparison and cast builtins applied to literals, e.g.
+# `N M +u8 => (fold('+u8', M, N))`, with the semantics of `basic_semantics.OPERATIONS`
+_OPERANDS = ["N", "M"]
+BASIC_RULES += "\n".join(
+    f"{' '.join(_OPERANDS[:op.arity])} {funcname} => (fold('{funcname}', {', '.join(reversed(_OPERANDS[:op.arity]))}))"
+    for funcname, op in OPERATIONS.items()
+) + "\n"
@@ -0,0 +1,67 @@
+## The semantics of the arithmetic builtins of the stdlib, shared by the interpreters, the
+## optimizer and the constant propagation on the SSA form. As in `Interpreter`, binary
+## operators are applied to (top, second): `N M -u8` is M - N and `N M >u8` is N > M.
+from typing import *
+
+from forfait.astnodes import Number, Boolean, ZConstant
+from forfait.ztypes.ztypes import ZTBase
+
+# funcname ~~> (operator, modulo)
+ARITHMETIC: Dict[str, Tuple[Callable[[int, int], int], int]] = {
+    "+u8":  (lambda a, b: a + b, 256),   "-u8":  (lambda a, b: a - b, 256),
+    "*u8":  (lambda a, b: a * b, 256),   "/u8":  (lambda a, b: a // b, 256),
+    "+u16": (lambda a, b: a + b, 65536), "-u16": (lambda a, b: a - b, 65536),
+    "*u16": (lambda a, b: a * b, 65536), "/u16": (lambda a, b: a // b, 65536),
+}
+COMPARISONS: Dict[str, Callable[[int, int], bool]] = {
+    ">u8":  lambda a, b: a < b,  "<u8":  lambda a, b: a > b,
+    ">=u8": lambda a, b: a <= b, "<=u8": lambda a, b: a >= b,
+    "==u8": lambda a, b: a == b, "!=u8": lambda a, b: a != b,
+}
+# funcname ~~> (increment, modulo)
+INCREMENTS: Dict[str, Tuple[int, int]] = {
+    "++u8": (1, 256), "--u8": (-1, 256), "++u16": (1, 65536), "--u16": (-1, 65536),
+}
+
+
+class Operation(NamedTuple):
+    """
+    A builtin computing a value from the values on top of the stack.
+    """
+    arity: int
+    apply: Callable[..., Union[int, bool]]  # of the operands from the top of the stack down
+    type: ZTBase                            # of the result
+
+
+def _arithmetic(op: Callable[[int, int], int], modulo: int) -> Callable[[int, int], int]:
+    # a division by zero raises a ZeroDivisionError, as it does at runtime
+    return lambda top, second: op(top % modulo, second % modulo) % modulo
+
+def _comparison(op: Callable[[int, int], bool]) -> Callable[[int, int], bool]:
+    return lambda top, second: op(top % 256, second % 256)
+
+def _increment(delta: int, modulo: int) -> Callable[[int], int]:
+    return lambda top: (top + delta) % modulo
+
+def _type_of(modulo: int) -> ZTBase:
+    return ZTBase.U8 if modulo == 256 else ZTBase.U16
+
+
+# the table of the constant evaluation: every arithmetic, comparison and cast builtin
+OPERATIONS: Dict[str, Operation] = {
+    **{funcname: Operation(2, _arithmetic(op, modulo), _type_of(modulo)) for funcname, (op, modulo) in ARITHMETIC.items()},
+    **{funcname: Operation(2, _comparison(op), ZTBase.BOOL) for funcname, op in COMPARISONS.items()},
+    **{funcname: Operation(1, _increment(delta, modulo), _type_of(modulo)) for funcname, (delta, modulo) in INCREMENTS.items()},
+    "u16": Operation(1, lambda top: top, ZTBase.U16),
+}
+
+
+def evaluate(funcname: str, operands: Iterable[ZConstant]) -> ZConstant:
+    """
+    :param operands: literals, from the top of the stack down
+    :return: the literal computed by the builtin `funcname`
+    :raise ArithmeticError: if the builtin fails at runtime
+    """
+    operation = OPERATIONS[funcname]
+    value = operation.apply(*(x.b if isinstance(x, Boolean) else x.n for x in operands))
+    return Boolean(value) if operation.type == ZTBase.BOOL else Number(value, operation.type)
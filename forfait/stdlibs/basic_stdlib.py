@@ -5,9 +5,11 @@
 from forfait.ztypes.context import Context
 from forfait.ztypes.ztypes import *
 
-def get_stdlib():
-    import copy
-    return copy.deepcopy(STDLIB)
+def get_stdlib() -> Context:
+    """
+    A fresh Context for a new compilation; the builtins are shared with STDLIB, not copied.
+    """
+    return STDLIB.overlay()
 
 ##############################################################
 
@@ -227,3 +229,7 @@ STDLIB.builtin_types["identity"] = ZTFuncHelper(
     S, [T],
     S, [T]
 )
+
+##############################################################
+
+STDLIB.freeze()
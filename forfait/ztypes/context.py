@@ -1,65 +1,153 @@
-import copy
 import logging
+from types import MappingProxyType
 # logging.basicConfig(level=logging.DEBUG, format="[%(levelname)s]:%(message)s")
 
 from typing import *
 from typing import Dict, Set, Tuple, List
 
-from forfait.data_structures.graph import Graph
-from forfait.utils import Unreachable
-from forfait.ztypes.ztypes import ZTGeneric, ZType, ZTFunction, ZTRowGeneric, ZTRow
+from forfait.data_structures.graph import IncrementalGraph, DependencyGraphException
+
+from forfait.ztypes.scheme import TypeScheme
+from forfait.ztypes.ztypes import ZTGeneric, ZType, ZTFunction, ZTRowGeneric, ZTRow, ZTComposite, ZTBase
 
 
 
 class Context:
-    def __init__(self):
-        self.builtin_types: Dict[str, ZTFunction] = dict()
+    def __init__(self,
+                 builtin_types: Optional[Mapping[str, ZTFunction]]=None,
+                 builtin_schemes: Optional[Mapping[str, TypeScheme]]=None):
+        # the table of builtins (and of their compiled type schemes) may be shared among many
+        # contexts (see `overlay`), and in that case it is read-only; everything else is private
+        # to each context
+        self.builtin_types: Mapping[str, ZTFunction] = dict() if builtin_types is None else builtin_types
+        self.builtin_schemes: Mapping[str, TypeScheme] = dict() if builtin_schemes is None else builtin_schemes
         self.user_types: Dict[str, ZTFunction] = dict()
-
-        self.generic_subs: Dict[int, ZType] = dict()
-        self.generic_map: Dict[int, ZTGeneric] = dict()
+        self.user_schemes: Dict[str, TypeScheme] = dict()
+
+        # substitution store: a union-find forest over generics (by counter), where each
+        # equivalence class may be bound to a non-generic type
+        self.parent: Dict[int, ZTGeneric] = dict()          # generic ~~> its parent in the forest
+        self.rank: Dict[int, int] = dict()                  # root ~~> upper bound on tree height
+        self.representative: Dict[int, ZTGeneric] = dict()  # root ~~> generic standing for the class
+        self.binding: Dict[int, ZType] = dict()             # root ~~> type of the whole class
+        # root ==> roots of the generics in its binding; being acyclic is the occur check
+        self.dependencies: IncrementalGraph = IncrementalGraph()
+        # bumped at each change of the store; `resolve` memoizes its results until the next one
+        self.generation: int = 0
+        self._resolved: Dict[ZType, ZType] = dict()
+        self._resolved_generation: int = 0
         self.inner_type: Dict["Funcall", ZTFunction] = dict()
 
+    def freeze(self) -> "Context":
+        """
+        Makes the table of builtins read-only, so that it can be shared by `overlay`s.
+        """
+        self.builtin_types = MappingProxyType(dict(self.builtin_types))
+        self.builtin_schemes = MappingProxyType(
+            {funcname: TypeScheme(t) for funcname, t in self.builtin_types.items()}
+        )
+        return self
+
+    def overlay(self) -> "Context":
+        """
+        A new, empty Context sharing (without copying) the frozen builtins of this one.
+        """
+        assert isinstance(self.builtin_types, MappingProxyType), "Only frozen contexts can be overlaid"
+        return Context(self.builtin_types, self.builtin_schemes)
+
     def reset(self):
         self.clear_generic_subs()
         self.inner_type = dict()
         self.user_types = dict()
+        self.user_schemes = dict()
+
 
+    ###############################################################
+    # dealing with generics
 
-    def _ordered_types(self, l: list["Funcall"]) -> list[ZType]:
+    def find(self, generic: ZTGeneric) -> ZTGeneric:
         """
-        only for debug and testing, return types of single funcalls
-        :return:
+        Root of the equivalence class of `generic`, with path compression.
         """
-        return [funcall.typeof(None) for funcall in l]
+        root = generic
+        while root.counter in self.parent:
+            root = self.parent[root.counter]
 
+        while generic.counter in self.parent:
+            next_generic = self.parent[generic.counter]
+            self.parent[generic.counter] = root
+            generic = next_generic
 
-    ###############################################################
-    # dealing with generics
+        return root
 
-    def _store_new_sub(self, generic: ZTGeneric, new: ZType):
+
+    def _union(self, generic: ZTGeneric, other: ZTGeneric):
+        """
+        Merges the classes of the two (distinct) roots. The class keeps the representative of
+        `other`, i.e. after `'A ~~> 'B` the type variable 'A is shown as 'B.
         """
-        This must be the only way to access self.generic_subs.
+        generic_binding, other_binding = self.binding.get(generic.counter), self.binding.get(other.counter)
+        representative = self.representative.get(other.counter, other)
 
-        :param generic:
-        :param new:
-        :return:
+        # union by rank
+        if self.rank.get(generic.counter, 0) > self.rank.get(other.counter, 0):
+            root, child = generic, other
+        else:
+            root, child = other, generic
+            if self.rank.get(generic.counter, 0) == self.rank.get(other.counter, 0):
+                self.rank[other.counter] = self.rank.get(other.counter, 0) + 1
+
+        try:
+            self.dependencies.merge_nodes(child.counter, root.counter)
+        except DependencyGraphException as e:
+            raise Exception(
+                f"OCCUR CHECK FAIL\n" +
+                f"The candidate substitution:\n" +
+                f"\t{self.resolve(generic)} ~~> {self.resolve(other)}\n" +
+                f"fails the occur check.\n{e}"
+            )
+
+        self.parent[child.counter] = root
+        self.generation += 1
+        self.representative.pop(child.counter, None)
+        self.representative[root.counter] = representative
+        self.binding.pop(generic.counter, None)
+        self.binding.pop(other.counter, None)
+
+        if other_binding is not None:
+            self.binding[root.counter] = other_binding
+            if generic_binding is not None:
+                generic_binding.unify(other_binding, self)
+        elif generic_binding is not None:
+            self.binding[root.counter] = generic_binding
+
+
+    def _bind(self, root: ZTGeneric, t: ZType):
         """
-        if generic.counter in self.generic_subs:
-            if not self.generic_subs[generic.counter].structural_eq(new):
-                assert generic.counter not in self.generic_subs
-            return
-        if generic.counter in self.generic_map:
-            if not self.generic_map[generic.counter].structural_eq(generic):
-                assert generic.counter not in self.generic_map
-            return
+        Binds the class of the (unbound) `root` to the type `t`, after the occur check.
+        """
+        generics_inside: Set[ZTGeneric] = set()
+        t.find_generics_inside(generics_inside)
 
-        self.generic_subs[generic.counter] = new
-        self.generic_map[generic.counter] = generic
+        try:
+            for g in generics_inside:
+                self.dependencies.add_edge(root.counter, self.find(g).counter)
+        except DependencyGraphException as e:
+            raise Exception(
+                f"OCCUR CHECK FAIL\n" +
+                f"The new candidate substitution:\n" +
+                f"\t{root} ~~> {self.resolve(t)}\n" +
+                f"fails the occur check.\n{e}"
+            )
+
+        self.binding[root.counter] = t
+        self.generation += 1
+        self.representative.setdefault(root.counter, root)
 
 
     def a_sub_for_generic_already_exists(self, generic: ZTGeneric) -> bool:
-        return generic.counter in self.generic_subs
+        root = self.find(generic)
+        return root.counter in self.binding or self.representative.get(root.counter, root).counter != generic.counter
 
 
     def rhs_of_sub(self, generic: ZTGeneric) -> ZType:
@@ -71,12 +159,64 @@ class Context:
         """
         if not self.a_sub_for_generic_already_exists(generic):
             raise KeyError(f"{self}\nNo generic named {generic} found in ctx")
-        return self.generic_subs[generic.counter]
+        return self.resolve(generic)
+
+
+    def resolve(self, t: ZType) -> ZType:
+        """
+        Lazily applies all the substitutions in the store to `t`, in a single traversal.
+
+        Results are memoized (types are hash-consed, so shared subtrees are the same object)
+        and stay valid as long as the store does not change, i.e. for the current `generation`;
+        each subtree is thus resolved at most once per generation.
 
+        :return: a new type, where each generic is replaced by the type of its class (or by the
+        representative of the class, if the class is not bound to any type)
+        """
+        if self._resolved_generation != self.generation:
+            self._resolved = dict()
+            self._resolved_generation = self.generation
+        return self._resolve(t)
+
+    def _resolve(self, t: ZType) -> ZType:
+        if isinstance(t, ZTBase):
+            return t
+
+        resolved = self._resolved.get(t)
+        if resolved is not None:
+            return resolved
+
+        if isinstance(t, ZTGeneric):  # includes ZTRowGeneric
+            root = self.find(t)
+            if root.counter in self.binding:
+                resolved = self._resolve(self.binding[root.counter])
+            else:
+                resolved = self.representative.get(root.counter, root)
+
+        # when no subtree changes, `t` itself is the result (and nothing is rebuilt)
+        elif isinstance(t, ZTRow):
+            row_var = self._resolve(t.row_var)
+            types   = tuple(self._resolve(x) for x in t.types)
+            if isinstance(row_var, ZTRow):
+                resolved = ZTRow(row_var.row_var, row_var.types + types)
+            elif row_var is t.row_var and all(x is y for x, y in zip(types, t.types)):
+                resolved = t
+            else:
+                resolved = ZTRow(row_var, types)
+
+        elif isinstance(t, ZTFunction):
+            left, right = self._resolve(t.left), self._resolve(t.right)
+            resolved = t if left is t.left and right is t.right else ZTFunction(left, right)
+
+        elif isinstance(t, ZTComposite):
+            inner = [self._resolve(x) for x in t.inner_types]
+            resolved = t if all(x is y for x, y in zip(inner, t.inner_types)) else ZTComposite(t.typename, inner)
+
+        else:
+            return t
 
-    def generic_subs_items(self) -> Generator[tuple[ZTGeneric, ZType], None, None]:
-        for k, v in self.generic_subs.items():
-            yield self.generic_map[k], v
+        self._resolved[t] = resolved
+        return resolved
 
 
     def clear_generic_subs(self):
@@ -86,32 +226,37 @@ class Context:
         It finalizes the types of the funcalls saved in the Context (i.e. cuts out the
         unnecessary type arguments) and then clears the substitution equations.
         """
-        for k,v in self.generic_subs_items():
-            for funcall, ftype in self.inner_type.items():
-                self.inner_type[funcall] = ftype.substitute_generic(k,v)
+        for funcall, ftype in self.inner_type.items():
+            self.inner_type[funcall] = self.resolve(ftype)
 
         self._clear_all_generic_data()
 
 
     def _clear_all_generic_data(self):
-        self.generic_subs = dict()
-        self.generic_map = dict()
+        self.parent = dict()
+        self.rank = dict()
+        self.representative = dict()
+        self.binding = dict()
+        self.dependencies = IncrementalGraph()
+        self.generation += 1
 
 
     ####################################################################
 
     def fresh_type(self, t: ZTFunction) -> ZTFunction:
-        t = copy.deepcopy(t)
+        """
+        A copy of `t` where every generic is replaced by a fresh one.
+        """
+        return TypeScheme(t).instantiate()
 
-        for old_generic in self._find_generics_inside(t):
-            if isinstance(old_generic, ZTRowGeneric):
-                t = t.substitute_generic(old_generic, ZTRowGeneric(old_generic.human_name))
-            elif isinstance(old_generic, ZTGeneric):
-                t = t.substitute_generic(old_generic, ZTGeneric(old_generic.human_name))
-            else:
-                raise Unreachable()
 
-        return t
+    def _scheme_of(self, schemes: MutableMapping[str, TypeScheme], types: Mapping[str, ZTFunction], funcname: str) -> TypeScheme:
+        # a scheme is (re)compiled when missing, or when its type was overwritten in `types`
+        scheme = schemes.get(funcname)
+        if scheme is None or scheme.source is not types[funcname]:
+            scheme = TypeScheme(types[funcname])
+            schemes[funcname] = scheme
+        return scheme
 
 
     def fresh_builtin_type(self, funcname: str) -> ZTFunction:
@@ -121,13 +266,16 @@ class Context:
         :param funcname: function name
         :return: type of the function
         """
-        # deepcopy needed, otherwise you may have the same
+        # fresh generics are needed, otherwise you may have the same
         #   identity :: ''S T -> ''S T
         # everywhere in your program, and the type inferences on T would propagate
         # in every occurrence of identity
-        t = self.fresh_type(self.builtin_types[funcname])
+        if isinstance(self.builtin_schemes, MappingProxyType):
+            t = self.builtin_schemes[funcname].instantiate()
+        else:
+            t = self._scheme_of(self.builtin_schemes, self.builtin_types, funcname).instantiate()
 
-        logging.debug(f"Generated fresh type signature for builtin {funcname}: {t}")
+        logging.debug("Generated fresh type signature for builtin %s: %s", funcname, t)
 
         return t
 
@@ -135,129 +283,48 @@ class Context:
     def get_userdefined_type(self, funcname: str):
         """
         :param funcname: name of user-defined function
-        :return: type
+        :return: type, with fresh generics
         """
-        # TODO: non va bene. con il passaggio a type.eq() qua dovrai _costruire_ un tipo nuovo
-        return copy.deepcopy(self.user_types[funcname])
+        return self._scheme_of(self.user_schemes, self.user_types, funcname).instantiate()
 
 
     def add_generic_sub(self, generic_type: ZTGeneric, new_type: ZType):
         """
-        Adds a new substitution equation to the context. It may modify the existing
-        substitutions, similarly to Algorithm W.
+        Adds a new substitution equation to the context, similarly to Algorithm W.
+        The existing substitutions are not rewritten: they are applied lazily by `resolve`.
         :param generic_type:
         :param new_type:
         :return:
         """
-        logging.debug(f"Beginning insert in CTX of equation: {generic_type} ~~> {new_type}")
-
-        # elision of obvious equation T = T
-        if generic_type.structural_eq(new_type):
-            logging.debug(f"  Equation was trivial")
-            return
-
-        # elision of obvious equation 'T = 'T or ''S = ''S
-        if isinstance(new_type, ZTGeneric) and generic_type.counter == new_type.counter:
-            logging.debug(f"  Equation was trivial")
-            return
-
-        # If ''S (a RowGeneric) is going to be sostituted by [''S] (a Row with the same RowGeneric and nothing else)
-        # then you are de facto making a trivial substitution ''S = ''S
-        if isinstance(generic_type, ZTRowGeneric) and (
-                isinstance(new_type, ZTRow) and len(new_type.types)==0 and new_type.row_var.counter == generic_type.counter
-        ):
-            logging.debug(f"  Equation was trivial")
-            return
-
-        # occur check
-        if generic_type in self._find_generics_inside(new_type):
-            raise Exception(
-                f"OCCUR CHECK FAIL\n" +
-                f"The new candidate substitution:\n" +
-                f"\t{generic_type} ~~> {new_type}\n" +
-                "fails the occur check."
-            )
+        logging.debug("Beginning insert in CTX of equation: %s ~~> %s", generic_type, new_type)
 
+        # If ''S (a RowGeneric) is going to be sostituted by [''R] (a Row with a RowGeneric and nothing else)
+        # then you are de facto making the substitution ''S = ''R
+        if isinstance(new_type, ZTRow) and len(new_type.types) == 0:
+            new_type = new_type.row_var
 
-        # if genericvar already in the dict, unify the old substitution with the
-        # new; if the types are compatible, the unification will be ok.
-        if self.a_sub_for_generic_already_exists(generic_type):
-            logging.debug(f"  Sub with same LHS already in ctx: " +
-                          f"{self.generic_subs[generic_type.counter]} ~~> {self.rhs_of_sub(generic_type)}")
+        root = self.find(generic_type)
 
-            temp_ctx = Context()
-            old = self.rhs_of_sub(generic_type) # self.generic_subs[generic_type]
-            old.unify(new_type, temp_ctx)
+        if isinstance(new_type, ZTGeneric):
+            new_root = self.find(new_type)
 
-            logging.debug("  Unified old and new RHS;")
+            # elision of obvious equation 'T = 'T or ''S = ''S
+            if root.counter == new_root.counter:
+                logging.debug(f"  Equation was trivial")
+                return
 
-            # the newly-generated sub equations are applied to the subs already in ctx
-            for key, value in temp_ctx.generic_subs_items():
-                key, value = self.sub_in_subs(key, value)
-                if key.counter not in self.generic_subs:
-                    self._store_new_sub(key, value)
+            self._union(root, new_root)
 
-            logging.debug(f"Ended insertion of {generic_type} ~~> {new_type} in CTX")
+        # if genericvar already has a type, unify the old type with the new;
+        # if the types are compatible, the unification will be ok.
+        elif root.counter in self.binding:
+            logging.debug("  Sub with same LHS already in ctx: %s ~~> %s", generic_type, self.binding[root.counter])
+            self.binding[root.counter].unify(new_type, self)
 
         else:
-            # in each already-known sub in ctx, apply substitution described by the new sub
-            logging.debug(f"  LHS was not found in ctx, proceding")
-            generic_type, new_type = self.sub_in_subs(generic_type, new_type)
-            self._store_new_sub(generic_type, new_type)  # self.generic_subs[generic_type] = new_type
-            logging.debug(f"Ended insertion of {generic_type} ~~> {new_type} in CTX")
+            self._bind(root, new_type)
 
-
-
-    def sub_in_subs(self, generic: ZTGeneric, new: ZType) -> tuple[ZTGeneric, ZType]:
-        """
-        For each sub (A ~~> B) in Context, apply in B the substitution in the argument.
-        Performs all the needed occur check after the substitution is applied.
-        :param generic:
-        :param new:
-        :return:
-        """
-        for key, value in self.generic_subs_items():
-            __old_sub_only_for_debug = copy.deepcopy(value)
-
-            # update old sub
-            self._store_new_sub(
-                key,
-                value.substitute_generic(generic, new)
-            )
-            # self.generic_subs[key] = value.substitute_generic(generic, new)
-            logging.debug(f"    Transformed {__old_sub_only_for_debug} into {self.rhs_of_sub(key)}")
-
-            # occur check on newly created sub
-            if key in self._find_generics_inside(self.rhs_of_sub(key)):
-                raise Exception(
-                    f"OCCUR CHECK FAIL\n" +
-                    f"After applying the new, possibly refined, candidate substitution:\n" +
-                    f"\t{generic} ~~> {new}\n" +
-                    f"The old substitution already found in context:\n" +
-                    f"\t{key} ~~> {__old_sub_only_for_debug}\n" +
-                    f"Became:\n" +
-                    f"\t{key} ~~> {self.rhs_of_sub(key)}\n" +
-                    "Which fails the occur check."
-                )
-
-            # If, in ctx, you have a sub like:
-            #    (R1)  a ~~> u16
-            # and your new sub is like:
-            #    (R2)  x ~~> (a -> u8)
-            # you must also perform substitution in R2 using R1, obtaining
-            #    (R2') x ~~> u16 -> u8
-            new = new.substitute_generic(key, self.rhs_of_sub(key)) # self.generic_subs[key])
-
-            # occur check on the updated candidate sub
-            if generic in self._find_generics_inside(new):
-                raise Exception(
-                    f"OCCUR CHECK FAIL\n" +
-                    f"The (possibly refined) candidate substitution:\n" +
-                    f"\t{generic} ~~> {new}\n" +
-                    "fails the occur check."
-                )
-
-        return generic, new
+        logging.debug("Ended insertion of %s ~~> %s in CTX", generic_type, new_type)
 
 
     def finalize_funcall_types(self):
@@ -268,50 +335,15 @@ class Context:
         This function solves this problem brutally, by employing the arity of functions.
         """
         for funcall, typedef in self.inner_type.items():
-            typedef.left.keep_last_n(funcall.arity_in)
-            typedef.right.keep_last_n(funcall.arity_out)
+            funcall.type = self.inner_type[funcall] = ZTFunction(
+                typedef.left.keep_last_n(funcall.arity_in),
+                typedef.right.keep_last_n(funcall.arity_out)
+            )
 
     ##################################################
 
     def add_userfunction_type(self, funcname: str, t: ZTFunction):
+        # the scheme is compiled right away, so that it is a snapshot of the type at definition time
         self.user_types[funcname] = t
+        self.user_schemes[funcname] = TypeScheme(t)
 
-    def _find_generics_inside(self, t: ZType) -> Set[ZTGeneric]:
-        # just a helper function around ztype.find_generic_inside
-        generics_inside = set()
-        t.find_generics_inside(generics_inside)
-        return generics_inside
-
-
-    def ordered_subs(self) -> Tuple[Dict[int, ZType], List[ZTGeneric]]:
-        """
-        Per effettuare sostituzioni correttamente, l'ordine in cui si effettuano le riscritture
-        è importante. Per esempio, se il tipo da riscrivere fosse
-            myFoo :: 'a -> 'x
-        e il ctx fosse
-            'a ~~> ('x -> u8)   [1]
-            'x ~~> u16          [2]
-        sarebbe sbagliato fare la riscrittura di [2] prima di [1]; otterresti:
-            myFoo :: 'a -> u16   e quindi   myFoo :: ('x -> u8) -> u16
-        invece del desiderato
-            myFoo :: (u16 -> u8) -> u16
-
-        Bisogna quindi analizzare il grafo delle dipendenze fra riscritture. Nel caso sopra il grafo era
-            'a  ~~~richiede~~~>  'x
-        e semplicemente applichi le riscritture visitando il grado in pre-order (applichi prima
-        riscrittura su 'a poi quella su 'x)
-
-        In caso di cicli nel grafo hai un OCCUR FAIL
-        """
-        dependency_graph = Graph()
-
-        for generic, sub_type in self.generic_subs_items():
-            dependency_graph.add_node(generic)
-
-            for neigh in self._find_generics_inside(sub_type):
-                dependency_graph.add_edge(generic, neigh)
-                logging.debug(f"From {generic} ~~> {sub_type}: added to graph: {generic} ==> {neigh}")
-
-
-        return self.generic_subs, dependency_graph.ordered_visit()
-        # return self.generic_subs, list(self.generic_subs.keys())
\ No newline at end of file
@@ -0,0 +1,68 @@
+from operator import itemgetter
+from typing import *
+
+from forfait.utils import Unreachable
+from forfait.ztypes.ztypes import ZType, ZTGeneric, ZTRowGeneric, ZTRow, ZTFunction, ZTComposite
+
+
+Builder = Callable[[List[ZTGeneric]], ZType]
+
+
+class TypeScheme:
+    """
+    A type signature in which every generic is universally quantified, e.g. the type of a
+    builtin or of a user-defined function.
+
+    The signature is compiled once into a tree of builders, where each quantified generic
+    has a known slot; `instantiate` then allocates the fresh generics and rebuilds the type
+    in a single pass, without any deepcopy or substitution.
+    """
+    def __init__(self, t: ZType):
+        self.source: ZType = t
+        self.quantified: List[ZTGeneric] = list()  # the generic in each slot
+        self._slots: Dict[int, int] = dict()      # generic counter ~~> slot
+
+        self._build: Builder = self._compile(t)
+
+    def instantiate(self) -> ZType:
+        """
+        :return: a copy of the signature, where each generic is replaced by a fresh one
+        """
+        return self._build([type(g)(g.human_name) for g in self.quantified])
+
+    ##################################################
+
+    def _slot(self, generic: ZTGeneric) -> int:
+        if generic.counter not in self._slots:
+            self._slots[generic.counter] = len(self.quantified)
+            self.quantified.append(generic)
+        return self._slots[generic.counter]
+
+    def _compile(self, t: ZType) -> Builder:
+        if isinstance(t, ZTGeneric):  # includes ZTRowGeneric
+            return itemgetter(self._slot(t))
+
+        generics = set()
+        t.find_generics_inside(generics)
+        if len(generics) == 0:
+            # types are immutable, ground subtrees are shared by all the instances
+            return lambda _: t
+
+        if isinstance(t, ZTRow):
+            row_var = itemgetter(self._slot(t.row_var))
+            types   = [self._compile(x) for x in t.types]
+            return lambda fresh: ZTRow(row_var(fresh), [x(fresh) for x in types])
+
+        if isinstance(t, ZTFunction):
+            left, right = self._compile(t.left), self._compile(t.right)
+            return lambda fresh: ZTFunction(left(fresh), right(fresh))
+
+        if isinstance(t, ZTComposite):
+            typename = t.typename
+            inner    = [self._compile(x) for x in t.inner_types]
+            return lambda fresh: ZTComposite(typename, [x(fresh) for x in inner])
+
+        raise Unreachable()
+
+    def __str__(self):
+        return str(self.source)
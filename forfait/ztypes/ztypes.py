@@ -1,6 +1,8 @@
 from abc import abstractmethod
 from enum import Enum
+from itertools import count
 from typing import *
+from weakref import KeyedRef
 
 import logging as log
 
@@ -24,6 +26,13 @@ class UnificationError(ZTypeError):
 ##################################################
 
 class ZType:
+    """
+    Types are immutable: any transformation of a type returns a new type, and subtrees are
+    shared. Composite types (rows, functions, ...) are also hash-consed, i.e. structurally
+    equal types are the very same object.
+    """
+    __slots__ = ()
+
     @abstractmethod
     def unify(self, other: "ZType", ctx: "Context"):
         pass
@@ -31,6 +40,7 @@ class ZType:
     def substitute_generic(self, gen: "ZTGeneric", new: "ZType") -> "ZType":
         """
         Exchanges any generic type contained within self (if any) with a concrete type instances
+        :return: the new type (self, if `gen` does not occur in self)
         """
         return self
 
@@ -55,15 +65,60 @@ class ZType:
         """
         return False
 
-    @abstractmethod
     def structural_eq(self, other: "ZType") -> bool:
         """
         Type equality depending only on the structure of the type.
+        As types are hash-consed, it is just an identity check.
 
         :param other:
         :return:
         """
-        return False
+        return self is other
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+##################################################
+
+# hash-consing table: (class, *fields) ~~> weak reference to the only instance with those fields
+_INTERNED: Dict[tuple, KeyedRef] = dict()
+
+def _forget(ref: KeyedRef):
+    # called when an interned type is garbage collected
+    if _INTERNED.get(ref.key) is ref:
+        del _INTERNED[ref.key]
+
+class _ZTInterned(ZType):
+    """
+    Base class of the hash-consed types; subclasses list their fields in `_fields`, and
+    build their instances with `_intern`.
+    """
+    __slots__ = ("__weakref__",)
+    _fields: Tuple[str, ...] = ()
+
+    @classmethod
+    def _intern(cls, *values):
+        key = (cls, *values)
+        ref = _INTERNED.get(key)
+        t = None if ref is None else ref()
+        if t is None:
+            t = object.__new__(cls)
+            for field, value in zip(cls._fields, values):
+                object.__setattr__(t, field, value)
+            _INTERNED[key] = KeyedRef(t, _forget, key)
+        return t
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        return type(self), tuple(getattr(self, field) for field in self._fields)
 
 ##################################################
 
@@ -90,11 +145,8 @@ class ZTBase(ZType, Enum):
         return self.structural_eq(other)
 
 
-    def structural_eq(self, other: "ZType") -> bool:
-        if isinstance(other, ZTBase):
-            return self.value == other.value
-        return False
-
+    # members are singletons: identity hashing is enough, and faster than Enum.__hash__
+    __hash__ = object.__hash__
 
     def __str__(self):
         return self.name
@@ -102,13 +154,15 @@ class ZTBase(ZType, Enum):
 
 ##################################################
 
-class ZTComposite(ZType):
-    def __init__(self, typename: str, inner_types: list[ZType]):
-        self.typename = typename
-        self.inner_types = inner_types
+class ZTComposite(_ZTInterned):
+    __slots__ = ("typename", "inner_types")
+    _fields = __slots__
 
-        if len(self.inner_types) == 0:
-            raise ZTypeError(self, "It is not a composite type with 0 inner types!")
+    def __new__(cls, typename: str, inner_types: Iterable[ZType]):
+        inner_types = tuple(inner_types)
+        if len(inner_types) == 0:
+            raise ZTypeError(f"{typename} is not a composite type with 0 inner types!")
+        return cls._intern(typename, inner_types)
 
     def unify(self, other: "ZType", ctx: "Context"):
         if isinstance(other, ZTGeneric):
@@ -132,8 +186,7 @@ class ZTComposite(ZType):
         """
         Exchanges any generic type contained within self (if any) with a concrete type instances
         """
-        self.inner_types = [new if gen.structural_eq(t) else t for t in self.inner_types]
-        return self
+        return ZTComposite(self.typename, [t.substitute_generic(gen, new) for t in self.inner_types])
 
 
     def find_generics_inside(self, s: Set["ZTGeneric"]):
@@ -141,8 +194,7 @@ class ZTComposite(ZType):
         Find any generic nested inside a type and put them in a set
         """
         for t in self.inner_types:
-            if isinstance(t, ZTGeneric):
-                s.add(t)
+            t.find_generics_inside(s)
 
     def eq(self, ctx: "Context", other: "ZType"):
         if isinstance(other, ZTGeneric):
@@ -153,13 +205,6 @@ class ZTComposite(ZType):
             )
         return False
 
-    def structural_eq(self, other: "ZType") -> bool:
-        if isinstance(other, ZTComposite):
-            return self.typename == other.typename and (
-                all(t1.structural_eq(t2) for t1, t2 in zip(self.inner_types, other.inner_types))
-            )
-        return False
-
     def __str__(self):
         return f"{self.typename}<{' '.join(str(t) for t in self.inner_types).strip()}>"
 
@@ -170,16 +215,30 @@ def ZTMaybe(t: ZType):
 
 ##################################################
 
+_generic_counter = count()
+
 class ZTGeneric(ZType):
-    counter = 0
+    """
+    A type variable; each instance is a different variable, identified by its `counter`.
+    """
+    __slots__ = ("human_name", "counter")
 
     def __init__(self, human_name: str):
-        self.human_name = human_name
-        self.counter = ZTGeneric.counter
-        ZTGeneric.counter += 1
+        object.__setattr__(self, "human_name", human_name)
+        object.__setattr__(self, "counter", next(_generic_counter))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __reduce__(self):
+        # an unpickled generic is a new type variable (pickle keeps the sharing inside a type)
+        return type(self), (self.human_name,)
+
+    def substitute_generic(self, gen: "ZTGeneric", new: "ZType") -> "ZType":
+        return new if self is gen else self
 
     def unify(self, other: ZType, ctx: "Context"):
-        log.debug(f"New unify equality: {self} =?= {other}")
+        log.debug("New unify equality: %s =?= %s", self, other)
         ctx.add_generic_sub(self, other)
 
     def find_generics_inside(self, s: Set["ZTGeneric"]):
@@ -200,22 +259,19 @@ class ZTGeneric(ZType):
 
         return False
 
-    def structural_eq(self, other: "ZType") -> bool:
-        if isinstance(other, ZTGeneric):
-            return self.counter == other.counter
-        return False
-
     def __str__(self):
         return f"'{self.human_name}"
 
 ##################################################
 
 class ZTRowGeneric(ZTGeneric):
+    __slots__ = ()
+
     def __init__(self, human_name: str):
         super().__init__(human_name)
 
     def unify(self, other: ZType, ctx: "Context"):
-        log.debug(f"New unify equality: {self} =?= {other}")
+        log.debug("New unify equality: %s =?= %s", self, other)
         ctx.add_generic_sub(self, other)
 
     def find_generics_inside(self, s: Set["ZTGeneric"]):
@@ -224,9 +280,6 @@ class ZTRowGeneric(ZTGeneric):
     def eq(self, ctx: "Context", other: "ZType"):
         return super().eq(ctx, other)
 
-    def structural_eq(self, other: "ZType") -> bool:
-        return super().structural_eq(other)
-
     def __str__(self):
         if DEBUG_ZTROWGENERIC:
             return f"''{self.human_name}_{self.counter}"
@@ -234,19 +287,23 @@ class ZTRowGeneric(ZTGeneric):
 
 ##################################################
 
-class ZTRow(ZType):
-    def __init__(self, row_var: ZTRowGeneric, types: List[ZType]):
-        self.row_var = row_var
-        self.types = types
+class ZTRow(_ZTInterned):
+    __slots__ = ("row_var", "types")
+    _fields = __slots__
+
+    def __new__(cls, row_var: ZTRowGeneric, types: Iterable[ZType]):
+        return cls._intern(row_var, tuple(types))
 
     def arity(self):
         return len(self.types)
 
-    def keep_last_n(self, n: int):
+    def keep_last_n(self, n: int) -> "ZTRow":
+        """
+        :return: the same row, with only the topmost `n` types
+        """
         if n == 0:
-            self.types = []
-        else:
-            self.types = self.types[-n:]
+            return ZTRow(self.row_var, ())
+        return ZTRow(self.row_var, self.types[-n:])
 
     def get_the_topmost(self, n: int) -> ZType:
         return self.types[-n-1]
@@ -273,21 +330,15 @@ class ZTRow(ZType):
         s.add(self.row_var)
 
     def substitute_generic(self, gen: "ZTGeneric", new: "ZType") -> "ZType":
-        for i, t in enumerate(self.types):
-            if t.structural_eq(gen):
-                self.types[i] = new
-
-        if self.row_var.structural_eq(gen):
-            if isinstance(new, ZTRow):
-                self.row_var = new.row_var
-                self.types   = new.types + self.types
-            elif isinstance(new, ZTRowGeneric):
-                self.row_var = new
-            else:
-                print("oh no")
-                breakpoint()
+        types = tuple(t.substitute_generic(gen, new) for t in self.types)
 
-        return self
+        if self.row_var is not gen:
+            return ZTRow(self.row_var, types)
+        if isinstance(new, ZTRow):
+            return ZTRow(new.row_var, new.types + types)
+        if isinstance(new, ZTRowGeneric):
+            return ZTRow(new, types)
+        raise ZTypeError(f"Can't substitute the row variable {gen} of {self} with {new}")
 
 
     def eq(self, ctx: "Context", other: "ZType") -> bool:
@@ -305,17 +356,6 @@ class ZTRow(ZType):
         return False
 
 
-    def structural_eq(self, other: "ZType") -> bool:
-        if isinstance(other, ZTRow):
-            if len(self.types) != len(other.types):
-                return False
-
-            return self.row_var.structural_eq(other.row_var) and (
-                all(t1.structural_eq(t2) for t1, t2 in zip(self.types, other.types))
-            )
-        return False
-
-
     def __str__(self):
         return (str(self.row_var).strip() + " " + " ".join([str(t) for t in self.types]).strip()).strip()
 
@@ -328,10 +368,12 @@ def ZTFuncHelper(genrowvar1, left, genrowvar2, right):
     return ZTFunction(ZTRow(genrowvar1, left), ZTRow(genrowvar2, right))
 
 
-class ZTFunction(ZType):
-    def __init__(self, left: ZTRow, right: ZTRow):
-        self.left  = left
-        self.right = right
+class ZTFunction(_ZTInterned):
+    __slots__ = ("left", "right")
+    _fields = __slots__
+
+    def __new__(cls, left: ZTRow, right: ZTRow):
+        return cls._intern(left, right)
 
     def unify(self, other: ZType, ctx: "Context"):
         if isinstance(other, ZTGeneric):
@@ -383,40 +425,7 @@ class ZTFunction(ZType):
 
 
     def substitute_generic(self, generic: ZTGeneric, new: ZType):
-        # Recursively visit left and right, looking for generics
-        for i, l in enumerate(self.left.types):
-            if l.structural_eq(generic):
-                self.left.types[i] = new
-            else:
-                self.left.types[i] = self.left.types[i].substitute_generic(generic, new)
-
-        for i, r in enumerate(self.right.types):
-            if r.structural_eq(generic):
-                self.right.types[i] = new
-            else:
-                self.right.types[i] = self.right.types[i].substitute_generic(generic, new)
-
-        if self.left.row_var.structural_eq(generic):
-            if isinstance(new, ZTRow):
-                self.left.row_var = new.row_var
-                self.left.types = new.types + self.left.types
-            elif isinstance(new, ZTRowGeneric):
-                self.left.row_var = new
-            else:
-                print("Non so cosa vuol dire questo")
-                breakpoint()
-
-        if self.right.row_var.structural_eq(generic):
-            if isinstance(new, ZTRow):
-                self.right.row_var = new.row_var
-                self.right.types = new.types + self.right.types
-            elif isinstance(new, ZTRowGeneric):
-                self.right.row_var = new
-            else:
-                print("Non so cosa vuol dire questo")
-                breakpoint()
-
-        return self
+        return ZTFunction(self.left.substitute_generic(generic, new), self.right.substitute_generic(generic, new))
 
     def eq(self, ctx: "Context", other: "ZType") -> bool:
         if isinstance(other, ZTGeneric):
@@ -430,12 +439,6 @@ class ZTFunction(ZType):
         return False
 
 
-    def structural_eq(self, other: "ZType") -> bool:
-        if isinstance(other, ZTFunction):
-            return self.left.structural_eq(other.left) and self.right.structural_eq(other.right)
-        return False
-
-
     def __str__(self):
         return f"({self.left} -> {self.right})"
 
@@ -491,20 +494,5 @@ def type_of_application_rowpoly(t1: ZTFunction, t2: ZTFunction, ctx: "Context")
         candidate = ZTFunction(ll, rr)
 
 
-    # performs ordered rewriting of `Generic`s in an order given by the dependency graph
-    subs, order = ctx.ordered_subs()
-    for lhs in order:
-        if lhs.counter not in subs:  # HACK: TODO: da ripensare eh
-            continue
-        candidate.substitute_generic(lhs, subs[lhs.counter])
-
-        ## these are so that intermediate functions with generic types assume a concrete value whenever possible
-        ## NB: not so sure this makes sense
-        if not isinstance(lhs, ZTRowGeneric):
-            ll.substitute_generic(lhs, subs[lhs.counter])
-            lr.substitute_generic(lhs, subs[lhs.counter])
-            rl.substitute_generic(lhs, subs[lhs.counter])
-            rr.substitute_generic(lhs, subs[lhs.counter])
-
-
-    return candidate
\ No newline at end of file
+    # the substitutions found so far are applied to the resulting type
+    return ctx.resolve(candidate)
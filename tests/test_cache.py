@@ -0,0 +1,106 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from forfait.cache import ModuleCache, signature
+from forfait.compiler import Compiler
+from forfait.interpreter.interpreter import Interpreter
+from forfait.parser.firstphase import FirstPhase
+from forfait.stdlibs.basic_stdlib import get_stdlib, STDLIB
+from forfait.ztypes.context import Context
+from forfait.ztypes.ztypes import ZTFunc, ZTRowGeneric, ZTBase
+
+
+with open(os.path.join(os.path.dirname(__file__), "..", "examples", "fibonacci.forf")) as f:
+    FIBONACCI = f.read()
+
+LIBRARY = FIBONACCI + """
+: square dup *u8 ;
+: countdown dup 0 ==u8 [| drop |] [| --u8 countdown |] if ;
+"""
+
+
+class TestModuleCache(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_hit_gives_the_same_typed_ast(self):
+        cache = ModuleCache(self.directory.name)
+        expected = FirstPhase(get_stdlib(), verbose=False).parse_and_typecheck(LIBRARY + " 10 fibonacci square")
+
+        for hits in (0, 1, 2):
+            ctx = get_stdlib()
+            nodes = cache.parse_and_typecheck(ctx, LIBRARY + " 10 fibonacci square")
+            self.assertEqual(hits, cache.hits)
+            self.assertEqual([str(node) for node in expected], [str(node) for node in nodes])
+            self.assertEqual([signature(node.typeof(ctx)) for node in expected],
+                             [signature(node.typeof(ctx)) for node in nodes])
+            self.assertEqual({"fibonacci", "square", "countdown"}, set(ctx.user_types))
+            self.assertEqual("(..0 U8 -> ..0 U8)", signature(ctx.user_types["square"]))
+
+    def test_hit_defines_the_words(self):
+        cache = ModuleCache(self.directory.name)
+        for _ in range(2):
+            ctx = get_stdlib()
+            cache.parse_and_typecheck(ctx, LIBRARY)
+            nodes = FirstPhase(ctx, verbose=False).parse_and_typecheck("7 square 3 countdown")
+            self.assertEqual("(..0 -> ..0 U8)", signature(nodes[0].typeof(ctx)))
+        self.assertEqual(1, cache.hits)
+
+    def test_key(self):
+        cache = ModuleCache(self.directory.name)
+        self.assertEqual(cache.key(get_stdlib(), LIBRARY), cache.key(get_stdlib(), LIBRARY))
+        self.assertNotEqual(cache.key(get_stdlib(), LIBRARY), cache.key(get_stdlib(), LIBRARY + " "))
+
+        # the words already defined are part of the key
+        ctx = get_stdlib()
+        FirstPhase(ctx, verbose=False).parse_and_typecheck(": foo 1 ;")
+        self.assertNotEqual(cache.key(get_stdlib(), "foo"), cache.key(ctx, "foo"))
+
+    def test_stdlib_changes_invalidate_the_cache(self):
+        cache = ModuleCache(self.directory.name)
+        cache.parse_and_typecheck(get_stdlib(), "3 4 +u8")
+
+        builtins = dict(STDLIB.builtin_types)
+        S = ZTRowGeneric("S")
+        builtins["+u8"] = ZTFunc(S, [ZTBase.U8, ZTBase.U8], [ZTBase.U16])
+        ctx = Context(builtins).freeze().overlay()
+
+        self.assertNotEqual(cache.key(get_stdlib(), "3 4 +u8"), cache.key(ctx, "3 4 +u8"))
+        nodes = cache.parse_and_typecheck(ctx, "3 4 +u8")
+        self.assertEqual(0, cache.hits)
+        self.assertEqual("(..0 -> ..0 U16)", signature(nodes[0].typeof(ctx)))
+
+    def test_unreadable_entries_are_misses(self):
+        cache = ModuleCache(self.directory.name)
+        cache.parse_and_typecheck(get_stdlib(), LIBRARY)
+        path = os.path.join(self.directory.name, cache.key(get_stdlib(), LIBRARY))
+        for data in (b"", b"FORF", b"FORFnot zlib", b"something else"):
+            with open(path, "wb") as f:
+                f.write(data)
+            ctx = get_stdlib()
+            cache.parse_and_typecheck(ctx, LIBRARY)
+            self.assertEqual(0, cache.hits)
+            self.assertIn("square", ctx.user_types)
+
+        cache.parse_and_typecheck(get_stdlib(), LIBRARY)
+        self.assertEqual(1, cache.hits)
+
+    def test_interpreter(self):
+        cache = ModuleCache(self.directory.name)
+        stacks = list()
+        for _ in range(2):
+            interpreter = Interpreter(get_stdlib(), verbose=False, cache=cache)
+            interpreter.eval(LIBRARY)
+            interpreter.eval("0 10 [| dup square swap u16 store-at |] indexed-iter 200 fibonacci 5 countdown")
+            stacks.append((interpreter.stack, interpreter.memory))
+        self.assertEqual(2, cache.hits)
+        self.assertEqual(stacks[0], stacks[1])
+
+    def test_cfgs(self):
+        cache = ModuleCache(self.directory.name)
+        code = "1 2 +u8 dup 3 >u8 [| 1 +u8 |] [| 2 +u8 |] if"
+        cfgs = [Compiler(get_stdlib(), cache=cache).ssify(code) for _ in range(2)]
+        self.assertEqual(1, cache.hits)
+        self.assertEqual([str(cfg) for cfg in cfgs[0]], [str(cfg) for cfg in cfgs[1]])
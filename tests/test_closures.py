@@ -0,0 +1,99 @@
+import os
+import re
+from unittest import TestCase
+from typing import *
+
+from forfait.interpreter.closures import ClosureInterpreter, ZClosureError, BINOPS
+from forfait.interpreter.interpreter import Interpreter
+from forfait.optimizer import Optimizer
+from forfait.peephole import RuleSet
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+with open(os.path.join(os.path.dirname(__file__), "..", "examples", "fibonacci.forf")) as f:
+    FIBONACCI = f.read()
+
+
+class TestClosureInterpreter(TestCase):
+    def run_both(self, code: str) -> ClosureInterpreter:
+        closures = ClosureInterpreter(get_stdlib())
+        # the programs are not evaluated by the optimizer, so that their words are compiled
+        closures.optimizer = Optimizer(closures.ctx, rules=RuleSet(), dead_code=False, inline=False, partial_evaluation=False)
+        closures.eval(code)
+
+        source = "\n".join(function.source for function in closures.cache.values())
+        for funcname in set(re.sub(r"\(\(.*?\)\)", "", code, flags=re.S).split()) & set(BINOPS):
+            # the source of the operator, between its operands
+            self.assertIn(BINOPS[funcname].split("{top}")[1].split("{second}")[0], source, funcname)
+
+        interpreter = Interpreter(get_stdlib(), verbose=False)
+        interpreter.eval(code)
+
+        self.assertEqual(interpreter.stack, closures.stack)
+        self.assertEqual(interpreter.memory, closures.memory)
+        return closures
+
+    def test_same_results_as_interpreter(self):
+        for code in [
+            "1 2 3 rot- swap over rot+ dup drop",
+            "200 100 +u8 3 7 *u8 2 9 /u8 9 2 -u8 ++u8 0 --u8",
+            "1 2 >u8 1 2 <u8 2 2 >=u8 3 2 <=u8 4 4 ==u8 4 5 !=u8",
+            "7 9 over over swap over drop drop swap drop 3 4 5 ++u8 rot+ --u8 rot+",
+            "200 u16 17 u16 dup drop swap",
+            "0 5 [| dup u16 store-at |] indexed-iter",
+            "1 1 [| dup 100 <=u8 |] [| swap over +u8 |] while swap drop",
+            "100 [| dup [| +u8 |] eval |] eval",
+            "5 true [| [| dup dup +u8 +u8 |] eval |] [| ++u8 |] if dup",
+            "5 false [| [| dup dup +u8 +u8 |] eval |] [| ++u8 |] if dup",
+            "3 [| 1 +u8 |] [| 2 *u8 |] true rot+ if",
+            ": sq dup *u8 ; 0 10 [| sq 5 u16 store-at |] indexed-iter",
+            FIBONACCI + " 8 fibonacci 12 fibonacci",
+        ]:
+            with self.subTest(code=code):
+                self.run_both(code)
+
+    def test_straight_line_code_uses_locals(self):
+        closures = self.run_both(": f 3 4 +u8 over *u8 swap -u8 ; 7 f")
+        source = closures.words["f"].source
+        # one load and one store
+        self.assertEqual(2, source.count("stack[-1]"))
+        self.assertNotIn("pop()", source)
+        self.assertNotIn("push(", source)
+
+    def test_quotes_are_inlined(self):
+        closures = self.run_both(FIBONACCI + " 8 fibonacci")
+        self.assertEqual([55], closures.stack)
+        self.assertIn("while True:", closures.words["fibonacci"].source)
+        self.assertNotIn("cond()", closures.words["fibonacci"].source)
+
+    def test_generated_functions_are_cached(self):
+        closures = ClosureInterpreter(get_stdlib())
+        closures.eval(": sq dup *u8 ;")
+        sq = closures.words["sq"]
+        closures.eval(": sq dup *u8 ; 3 sq")
+        self.assertIs(sq, closures.words["sq"])
+        self.assertEqual([9], closures.stack)
+
+    def test_namespace_does_not_grow(self):
+        closures = ClosureInterpreter(get_stdlib())
+        names = set(closures.namespace)
+        for i in range(20):
+            closures.eval(f": f{i} [| {i} +u8 |] ; 1 f{i} eval [| {i} *u8 |] eval drop")
+        self.assertEqual(names, set(closures.namespace))
+
+        # the quotations are bound to the functions pushing them
+        closures.eval("3 f4 eval")
+        self.assertEqual([7], closures.stack)
+
+        closures.eval("__clear")
+        self.assertEqual({}, closures.cache)
+
+    def test_state_persists_between_evals(self):
+        closures = ClosureInterpreter(get_stdlib())
+        closures.eval(": double dup +u8 ;")
+        closures.eval("21 double")
+        self.assertEqual([42], closures.stack)
+
+    def test_unsupported_builtin(self):
+        with self.assertRaises(ZClosureError):
+            ClosureInterpreter(get_stdlib()).eval("empty-list")
@@ -0,0 +1,114 @@
+import itertools
+from typing import *
+from unittest import TestCase
+
+from forfait.astnodes import Number, Boolean
+from forfait.interpreter.interpreter import Interpreter
+from forfait.optimizer import Optimizer, stdlib_peeps
+from forfait.parser.firstphase import FirstPhase
+from forfait.peephole import RuleSet
+from forfait.ssa.ssa import SSA_ification, constant_propagation, SSA_Constant, SSA_Binop
+from forfait.stdlibs.basic_semantics import OPERATIONS, evaluate
+from forfait.stdlibs.basic_stdlib import get_stdlib
+from forfait.ztypes.context import Context
+from forfait.ztypes.ztypes import ZTBase
+
+# operands at the edges of the ranges, written as literals of their type
+OPERANDS = {
+    ZTBase.U8: ["0", "1", "2", "128", "255"],
+    ZTBase.U16: ["0 u16", "1 u16", "255 u16", "256 u16", "65535 u16"],
+}
+
+
+def cases():
+    """
+    :return: (funcname, operands from the deepest one) for every operation, on every
+    combination of operands of the types it takes
+    """
+    ctx = get_stdlib()
+    for funcname in OPERATIONS:
+        operands = [OPERANDS[t] for t in ctx.builtin_types[funcname].left.types]
+        for combination in itertools.product(*operands):
+            yield funcname, combination
+
+
+def interpret(code: str):
+    interpreter = Interpreter(get_stdlib(), verbose=False)
+    interpreter.optimizer = Optimizer(interpreter.ctx, rules=RuleSet(), dead_code=False, inline=False, partial_evaluation=False)
+    interpreter.eval(code)
+    return interpreter.stack
+
+
+def value(literal: Number | Boolean):
+    return literal.b if isinstance(literal, Boolean) else literal.n
+
+
+class TestConstantFolding(TestCase):
+    def test_table_covers_stdlib(self):
+        ctx = get_stdlib()
+        # the builtins taking and giving u8, u16 and booleans only
+        arithmetic = {
+            funcname for funcname, t in ctx.builtin_types.items()
+            if len(t.left.types) + len(t.right.types) > 0 and all(isinstance(x, ZTBase) for x in t.left.types + t.right.types)
+        }
+        self.assertEqual(arithmetic, set(OPERATIONS))
+        for funcname, operation in OPERATIONS.items():
+            with self.subTest(funcname=funcname):
+                self.assertEqual(operation.arity, len(ctx.builtin_types[funcname].left.types))
+                self.assertEqual([operation.type], list(ctx.builtin_types[funcname].right.types))
+
+    def test_same_results_as_interpreter(self):
+        for funcname, operands in cases():
+            code = f"{' '.join(operands)} {funcname}"
+            with self.subTest(code=code):
+                literals = [Number(x, ZTBase.U8) for x in interpret(" ".join(operands))]
+                try:
+                    expected = interpret(code)
+                except ZeroDivisionError:
+                    with self.assertRaises(ArithmeticError):
+                        evaluate(funcname, reversed(literals))
+                    continue
+                folded = evaluate(funcname, reversed(literals))
+                self.assertEqual(expected, [value(folded)])
+                self.assertIs(type(expected[0]), type(value(folded)))
+
+    def optimizer_tester(self, optimizer: Callable[[Context], Optimizer]):
+        for funcname, operands in cases():
+            code = f"{' '.join(operands)} {funcname}"
+            with self.subTest(code=code):
+                ctx = get_stdlib()
+                nodes = optimizer(ctx).optimize(FirstPhase(ctx, verbose=False).parse_and_typecheck(code))
+                funcs = nodes[0].funcs
+                try:
+                    expected = interpret(code)
+                except ZeroDivisionError:
+                    # it is left to fail at runtime
+                    self.assertEqual(funcname, funcs[-1].funcname)
+                    continue
+                self.assertEqual(1, len(funcs))
+                self.assertEqual(expected, [value(funcs[0])])
+                self.assertEqual(OPERATIONS[funcname].type, funcs[0].typeof(None).right.types[-1])
+
+    def test_optimizer(self):
+        self.optimizer_tester(Optimizer)
+
+    def test_rules(self):
+        self.optimizer_tester(lambda ctx: Optimizer(ctx, rules=stdlib_peeps, dead_code=False, inline=False, partial_evaluation=False))
+
+    def test_constant_propagation(self):
+        for funcname, operands in cases():
+            code = f"{' '.join(operands)} {funcname}"
+            with self.subTest(code=code):
+                ctx = get_stdlib()
+                cfg, vstack = SSA_ification(FirstPhase(ctx, verbose=False).parse_and_typecheck(code)[0])
+                constant_propagation(cfg)
+                constants = {instr.r: instr.const for instr in cfg.instructions if isinstance(instr, SSA_Constant)}
+                try:
+                    expected = interpret(code)
+                except ZeroDivisionError:
+                    # it is left to fail at runtime
+                    self.assertIsInstance(cfg.instructions[-1], SSA_Binop)
+                    self.assertNotIn(vstack[-1], constants)
+                    continue
+                self.assertEqual(expected, [value(constants[vstack[-1]])])
+                self.assertEqual(OPERATIONS[funcname].type, vstack[-1].type)
@@ -0,0 +1,119 @@
+from unittest import TestCase
+from typing import *
+
+from forfait.data_structures.graph import Graph, IncrementalGraph, DependencyGraphException
+
+
+class TestIncrementalGraph(TestCase):
+    def assert_is_topological(self, g: IncrementalGraph):
+        order = g.ordered_visit()
+        index = {node: i for i, node in enumerate(order)}
+        for x, ys in g.outer_edges.items():
+            for y in ys:
+                self.assertLess(index[x], index[y])
+
+    def test_chain_in_any_insertion_order(self):
+        for edges in [[(i, i + 1) for i in range(50)], [(i, i + 1) for i in reversed(range(50))]]:
+            g = IncrementalGraph()
+            for x, y in edges:
+                g.add_edge(x, y)
+            self.assertEqual(list(range(51)), g.ordered_visit())
+
+    def test_reorders_only_when_needed(self):
+        g = IncrementalGraph()
+        g.add_edge("c", "d")
+        g.add_edge("a", "b")
+        g.add_edge("b", "c")
+        g.add_edge("d", "e")
+        self.assertEqual(["a", "b", "c", "d", "e"], g.ordered_visit())
+
+    def test_cycle_is_refused(self):
+        g = IncrementalGraph()
+        g.add_edge(1, 2)
+        g.add_edge(2, 3)
+        with self.assertRaises(DependencyGraphException) as cm:
+            g.add_edge(3, 1)
+        self.assertIn("3 ==> 1 ==> 2 ==> 3", str(cm.exception))
+        # the graph is left unchanged
+        self.assertEqual([1, 2, 3], g.ordered_visit())
+        with self.assertRaises(DependencyGraphException):
+            g.add_edge(2, 2)
+
+    def test_merge_nodes(self):
+        g = IncrementalGraph()
+        g.add_edge("a", "x")
+        g.add_edge("x", "b")
+        g.add_edge("c", "y")
+        g.merge_nodes("x", into="y")
+        self.assertNotIn("x", g.nodes)
+        self.assertEqual({"y"}, g.outer_edges["a"])
+        self.assertEqual({"b"}, g.outer_edges["y"])
+        self.assert_is_topological(g)
+
+        # merging the two ends of a path closes a cycle
+        with self.assertRaises(DependencyGraphException):
+            g.merge_nodes("b", into="a")
+
+
+class TestGraph(TestCase):
+    def test_ordered_visit(self):
+        g = Graph()
+        g.add_edge(5, 2)
+        g.add_edge(2, 1)
+        g.add_edge(5, 1)
+        g.add_edge(1, 9)
+        g.add_node(7)
+        order = g.ordered_visit()
+        self.assertEqual({1, 2, 5, 7, 9}, set(order))
+        self.assertEqual([5, 2, 1, 9], [x for x in order if x != 7])
+
+    def test_duplicate_edges(self):
+        g = Graph()
+        g.add_edge(1, 2)
+        g.add_edge(1, 2)
+        self.assertEqual([1, 2], g.ordered_visit())
+
+    def test_cycle_is_reported_whole(self):
+        g = Graph()
+        g.add_edge(0, 1)
+        for i in range(1, 5):
+            g.add_edge(i, i + 1)
+        g.add_edge(5, 1)
+        g.add_edge(5, 6)
+        cycle = g.find_cycle()
+        self.assertEqual(cycle[0], cycle[-1])
+        self.assertEqual(6, len(cycle))
+        self.assertEqual({1, 2, 3, 4, 5}, set(cycle))
+        with self.assertRaises(DependencyGraphException) as cm:
+            g.ordered_visit()
+        self.assertIn("Found ciclicity", str(cm.exception))
+        for i in range(1, 6):
+            self.assertIn(f"{i} ==> ", str(cm.exception))
+
+    def test_self_loop(self):
+        g = Graph()
+        g.add_edge(3, 3)
+        self.assertEqual([3, 3], g.find_cycle())
+
+    def test_diamonds_are_linear(self):
+        # a chain of 5000 diamonds has 2^5000 paths, but each node is explored once
+        g = diamond_chain(5000)
+        g.ciclicity_check()
+        order = g.ordered_visit()
+        self.assertEqual(len(g.nodes), len(order))
+        index = {node: i for i, node in enumerate(order)}
+        for x, ys in g.outer_edges.items():
+            for y in ys:
+                self.assertLess(index[x], index[y])
+        self.assertIsNone(g.find_cycle())
+
+
+def diamond_chain(n_diamonds: int) -> Graph:
+    g = Graph()
+    for i in range(n_diamonds):
+        top, left, right, bottom = 3 * i, 3 * i + 1, 3 * i + 2, 3 * i + 3
+        g.add_edge(top, left)
+        g.add_edge(top, right)
+        g.add_edge(left, bottom)
+        g.add_edge(right, bottom)
+    return g
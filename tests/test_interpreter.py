@@ -0,0 +1,67 @@
+import inspect
+from unittest import TestCase
+
+from forfait.interpreter.interpreter import Interpreter
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+# counts down a 16-bit counter, as two u8 (high, low), with a tail call at each step
+COUNTDOWN = """
+: countdown
+    dup 0 ==u8
+    [| drop dup 0 ==u8 [| drop |] [| --u8 255 countdown |] if |]
+    [| --u8 countdown |] if ;
+"""
+
+
+class TestInterpreter(TestCase):
+    def run_interpreter(self, code: str) -> Interpreter:
+        interpreter = Interpreter(get_stdlib(), verbose=False)
+        interpreter.eval(code)
+        return interpreter
+
+    def test_recursion(self):
+        # not a tail call: the increments run after the recursive calls return
+        interpreter = self.run_interpreter(": inc dup 0 ==u8 [| identity |] [| --u8 inc |] if ++u8 ; 10 inc 255 inc")
+        self.assertEqual([11, 0], interpreter.stack)
+
+    def test_deep_tail_recursion(self):
+        interpreter = self.run_interpreter(COUNTDOWN + " 7 true 255 255 countdown")
+        self.assertEqual([7, True], interpreter.stack)
+
+    def test_tail_calls_run_in_constant_space(self):
+        interpreter = Interpreter(get_stdlib(), verbose=False)
+        interpreter.eval(COUNTDOWN)
+        depths = list()
+
+        def eval_builtin(funcname: str, eval_builtin=interpreter.eval_builtin):
+            depths.append(len(inspect.stack(0)))
+            eval_builtin(funcname)
+        interpreter.eval_builtin = eval_builtin
+
+        interpreter.eval("1 200 countdown")
+        self.assertEqual([], interpreter.stack)
+        self.assertEqual(1, len(set(depths)))
+
+    def test_long_chain_of_eval(self):
+        interpreter = self.run_interpreter("1 " + "[| " * 50 + "++u8" + " |] eval" * 50)
+        self.assertEqual([2], interpreter.stack)
+
+        # each step is a quotation run by eval, calling the next step
+        interpreter = self.run_interpreter(COUNTDOWN.replace("[| --u8 countdown |]", "[| [| --u8 countdown |] eval |]") +
+                                           " 7 255 255 countdown")
+        self.assertEqual([7], interpreter.stack)
+
+    def test_loops_in_words(self):
+        interpreter = self.run_interpreter(
+            ": down [| dup 0 >u8 |] [| --u8 |] while ; "
+            ": squares 0 10 [| dup dup *u8 swap u16 store-at |] indexed-iter ; "
+            "9 down squares 5 down"
+        )
+        self.assertEqual([0, 0], interpreter.stack)
+        self.assertEqual({i: i * i for i in range(10)}, interpreter.memory)
+
+    def test_quotes_are_callable(self):
+        interpreter = self.run_interpreter("4 [| 3 +u8 |]")
+        interpreter.stack.pop()()
+        self.assertEqual([7], interpreter.stack)
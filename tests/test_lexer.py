@@ -0,0 +1,109 @@
+import os
+from unittest import TestCase
+
+from forfait.parser.firstphase import FirstPhase
+from forfait.parser.lexer import tokenize, strip_comments
+from forfait.parser.parser_exceptions import ZUnterminatedComment, ZUnknownFunction, ZUnopenedComment
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+class TestLexer(TestCase):
+    def assert_tokens(self, code: str, expected: list[tuple[str, int, int]]):
+        self.assertListEqual(
+            expected,
+            [(t.text, t.line, t.column) for t in tokenize(code)]
+        )
+
+    def test_spaces(self):
+        self.assert_tokens(
+            "1  3 +u8",
+            [("1", 1, 1), ("3", 1, 4), ("+u8", 1, 6)]
+        )
+
+    def test_tabs_and_newlines(self):
+        self.assert_tokens(
+            "dup\n\tdrop\n\n  swap",
+            [("dup", 1, 1), ("drop", 2, 2), ("swap", 4, 3)]
+        )
+
+    def test_crlf(self):
+        self.assert_tokens(
+            "dup\r\ndrop\rswap",
+            [("dup", 1, 1), ("drop", 2, 1), ("swap", 3, 1)]
+        )
+
+    def test_comments(self):
+        self.assert_tokens(
+            "1 (( a comment\n spanning (two) lines )) 2",
+            [("1", 1, 1), ("2", 2, 26)]
+        )
+
+    def test_comment_glued_to_words(self):
+        self.assert_tokens(
+            "dup((comment))drop",
+            [("dup", 1, 1), ("drop", 1, 15)]
+        )
+
+    def test_unterminated_comment(self):
+        with self.assertRaises(ZUnterminatedComment) as cm:
+            list(tokenize("1 2\n  (( no end"))
+        self.assertIn("2:3", str(cm.exception))
+
+    def test_nested_comments(self):
+        self.assert_tokens(
+            "1 (( outer (( inner )) still outer )) 2",
+            [("1", 1, 1), ("2", 1, 39)]
+        )
+
+    def test_unopened_comment(self):
+        with self.assertRaises(ZUnopenedComment) as cm:
+            list(tokenize("1 (( a )) 2\n3 )) 4"))
+        self.assertIn("2:3", str(cm.exception))
+
+    def test_unterminated_nested_comment(self):
+        with self.assertRaises(ZUnterminatedComment) as cm:
+            list(tokenize("(( a (( b )) c\n"))
+        self.assertIn("1:1", str(cm.exception))
+
+    def test_fibonacci_example(self):
+        with open(os.path.join(os.path.dirname(__file__), "..", "examples", "fibonacci.forf")) as f:
+            tokens = [t.text for t in tokenize(f.read())]
+        self.assertEqual(tokens[:3], [":", "fibonacci", "1"])
+        self.assertEqual(tokens[-1], ";")
+        self.assertNotIn("((", tokens)
+
+    def test_unknown_function_position(self):
+        with self.assertRaises(ZUnknownFunction) as cm:
+            FirstPhase(get_stdlib(), verbose=False).parse("1 2\n +u8 foo")
+        self.assertIn("2:6", str(cm.exception))
+
+
+class TestCommentStripping(TestCase):
+    def test_strip(self):
+        self.assertEqual(
+            "1   2",
+            strip_comments("1 (( a (( b )) c )) 2")
+        )
+
+    def test_strip_keeps_lines(self):
+        self.assertEqual(
+            "1  \n\n 2",
+            strip_comments("1 (( a\n(( b ))\n )) 2")
+        )
+
+    def test_strip_errors(self):
+        with self.assertRaises(ZUnterminatedComment):
+            strip_comments("1 (( a (( b )) 2")
+        with self.assertRaises(ZUnopenedComment):
+            strip_comments("1 )) 2")
+
+    def test_stress_10mb_commented_file(self):
+        line = "dup (( a (( nested )) comment )) drop (( another one )) swap ((x))\n"
+        n_lines = 10 * 1024 * 1024 // len(line)
+        code = line * n_lines
+
+        self.assertEqual(3 * n_lines, sum(1 for _ in tokenize(code)))
+
+        stripped = strip_comments(code)
+        self.assertNotIn("((", stripped)
+        self.assertEqual(n_lines, stripped.count("\n"))
@@ -0,0 +1,142 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from forfait.cache import signature
+from forfait.interpreter.interpreter import Interpreter
+from forfait.modules import ModuleGraph, ZModuleError
+from forfait.parser.firstphase import FirstPhase
+from forfait.parser.parser_exceptions import ZParserError, ZUnknownFunction
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+def project() -> ModuleGraph:
+    modules = ModuleGraph()
+    modules.set_source("math", ": square dup *u8 ; : cube dup square *u8 ;")
+    modules.set_source("geometry", "import math : area square ; : volume cube ;")
+    modules.set_source("physics", "import math : energy square 2 /u8 ;")
+    modules.set_source("main", "import geometry import physics : main 3 area 4 energy +u8 ; main")
+    return modules
+
+
+class TestModules(TestCase):
+    def test_exports(self):
+        modules = project()
+        self.assertEqual({"square": "(..0 U8 -> ..0 U8)", "cube": "(..0 U8 -> ..0 U8)"},
+                         modules.load("math").signatures())
+        # the imported words are not exported again
+        self.assertEqual({"area", "volume"}, set(modules.load("geometry").exports))
+        self.assertEqual(["geometry", "physics"], modules.load("main").imports)
+
+    def test_each_module_is_typechecked_once(self):
+        modules = project()
+        modules.load("main")
+        self.assertEqual(4, modules.typechecked)
+        self.assertEqual(["math", "geometry", "physics", "main"], [module.name for module in modules.program("main")])
+
+    def test_unknown_word(self):
+        modules = project()
+        modules.set_source("geometry", ": area square ;")
+        with self.assertRaises(ZUnknownFunction):
+            modules.load("geometry")
+
+    def test_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "math.forf"), "w") as f:
+                f.write(": square dup *u8 ;")
+            modules = ModuleGraph(paths=[directory])
+            modules.set_source("main", "import math 5 square")
+            self.assertEqual(["math"], modules.load("main").imports)
+            with self.assertRaises(ZModuleError):
+                modules.load("geometry")
+
+    def test_import_cycle(self):
+        modules = ModuleGraph()
+        modules.set_source("a", "import b : a 1 ;")
+        modules.set_source("b", "import c : b 1 ;")
+        modules.set_source("c", "import a : c 1 ;")
+        with self.assertRaises(ZModuleError):
+            modules.load("a")
+
+        # a cycle introduced by an edit
+        modules.set_source("c", ": c 1 ;")
+        modules.load("a")
+        with self.assertRaises(ZModuleError):
+            modules.set_source("c", "import a : c 1 ;")
+
+    def test_import_in_a_definition(self):
+        modules = project()
+        modules.set_source("geometry", ": area import math square ;")
+        with self.assertRaises(ZParserError):
+            modules.load("geometry")
+
+    def test_import_without_modules(self):
+        with self.assertRaises(ZParserError):
+            FirstPhase(get_stdlib(), verbose=False).parse_and_typecheck("import math")
+
+    ##################################################
+
+    def test_edit_of_a_leaf(self):
+        modules = project()
+        modules.load("main")
+        self.assertEqual(["main"], modules.set_source("main", "import geometry : main 5 area ;"))
+        self.assertEqual(["geometry"], modules.load("main").imports)
+        self.assertEqual({"math", "geometry", "main"}, {module.name for module in modules.program("main")})
+
+    def test_edit_with_the_same_signatures(self):
+        modules = project()
+        modules.load("main")
+        # the importers are not typechecked again
+        self.assertEqual(["math"], modules.set_source("math", ": square dup *u8 ; : cube dup dup *u8 *u8 ;"))
+        self.assertEqual(5, modules.typechecked)
+
+    def test_edit_of_a_signature(self):
+        modules = project()
+        modules.load("main")
+        typechecked = modules.set_source("math", ": square dup *u8 ; : cube dup square *u8 u16 ;")
+        # the types exported by `geometry` change, so `main` is typechecked again after it
+        self.assertEqual({"math", "geometry", "physics", "main"}, set(typechecked))
+        self.assertEqual(("math", "main"), (typechecked[0], typechecked[-1]))
+        self.assertEqual({"energy": "(..0 U8 -> ..0 U8)"}, modules.load("physics").signatures())
+        self.assertEqual("(..0 U8 -> ..0 U16)", signature(modules.load("geometry").exports["volume"]))
+
+        # a change which propagates to `main`, and breaks it
+        with self.assertRaises(ZUnknownFunction):
+            modules.set_source("physics", ": energy2 square 2 /u8 ;")
+
+    ##################################################
+
+    def test_interpreter(self):
+        modules = project()
+        I = Interpreter(get_stdlib(), verbose=False)
+        I.eval_module(modules, "main")
+        self.assertEqual([9 + 2 // 16], I.stack)
+
+        # the words exported by the module can be used, not the ones it imports
+        I.eval("drop main")
+        self.assertEqual([9], I.stack)
+        with self.assertRaises(ZUnknownFunction):
+            I.eval("2 square")
+
+        I.eval_module(modules, "geometry")
+        I.eval("drop 2 volume")
+        self.assertEqual([8], I.stack)
+
+    def test_words_with_the_same_name(self):
+        modules = ModuleGraph()
+        modules.set_source("a", ": helper 1 +u8 ; : f helper ;")
+        modules.set_source("b", ": helper 2 *u8 ; : g helper ;")
+        modules.set_source("main", "import a import b : main 10 f 10 g ; main")
+        I = Interpreter(get_stdlib(), verbose=False)
+        I.eval_module(modules, "main")
+        # each module calls its own helper
+        self.assertEqual([11, 20], I.stack)
+
+        # the words imported by `main` are those of the last import
+        modules.set_source("c", "import a import b : h helper ; 3 h")
+        I.eval_module(modules, "c")
+        self.assertEqual([11, 20, 6], I.stack)
+
+        # the exported words are defined with their own names too, and still call their helper
+        I.eval(": helper 5 ; 3 h helper")
+        self.assertEqual([11, 20, 6, 6, 5], I.stack)
@@ -1,11 +1,18 @@
+import os
 from typing import List
 from unittest import TestCase
 from typing import *
 
 from forfait.astnodes import AstNode
+from forfait.interpreter.interpreter import Interpreter
 from forfait.optimizer import Optimizer, stdlib_peeps
 from forfait.parser.firstphase import FirstPhase
-from forfait.stdlibs.basic_stdlib import STDLIB
+from forfait.peephole import RuleSet
+from forfait.stdlibs.basic_stdlib import STDLIB, get_stdlib
+from forfait.ztypes.ztypes import ZTBase
+
+with open(os.path.join(os.path.dirname(__file__), "..", "examples", "fibonacci.forf")) as f:
+    FIBONACCI = f.read()
 
 
 class TestOptimizer(TestCase):
@@ -18,9 +25,9 @@ class TestOptimizer(TestCase):
             [x.funcname for x in opt]
         )
 
-    def whole_program_tester(self, source, expected: str):
+    def whole_program_tester(self, source, expected: str, inline=True):
         nodes: list[AstNode] = FirstPhase(STDLIB).parse_and_typecheck(source)
-        opt: list[AstNode]   = Optimizer(STDLIB, stdlib_peeps).optimize(nodes)
+        opt: list[AstNode]   = Optimizer(STDLIB, stdlib_peeps, inline=inline).optimize(nodes)
 
         self.assertEqual(
             expected.strip(),
@@ -58,11 +65,148 @@ class TestOptimizer(TestCase):
     def test_optimize_chained_arithmetic(self):
         self.whole_program_tester(
             "16 3 5 7 +u8 +u8 -u8",
-            "1"
+            "255"  # as in `Interpreter`, 16 15 -u8 is 15 - 16
         )
 
     def test_optimize_chained_arithmetic2(self):
         self.whole_program_tester(
             "16 3 swap swap 5 7 swap swap +u8 +u8 -u8",
-            "1"
-        )
\ No newline at end of file
+            "255"  # as in `Interpreter`, 16 15 -u8 is 15 - 16
+        )
+    #######################################################
+
+    def test_dead_code(self):
+        self.whole_program_tester("5 3 +u8 drop", "")
+        self.whole_program_tester("7 0 u16 retrieve-from 1 +u8 2 *u8 drop", "7")
+        self.whole_program_tester("[| 0 u16 retrieve-from ++u8 drop |]", "[|  |]")
+        self.whole_program_tester(": g 0 u16 retrieve-from dup *u8 drop 1 ;", ": g 1 ;")
+
+    def test_optimized_code_parses(self):
+        # the optimized program, printed, is a program which gives the same results
+        programs = [
+            "1 3 [| swap swap |] eval",
+            "5 [| 3 ++u8 drop |] eval",
+            "4 [| 3 drop |] [| 1 2 +u8 drop |] swap drop eval",
+            ": nop [| 3 drop |] eval ; 4 nop",
+        ]
+        for code in programs:
+            with self.subTest(code=code):
+                ctx = get_stdlib()
+                optimized = " ".join(str(x) for x in Optimizer(ctx, inline=False, partial_evaluation=False).optimize(FirstPhase(ctx, verbose=False).parse_and_typecheck(code)))
+                self.assertIn("[|  |]", optimized)
+                printed, reference = Interpreter(get_stdlib(), verbose=False), Interpreter(get_stdlib(), verbose=False)
+                printed.eval(optimized)
+                reference.eval(code)
+                self.assertEqual(reference.stack, printed.stack)
+
+    def test_dead_code_pure_words(self):
+        self.whole_program_tester(": sq dup *u8 ; 3 sq drop 4", ": sq dup *u8 ; 4", inline=False)
+        self.whole_program_tester(": st 0 u16 store-at ; 3 st 5 drop", ": st 0 store-at ; 3 st", inline=False)
+
+    def test_live_code(self):
+        # the value comes from the caller
+        self.whole_program_tester(": f 3 +u8 drop ;", ": f 3 +u8 drop ;")
+        # may fail
+        self.whole_program_tester("0 u16 retrieve-from 0 /u8 drop", "0 retrieve-from 0 /u8 drop")
+        # side effects, and words which use the whole stack
+        self.whole_program_tester("5 0 u16 store-at", "5 0 store-at")
+        self.whole_program_tester("0 u16 retrieve-from :s drop", "0 retrieve-from :s drop")
+        self.whole_program_tester("[| drop |] 0 u16 retrieve-from swap eval", "[| drop |] 0 retrieve-from swap eval")
+        self.whole_program_tester(
+            "0 u16 retrieve-from 0 ==u8 [| 0 u16 retrieve-from drop 1 |] [| 3 drop 2 |] if",
+            "0 retrieve-from 0 ==u8 [| 1 |] [| 2 |] if"
+        )
+
+    def test_inline_words(self):
+        self.whole_program_tester(": sq dup *u8 ; 3 sq", ": sq dup *u8 ; 9")
+        self.whole_program_tester(": sq dup *u8 ; : q sq sq ; 0 u16 retrieve-from q", ": sq dup *u8 ; : q dup *u8 dup *u8 ; 0 retrieve-from dup *u8 dup *u8")
+        self.whole_program_tester(": st 0 u16 store-at ; 3 st", ": st 0 store-at ; 3 0 store-at")
+        # in quotations too
+        self.whole_program_tester(": sq dup *u8 ; [| sq 1 +u8 |]", ": sq dup *u8 ; [| dup *u8 1 +u8 |]")
+
+    def test_inline_quotes(self):
+        self.whole_program_tester("[| 1 2 +u8 |] eval", "3")
+        self.whole_program_tester("5 [| dup [| +u8 |] eval |] eval", "10")
+        self.whole_program_tester("3 4 <u8 [| 1 |] [| 2 |] if", "1")
+        self.whole_program_tester("0 u16 retrieve-from false [| 1 +u8 |] [| 2 *u8 |] if", "0 retrieve-from 2 *u8")
+
+    def test_inline_guards(self):
+        # recursive words
+        countdown = ": countdown dup 0 ==u8 [| drop |] [| --u8 countdown |] if ;"
+        self.whole_program_tester(countdown + " 5 countdown", countdown + " 5 countdown")
+        # words over the budget
+        long = ": long " + " ".join(["++u8"] * 20) + " ;"
+        self.whole_program_tester(long + " 0 u16 retrieve-from long", long + " 0 retrieve-from long")
+        # disabled
+        self.whole_program_tester(": sq dup *u8 ; 3 sq", ": sq dup *u8 ; 3 sq", inline=False)
+
+    def test_redefined_words(self):
+        # a call runs the definition found when it is run
+        programs = [
+            ": f 1 ; : g f ; : f 2 ; g",
+            ": f 1 ; : g f drop ; : f 7 0 u16 store-at 1 ; g",
+            ": f 1 ; : f 2 ; : g f f +u8 ; g",
+        ]
+        for code in programs:
+            with self.subTest(code=code):
+                optimized, reference = Interpreter(get_stdlib(), verbose=False), Interpreter(get_stdlib(), verbose=False)
+                reference.optimizer = Optimizer(reference.ctx, rules=RuleSet(), dead_code=False, inline=False, partial_evaluation=False)
+                optimized.eval(code)
+                reference.eval(code)
+                self.assertEqual(reference.stack, optimized.stack)
+                self.assertEqual(reference.memory, optimized.memory)
+
+    def test_words_redefined_by_later_evals(self):
+        # the words defined by an eval are called by the code of the later ones
+        sessions = [
+            [": f 1 ; : g f ;", ": f 2 ; g"],
+            [": f 1 ; : g f drop ;", ": f 7 0 u16 store-at 1 ; g"],
+            [": f 1 ; : g [| f |] ;", ": f 2 ; g eval"],
+            [": f 1 ; : g f ; : h g g +u8 ;", ": f 2 ; h", ": g 3 ; h"],
+            [": f 1 ; : g f ;", ": f g ++u8 ;", "2"],
+        ]
+        for codes in sessions:
+            with self.subTest(codes=codes):
+                optimized, reference = Interpreter(get_stdlib(), verbose=False), Interpreter(get_stdlib(), verbose=False)
+                reference.optimizer = Optimizer(reference.ctx, rules=RuleSet(), dead_code=False, inline=False, partial_evaluation=False)
+                for code in codes:
+                    optimized.eval(code)
+                    reference.eval(code)
+                self.assertEqual(reference.stack, optimized.stack)
+                self.assertEqual(reference.memory, optimized.memory)
+
+        # the code run at once still inlines them
+        ctx = get_stdlib()
+        optimizer = Optimizer(ctx, redefinable=True)
+        nodes = optimizer.optimize(FirstPhase(ctx, verbose=False).parse_and_typecheck(": sq dup *u8 ; : q sq sq ; 3 q"))
+        self.assertEqual(": sq dup *u8 ; : q sq sq ; 81", " ".join(str(x) for x in nodes))
+
+    def test_inlined_words_are_typed(self):
+        ctx = get_stdlib()
+        nodes = FirstPhase(ctx, verbose=False).parse_and_typecheck(
+            ": sw swap ; 0 u16 retrieve-from u16 1 u16 retrieve-from 2 ==u8 sw"
+        )
+        funcs = Optimizer(ctx).optimize(nodes)[1].funcs
+        self.assertEqual(["0", "retrieve-from", "u16", "1", "retrieve-from", "2", "==u8", "swap"], [str(f) for f in funcs])
+        self.assertEqual((ZTBase.U16, ZTBase.BOOL), funcs[-1].type.left.types)
+        self.assertEqual((ZTBase.BOOL, ZTBase.U16), funcs[-1].type.right.types)
+
+    def test_dead_code_keeps_the_semantics(self):
+        programs = [
+            "5 3 +u8 drop 0 u16 retrieve-from 4 *u8 dup drop 2 u16 store-at",
+            ": sq dup *u8 ; 3 sq drop 4 sq 9 u16 store-at 7 sq",
+            "1 0 u16 store-at 0 u16 retrieve-from 0 u16 retrieve-from ++u8 swap drop",
+            "0 5 [| dup 3 *u8 drop u16 dup retrieve-from swap store-at |] indexed-iter 6 7 over +u8 drop",
+            FIBONACCI + " 8 fibonacci 12 fibonacci swap drop",
+            ": sq dup *u8 ; : q sq sq ; 0 10 [| dup q swap u16 store-at |] indexed-iter 3 q",
+            ": inc [| 1 +u8 |] eval ; 0 u16 retrieve-from inc 4 5 <u8 [| inc |] [| 2 *u8 |] if 3 [| inc |] eval",
+            ": countdown dup 0 ==u8 [| drop |] [| --u8 countdown |] if ; 1 5 countdown 3 [| countdown |] eval",
+        ]
+        for code in programs:
+            with self.subTest(code=code):
+                optimized, reference = Interpreter(get_stdlib(), verbose=False), Interpreter(get_stdlib(), verbose=False)
+                reference.optimizer = Optimizer(reference.ctx, dead_code=False)
+                optimized.eval(code)
+                reference.eval(code)
+                self.assertEqual(reference.stack, optimized.stack)
+                self.assertEqual(reference.memory, optimized.memory)
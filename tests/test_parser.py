@@ -34,7 +34,7 @@ class TestParser_FinalType(TestCase):
 
         assert isinstance(sequence, Sequence)
 
-        return ctx._ordered_types(sequence.funcs)
+        return [funcall.typeof(ctx) for funcall in sequence.funcs]
 
     def parse_simple_sequence_and_get_first_ast(self, code: str):
         ctx = get_stdlib()
@@ -119,6 +119,11 @@ class TestParser_FinalType(TestCase):
         assert isinstance(quote, Quote)
         self.assertEqual(str(quote.body.funcs[0].type), "(''S U8 -> ''S U8 U8)")
 
+    def test_empty_quote(self):
+        # as printed by the optimizer, when it removes every word of a quotation
+        self.parse_simple_sequence("[|  |]", "(''NQ -> ''NQ (''E -> ''E))")
+        self.parse_simple_sequence("3 [| |] eval", "(''S -> ''S U8)")
+
     def test_quotes_while(self):
         self.typeof_funcdef(
             "1 1 [| dup 100 <=u8 |] [| swap over +u8 |] while swap drop" ,
@@ -162,11 +167,31 @@ class TestParser_FinalType(TestCase):
         self.assertEqual(str(quote.type), "(''S -> ''S (''S U8 -> ''S U8))")
 
 
-    # def test_recursive(self):
-    #     self.typeof_funcdef(
-    #         ": foo 1 +u8 foo ;" ,
-    #         "(''S -> ''S)"
-    #     )
+    def test_userdefined_function_is_polymorphic(self):
+        ctx = get_stdlib()
+        ast = FirstPhase(ctx).parse_and_typecheck(": id2 dup drop ; 1 id2 true id2")
+
+        self.assertEqual(
+            "(''S -> ''S U8 BOOL)",
+            str(ast[1].typeof(ctx)),
+        )
+
+    def test_recursive(self):
+        self.typeof_funcdef(
+            ": countdown dup 0 !=u8 [| --u8 countdown |] [| identity |] if ;",
+            "(''S U8 -> ''S U8)"
+        )
+        self.typeof_funcdef(
+            ": foo 1 +u8 foo ;" ,
+            "(''S U8 -> ''T)"
+        )
+
+    def test_recursive_call_has_the_type_of_the_word(self):
+        ctx = get_stdlib()
+        funcdef = FirstPhase(ctx).parse_and_typecheck(": inc dup 0 ==u8 [| identity |] [| --u8 inc |] if ++u8 ;")[0]
+        call = funcdef.funcbody.funcs[4].body.funcs[1]
+        self.assertEqual("inc", call.funcname)
+        self.assertEqual("(''S U8 -> ''S U8)", str(call.type))
 
 #######################################################
 
@@ -181,7 +206,7 @@ class TestParser_SingleFunctions(TestCase):
 
         assert isinstance(sequence, Sequence)
 
-        return ctx._ordered_types(sequence.funcs)
+        return [funcall.typeof(ctx) for funcall in sequence.funcs]
 
     def my_assert(self, l: list[ZType], idx: int, expected: str):
         self.assertEqual(
@@ -223,3 +248,54 @@ class TestParser_SingleFunctions(TestCase):
         self.my_assert(l, 0,
             "(''S U16 U8 -> ''S U8 U16)"
         )
+
+#######################################################
+
+class TestParser_Structure(TestCase):
+    def parse(self, code: str):
+        return FirstPhase(get_stdlib(), verbose=False).parse(code)
+
+    def test_deeply_nested_quotes(self):
+        depth = 200
+        ast = self.parse("[| " * depth + "1 2 +u8" + " |]" * depth)
+
+        self.assertEqual(1, len(ast))
+        node = ast[0]
+        for _ in range(depth):
+            self.assertIsInstance(node, Sequence)
+            self.assertEqual(1, len(node.funcs))
+            self.assertIsInstance(node.funcs[0], Quote)
+            node = node.funcs[0].body
+        self.assertEqual("1 2 +u8", str(node))
+
+    def test_each_token_parsed_once(self):
+        depth = 50
+        parser = FirstPhase(get_stdlib(), verbose=False)
+
+        calls = []
+        parse_funcall = parser.parse_funcall
+        parser.parse_funcall = lambda token: calls.append(token.text) or parse_funcall(token)
+
+        parser.parse("[| dup " * depth + "drop" + " |]" * depth)
+        self.assertEqual(depth + 1, len(calls))
+
+    def test_funcdef_and_sequences(self):
+        ast = self.parse("1 2 : foo dup [| drop |] eval ; 3 foo")
+
+        self.assertEqual(["Sequence", "Funcdef", "Sequence"], [type(n).__name__ for n in ast])
+        self.assertEqual("foo", ast[1].funcname)
+        self.assertEqual("dup [| drop |] eval", str(ast[1].funcbody))
+
+    def test_unbalanced_blocks(self):
+        from forfait.parser.parser_exceptions import ZParserError, ZNoEndToFuncDef, ZForbiddenNestedFuncdef
+
+        with self.assertRaises(ZParserError):
+            self.parse("1 [| dup")
+        with self.assertRaises(ZParserError):
+            self.parse("1 dup |]")
+        with self.assertRaises(ZNoEndToFuncDef):
+            self.parse(": foo dup")
+        with self.assertRaises(ZForbiddenNestedFuncdef):
+            self.parse(": foo : bar dup ; ;")
+        with self.assertRaises(ZForbiddenNestedFuncdef):
+            self.parse("[| : bar dup ; |]")
@@ -0,0 +1,86 @@
+import os
+from unittest import TestCase
+
+from forfait.interpreter.interpreter import Interpreter
+from forfait.optimizer import Optimizer
+from forfait.parser.firstphase import FirstPhase
+from forfait.partial_evaluator import PartialEvaluator
+from forfait.peephole import RuleSet
+from forfait.stdlibs.basic_stdlib import get_stdlib
+from forfait.ztypes.ztypes import ZTBase
+
+with open(os.path.join(os.path.dirname(__file__), "..", "examples", "fibonacci.forf")) as f:
+    FIBONACCI = f.read()
+
+
+def evaluate(code: str, evaluator=None) -> str:
+    funcs = FirstPhase(get_stdlib(), verbose=False).parse_and_typecheck(code)[0].funcs
+    return " ".join(str(f) for f in (evaluator or PartialEvaluator()).evaluate(funcs))
+
+
+class TestPartialEvaluator(TestCase):
+    def test_constant_prefixes(self):
+        self.assertEqual("10", evaluate("3 dup *u8 1 +u8"))
+        self.assertEqual("253", evaluate("2 5 swap -u8"))  # 2 - 5
+        self.assertEqual("1 2 3", evaluate("3 1 2 rot+ rot+ over drop"))
+        self.assertEqual("False True", evaluate("3 4 >u8 3 dup ==u8"))
+
+    def test_u16(self):
+        funcs = PartialEvaluator().evaluate(
+            FirstPhase(get_stdlib(), verbose=False).parse_and_typecheck("200 u16 17 u16 +u16 dup *u16 --u16")[0].funcs
+        )
+        self.assertEqual(["47088"], [str(f) for f in funcs])
+        self.assertEqual(ZTBase.U16, funcs[0].type.right.types[-1])
+
+    def test_residual_words(self):
+        # only the literals before a word are known
+        self.assertEqual("0 retrieve-from 7 +u8", evaluate("0 u16 retrieve-from 3 4 +u8 +u8"))
+        self.assertEqual("9 0 store-at 3", evaluate("4 5 +u8 0 u16 store-at 1 2 +u8"))
+        self.assertEqual("0 retrieve-from 1 swap", evaluate("0 u16 retrieve-from 1 swap"))
+        # it would fail at runtime
+        self.assertEqual("0 7 /u8", evaluate("0 7 /u8"))
+
+    def test_quotations(self):
+        self.assertEqual("8", evaluate("3 [| 5 +u8 |] eval"))
+        self.assertEqual("6", evaluate("3 dup 4 <u8 [| dup +u8 |] [| drop 0 |] if"))
+        self.assertEqual("[| drop |]", evaluate("[| dup |] [| drop |] swap drop"))
+        # evaluated as a whole, or not at all
+        self.assertEqual("3 [| 0 u16 store-at |] eval", evaluate("3 [| 0 u16 store-at |] eval"))
+
+    def test_loops(self):
+        self.assertEqual("45", evaluate("0 0 10 [| +u8 |] indexed-iter"))
+        self.assertEqual("144", evaluate("1 1 [| dup 100 <=u8 |] [| swap over +u8 |] while swap drop"))
+        self.assertEqual("0 5 [| dup u16 store-at |] indexed-iter", evaluate("0 5 [| dup u16 store-at |] indexed-iter"))
+
+    def test_limits(self):
+        loop = "0 0 200 [| +u8 |] indexed-iter"
+        self.assertEqual("188", evaluate(loop))
+        self.assertEqual("0 0 200 [| +u8 |] indexed-iter", evaluate(loop, PartialEvaluator(fuel=100)))
+        self.assertEqual("1 [| True |] [| ++u8 |] while", evaluate("1 [| true |] [| ++u8 |] while"))
+
+    ##################################################
+
+    def test_same_results_as_interpreter(self):
+        programs = [
+            "3 dup *u8 1 +u8 2 5 swap -u8 250 ++u8 ++u8 ++u8 0 --u8",
+            "3 4 over over <u8 rot+ >=u8 5 5 ==u8 6 5 !=u8 7 8 <=u8 9 8 >u8",
+            "200 u16 17 u16 +u16 dup *u16 --u16 3 u16 swap -u16 7 u16 /u16 0 u16 ++u16 --u16 --u16",
+            "5 true [| [| dup dup +u8 +u8 |] eval |] [| ++u8 |] if dup",
+            "0 0 10 [| dup *u8 +u8 |] indexed-iter 7 2 /u8 drop",
+            "0 u16 retrieve-from 3 4 +u8 +u8 0 5 [| dup 3 *u8 swap u16 store-at |] indexed-iter",
+            FIBONACCI + " 8 fibonacci 12 fibonacci",
+            ": sq dup *u8 ; 0 0 16 [| sq +u8 |] indexed-iter",
+        ]
+        for code in programs:
+            with self.subTest(code=code):
+                optimized, reference = Interpreter(get_stdlib(), verbose=False), Interpreter(get_stdlib(), verbose=False)
+                reference.optimizer = Optimizer(reference.ctx, rules=RuleSet(), dead_code=False, inline=False, partial_evaluation=False)
+                optimized.eval(code)
+                reference.eval(code)
+                self.assertEqual(reference.stack, optimized.stack)
+                self.assertEqual(reference.memory, optimized.memory)
+
+    def test_optimizer(self):
+        ctx = get_stdlib()
+        nodes = FirstPhase(ctx, verbose=False).parse_and_typecheck(FIBONACCI + " 8 fibonacci 12 fibonacci")
+        self.assertEqual("55 121", str(Optimizer(ctx).optimize(nodes)[1]))
@@ -0,0 +1,132 @@
+from unittest import TestCase
+
+from forfait.interpreter.interpreter import Interpreter
+from forfait.optimizer import Optimizer, PeepholeOptimization, stdlib_peeps
+from forfait.parser.firstphase import FirstPhase
+from forfait.peephole import RuleSet, ZRuleError, load_rules
+from forfait.stdlibs.basic_stdlib import get_stdlib
+from forfait.ztypes.ztypes import ZTBase
+
+
+def rewrite(code: str, rules: RuleSet, peep_optimizations=None) -> str:
+    ctx = get_stdlib()
+    nodes = FirstPhase(ctx, verbose=False).parse_and_typecheck(code)
+    optimizer = Optimizer(ctx, peep_optimizations, rules=rules, dead_code=False, inline=False, partial_evaluation=False)
+    return " ".join(str(node) for node in optimizer.optimize(nodes))
+
+
+class TestRules(TestCase):
+    def test_load(self):
+        rules = load_rules("""
+            # a comment
+            swap swap => ε    # another one
+
+            N M +u8 => ((N + M) % 256)
+        """)
+        self.assertEqual(2, len(rules))
+        self.assertEqual(3, rules.max_length)
+        self.assertEqual(["N M +u8 => ((N + M) % 256)"], [str(rule) for rule in rules.rules[1:]])
+
+    def test_invalid_rules(self):
+        for text in ["swap swap", "swap => swap => swap", "=> drop", "ε => drop", "N => M", "N => (N + M)",
+                     "N => (N +)", "N => (N", "swap swap => nip", "N drop => ε where M"]:
+            with self.subTest(text=text), self.assertRaises(ZRuleError):
+                load_rules(text)
+
+    def test_variables(self):
+        rules = load_rules("""
+            N N ==u8 => true
+            N:u8 u16 => (N)
+            N:u16 drop => ε
+            B:bool drop => ε
+            7 *u8 => dup dup +u8 +u8 dup +u8 swap -u8
+        """)
+        self.assertEqual("5 True", rewrite("5 5 5 ==u8", rules))
+        self.assertEqual("5 6 ==u8", rewrite("5 6 ==u8", rules))
+        self.assertEqual("5", rewrite("5 5 u16 drop", rules))
+        self.assertEqual("5 drop", rewrite("5 drop", rules))
+        self.assertEqual("", rewrite("true drop", rules))
+
+    def test_guard(self):
+        rules = load_rules("N M /u8 => (M // N) where N != 0\n N M -u8 => ((M - N) % 256) where N < M")
+        self.assertEqual("2", rewrite("3 7 /u8", rules))
+        self.assertEqual("0 7 /u8", rewrite("0 7 /u8", rules))
+        self.assertEqual("4", rewrite("3 7 -u8", rules))
+        self.assertEqual("7 3 -u8", rewrite("7 3 -u8", rules))
+
+    def test_arithmetic_error(self):
+        self.assertEqual("0 7 /u8", rewrite("0 7 /u8", load_rules("N M /u8 => (M // N)")))
+        self.assertEqual("256 7 /u8", rewrite("256 7 /u8", stdlib_peeps))
+
+    def test_longest_match_first(self):
+        rules = load_rules("dup drop => ε\n 1 dup drop => 2")
+        self.assertEqual("2", rewrite("1 dup drop", rules))
+        self.assertEqual("3", rewrite("3 dup drop", rules))
+
+    def test_rewrites_enable_rewrites(self):
+        # each fold makes another fold possible, on the left of it
+        self.assertEqual("21", rewrite("1 2 3 4 5 6 +u8 +u8 +u8 +u8 +u8", stdlib_peeps))
+        self.assertEqual("1 2", rewrite("1 2 swap dup drop swap", stdlib_peeps))
+        self.assertEqual("9", rewrite("3 dup *u8", stdlib_peeps))
+        self.assertEqual("[| 2 |] eval", rewrite("[| 1 dup swap swap +u8 |] eval", stdlib_peeps))
+
+    def test_new_words_are_typed(self):
+        ctx = get_stdlib()
+        nodes = FirstPhase(ctx, verbose=False).parse_and_typecheck("1 true 3 u16 rot+ rot+")
+        funcs = Optimizer(ctx, partial_evaluation=False).optimize(nodes)[0].funcs
+        self.assertEqual(["1", "True", "3", "rot-"], [str(f) for f in funcs])
+        self.assertEqual(ZTBase.U16, funcs[2].type.right.types[-1])
+        self.assertEqual((ZTBase.U8, ZTBase.BOOL, ZTBase.U16), funcs[3].type.left.types)
+        self.assertEqual((ZTBase.BOOL, ZTBase.U16, ZTBase.U8), funcs[3].type.right.types)
+
+    def test_rule_changing_the_type(self):
+        with self.assertRaises(ZRuleError):
+            rewrite("1 2 swap", load_rules("swap => drop"))
+
+    def test_peephole_optimizations(self):
+        # e.g. what can't be a rule: any two literals are replaced by their sum
+        literals = PeepholeOptimization(
+            2,
+            lambda a, b: a.funcname.isdigit() and b.funcname.isdigit(),
+            lambda stream: stream.append(type(stream[0])(stream.pop(0).n + stream.pop(0).n, ZTBase.U8))
+        )
+        self.assertEqual("6", rewrite("1 2 3", RuleSet(), [literals]))
+        # the rules go first: 6 swap swap dup ==> 6 dup ==> 6 6 ==> 12
+        self.assertEqual("12", rewrite("1 2 3 swap swap dup", stdlib_peeps, [literals]))
+
+    def test_user_peep_optimizations(self):
+        ctx = get_stdlib()
+        seven = load_rules("7 *u8 => dup dup +u8 +u8 dup +u8 swap -u8")
+        # added to the stdlib rules
+        optimizer = Optimizer(ctx, seven)
+        self.assertEqual(len(stdlib_peeps) + 1, len(optimizer.rules))
+        self.assertEqual([], optimizer.peep_opts)
+        # which are not added twice
+        self.assertEqual(len(stdlib_peeps), len(Optimizer(ctx, stdlib_peeps).rules))
+        literals = PeepholeOptimization(2, lambda a, b: False, lambda stream: None)
+        optimizer = Optimizer(ctx, [literals])
+        self.assertIs(stdlib_peeps, optimizer.rules)
+        self.assertEqual([literals], optimizer.peep_opts)
+
+    ##################################################
+
+    def test_stdlib_rules_keep_the_semantics(self):
+        programs = [
+            "16 3 5 7 +u8 +u8 -u8", "200 17 over -u8 swap 3 /u8 dup *u8", "7 0 /u8 drop 9 2 /u8",
+            "1 true 3 u16 rot+ rot+ rot- rot+ drop drop", "250 ++u8 ++u8 ++u8 0 --u8 --u8 swap ++u8",
+            "3 4 over over <u8 drop >=u8 5 5 ==u8 6 5 !=u8 7 8 <=u8 9 8 >u8",
+            "true dup drop false drop 200 u16 5 u16 +u16 --u16 ++u16",
+            ": sq dup *u8 ; 3 sq 4 sq swap -u8 0 10 [| 2 3 swap -u8 *u8 dup u16 store-at |] indexed-iter",
+            # literals above 255 are reduced to u8
+            "300 100 <u8 256 0 ==u8 300 600 >=u8 256 512 !=u8 300 44 <=u8 513 2 >u8",
+            "300 600 /u8 260 7 -u8 300 300 *u8 511 ++u8 256 --u8 300 300 +u8",
+        ]
+        for code in programs:
+            with self.subTest(code=code):
+                optimized, reference = Interpreter(get_stdlib(), verbose=False), Interpreter(get_stdlib(), verbose=False)
+                optimized.optimizer = Optimizer(optimized.ctx, rules=stdlib_peeps, inline=False, partial_evaluation=False)
+                reference.optimizer = Optimizer(reference.ctx, rules=RuleSet(), dead_code=False, inline=False, partial_evaluation=False)
+                optimized.eval(code)
+                reference.eval(code)
+                self.assertEqual(reference.stack, optimized.stack)
+                self.assertEqual(reference.memory, optimized.memory)
@@ -0,0 +1,125 @@
+from unittest import TestCase
+
+from forfait.interpreter.interpreter import Interpreter
+from forfait.interpreter.profiler import ProfilingInterpreter, TOPLEVEL
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+PROGRAM = """
+: square dup *u8 ;
+: countdown dup 0 ==u8 [| drop |] [| --u8 countdown |] if ;
+0 10 [| square drop |] indexed-iter
+1 5 countdown
+"""
+
+
+class TestProfiler(TestCase):
+    def profile(self, code: str) -> ProfilingInterpreter:
+        interpreter = ProfilingInterpreter(get_stdlib(), verbose=False, vectorized=False)
+        interpreter.eval(code)
+        return interpreter
+
+    def test_same_results_as_interpreter(self):
+        interpreter = Interpreter(get_stdlib(), verbose=False)
+        interpreter.eval(PROGRAM)
+        profiling = self.profile(PROGRAM)
+        self.assertEqual(interpreter.stack, profiling.stack)
+        self.assertEqual(interpreter.memory, profiling.memory)
+
+    def test_counts(self):
+        stats = self.profile(PROGRAM).profiler.stats()
+        counts = {label: count for label, (count, _, _) in stats.items()}
+
+        self.assertEqual(1, counts["indexed-iter"])
+        self.assertEqual(10, counts["quote@4:6"])
+        self.assertEqual(10, counts["square"])
+        self.assertEqual(10, counts["*u8"])
+        self.assertEqual(6, counts["countdown"])
+        self.assertEqual(5, counts["quote@3:35"])
+        self.assertEqual(1, counts["quote@3:24"])
+        self.assertEqual(10 + 6, counts["dup"])
+
+    def test_times(self):
+        stats = self.profile(PROGRAM).profiler.stats()
+        for label, (count, self_time, cumulative) in stats.items():
+            self.assertGreaterEqual(self_time, 0, label)
+            self.assertGreaterEqual(cumulative, self_time, label)
+
+        # the loop runs the quotation, which runs square
+        self.assertGreaterEqual(stats["indexed-iter"][2], stats["quote@4:6"][2])
+        self.assertGreaterEqual(stats["quote@4:6"][2], stats["square"][2])
+
+    def test_counting_builtins(self):
+        interpreter = ProfilingInterpreter(get_stdlib(), verbose=False, vectorized=False, time_builtins=False)
+        interpreter.eval(PROGRAM)
+        stats = interpreter.profiler.stats()
+        timed = self.profile(PROGRAM).profiler.stats()
+        self.assertEqual({label: count for label, (count, _, _) in timed.items()},
+                         {label: count for label, (count, _, _) in stats.items()})
+
+        # the builtins are only counted, in the self time of their callers
+        self.assertEqual((10, 0, 0), stats["*u8"])
+        self.assertGreaterEqual(stats["square"][1], 0)
+        self.assertEqual(stats["square"][1], stats["square"][2])
+
+    def test_table(self):
+        profiler = self.profile(PROGRAM).profiler
+        lines = profiler.table().split("\n")
+        self.assertEqual(["word", "count", "self", "(ms)", "self", "%", "cumul.", "(ms)"], lines[0].split())
+        self.assertEqual(len(profiler.stats()), len(lines) - 1)
+
+        self_times = [float(line.split()[2]) for line in lines[1:]]
+        self.assertEqual(sorted(self_times, reverse=True), self_times)
+
+        self.assertEqual(3, len(profiler.table(sort_by="count", limit=2).split("\n")))
+
+    def test_collapsed_stacks(self):
+        profiler = self.profile(PROGRAM * 20).profiler
+        for line in profiler.collapsed().split("\n"):
+            stack, time = line.rsplit(" ", 1)
+            self.assertGreaterEqual(int(time), 0)
+            self.assertNotIn(" ", stack.replace(TOPLEVEL, ""))
+
+        stacks = [line.rsplit(" ", 1)[0] for line in profiler.collapsed().split("\n")]
+        self.assertTrue(any(stack.endswith("indexed-iter;quote@4:6;square;*u8") for stack in stacks), stacks)
+
+    def test_collapsed_counts(self):
+        interpreter = ProfilingInterpreter(get_stdlib(), verbose=False, vectorized=False, time_builtins=False)
+        interpreter.eval(PROGRAM)
+        counts = dict(line.rsplit(" ", 1) for line in interpreter.profiler.collapsed(weight="count").split("\n"))
+        # every call stack is written, even the builtins which are not timed
+        self.assertEqual("10", counts[f"{TOPLEVEL};indexed-iter;quote@4:6;square;*u8"])
+        self.assertEqual("1", counts["quote@3:24;drop"])  # run by a tail call of countdown
+        self.assertEqual(counts.keys(), dict(line.rsplit(" ", 1) for line in interpreter.profiler.collapsed().split("\n")).keys())
+
+    def test_frames_are_exited_after_errors(self):
+        interpreter = self.profile(": square dup *u8 ;")
+        with self.assertRaises(ZeroDivisionError):
+            interpreter.eval("0 10 [| square 0 swap /u8 drop |] indexed-iter")
+        self.assertEqual(1, interpreter.profiler.depth())
+
+        interpreter.eval("3 square")
+        self.assertEqual(1, interpreter.profiler.depth())
+        self.assertEqual(2, interpreter.profiler.stats()["square"][0])
+
+    def test_builtins_are_counted_after_errors(self):
+        interpreter = ProfilingInterpreter(get_stdlib(), verbose=False, vectorized=False, time_builtins=False)
+        interpreter.eval(": square dup *u8 ;")
+        with self.assertRaises(ZeroDivisionError):
+            interpreter.eval("0 10 [| square 0 swap /u8 drop |] indexed-iter")
+        stats = interpreter.profiler.stats()
+        self.assertEqual(1, interpreter.profiler.depth())
+        # the failing word is not counted, nor the words after it
+        self.assertEqual(1, stats["*u8"][0])
+        self.assertEqual(1, stats["swap"][0])
+        self.assertNotIn("/u8", stats)
+        self.assertNotIn("drop", stats)
+
+    def test_redefined_words_are_not_builtins(self):
+        interpreter = ProfilingInterpreter(get_stdlib(), verbose=False, vectorized=False, time_builtins=False)
+        interpreter.eval(": f 1 +u8 ; : g f f ; 1 g")
+        interpreter.eval(": f 2 *u8 ; 1 g")
+        stats = interpreter.profiler.stats()
+        self.assertEqual(4, stats["f"][0])
+        self.assertEqual(2, stats["+u8"][0])
+        self.assertEqual(2, stats["*u8"][0])
@@ -0,0 +1,87 @@
+from unittest import TestCase
+from typing import *
+
+from forfait.interpreter.interpreter import Interpreter
+from forfait.interpreter.registers import RegisterInterpreter, RegisterProgram, OPERATORS
+from forfait.optimizer import Optimizer
+from forfait.parser.firstphase import FirstPhase
+from forfait.peephole import RuleSet
+from forfait.stdlibs.basic_stdlib import get_stdlib
+from forfait.ztypes.context import Context
+
+
+# programs using only the words supported by `SSA_ification`, run on operands pushed by an
+# earlier eval: they are input registers, so that their code can't be evaluated at compile time
+PROGRAMS = [
+    ("1 2 3", "rot- swap over rot+ dup drop"),
+    ("200 100", "+u8 dup 7 *u8 2 swap /u8 9 swap -u8 ++u8 --u8 --u8"),
+    ("1 2", "over over >u8 rot+ over over <u8 rot+ over over >=u8 rot+ over over <=u8 rot+ over over ==u8 rot+ !=u8"),
+    ("200 u16 17 u16", "swap drop 100 u16"),
+    ("200 u16 17 u16", "+u16 dup *u16 --u16 3 u16 swap -u16 7 u16 swap /u16 ++u16"),
+    ("100", "[| dup [| +u8 |] eval |] eval"),
+    ("5 true", "[| [| dup dup +u8 +u8 |] eval |] [| 1 +u8 |] if dup"),
+    ("5 false", "[| [| dup dup +u8 +u8 |] eval |] [| 1 +u8 |] if dup"),
+    ("3 4", "<u8 [| 1 |] [| 2 |] if 7 swap -u8"),
+    ("9", "dup 3 >u8 [| dup 5 <u8 [| 1 -u8 |] [| 2 -u8 |] if |] [| 3 *u8 |] if 100 swap -u8"),
+    ("3 4", ": sq dup *u8 ; : cube dup sq *u8 ; sq swap cube 250 swap /u8"),
+]
+
+
+class LoggingRegisterInterpreter(RegisterInterpreter):
+    """
+    Keeps the programs it runs, and doesn't evaluate the code before SSA-ifying it.
+    """
+    def __init__(self, ctx: Context, propagate_constants=True):
+        super().__init__(ctx, propagate_constants=propagate_constants)
+        self.optimizer = Optimizer(self.ctx, rules=RuleSet(), dead_code=False, inline=False, partial_evaluation=False)
+        self.programs: List[RegisterProgram] = list()
+
+    def execute(self, program: RegisterProgram):
+        self.programs.append(program)
+        super().execute(program)
+
+
+class TestRegisterInterpreter(TestCase):
+    def run_both(self, operands: str, code: str, propagate_constants: bool) -> LoggingRegisterInterpreter:
+        registers = LoggingRegisterInterpreter(get_stdlib(), propagate_constants=propagate_constants)
+        interpreter = Interpreter(get_stdlib(), verbose=False)
+        for s in (operands, code):
+            registers.eval(s)
+            interpreter.eval(s)
+
+        self.assertEqual(interpreter.stack, registers.stack)
+        return registers
+
+    def test_same_results_as_interpreter(self):
+        for operands, code in PROGRAMS:
+            for propagate_constants in (False, True):
+                with self.subTest(code=code, propagate_constants=propagate_constants):
+                    program = self.run_both(operands, code, propagate_constants).programs[-1]
+
+                    # the operators and branches of the code are run by the program
+                    operators = {instr[0] for block in program.blocks for instr in block}
+                    for funcname in set(code.split()) & set(OPERATORS) - {"u16"}:  # a cast is a copy
+                        self.assertIn(OPERATORS[funcname], operators, funcname)
+                    if "if" in code.split():
+                        self.assertTrue(any(jump is not None and jump[0] >= 0 for jump in program.jumps))
+                        self.assertGreater(len(program.entries), 0)
+
+    def test_stack_persists_between_evals(self):
+        registers = RegisterInterpreter(get_stdlib())
+        registers.eval(": double dup +u8 ; 21")
+        registers.eval("double 2 swap -u8 dup 10 >u8")
+        self.assertEqual([40, True], registers.stack)
+
+    def test_constants_are_propagated(self):
+        code = "4 dup *u8 1 swap -u8"
+        registers = LoggingRegisterInterpreter(get_stdlib())
+        nodes = registers.optimizer.optimize(FirstPhase(registers.ctx, verbose=False).parse_and_typecheck(code))
+        program = registers.load(nodes[0])
+        registers.propagate_constants = False
+        unpropagated = registers.load(nodes[0])
+
+        # only the constants in the register file are left
+        self.assertEqual(2, len([instr for block in unpropagated.blocks for instr in block if instr[0] is not None]))
+        self.assertEqual([], [instr for block in program.blocks for instr in block if instr[0] is not None])
+        self.assertEqual([15], program.run([]))
+        self.assertEqual(unpropagated.run([]), program.run([]))
@@ -25,4 +25,9 @@ class TestSSA(TestCase):
 
     def test_ssa_ification2_5(self):
         cfg = self.runtest("5 true [| [| dup dup +u8 +u8 |] eval |] [| 1 +u8 |] if dup")
-        print(cfg.emit_program())
\ No newline at end of file
+        print(cfg.emit_program())
+    def test_ssa_ification_of_inlined_words(self):
+        compiler = Compiler(debug_level=0, optimize=True)
+        cfgs = compiler.ssify(": sq dup *u8 ; : poly dup sq swap 3 *u8 +u8 ; 2 poly 5 [| sq |] eval")
+        self.assertEqual(1, len(cfgs))  # the definitions have no code
+        self.assertEqual([10, 25], [i.const.n for i in cfgs[0].instructions])
@@ -0,0 +1,93 @@
+import random
+from unittest import TestCase, skipIf
+from typing import *
+
+from forfait.interpreter.interpreter import Interpreter
+from forfait.interpreter.vectorize import vectorize, np
+from forfait.parser.firstphase import FirstPhase
+from forfait.stdlibs.basic_stdlib import get_stdlib
+
+
+# transformations of the value on top of the stack, which leave a single value in its place
+TRANSFORMS = ["++u8", "--u8", "dup *u8", "dup +u8", "dup -u8", "dup dup *u8 swap -u8"] + \
+    [f"{n} {op}" for n in (0, 1, 3, 200, 255) for op in ("+u8", "-u8", "*u8")] + \
+    [f"{n} swap {op}" for n in (0, 1, 3, 200, 255) for op in ("+u8", "-u8", "*u8")] + \
+    [f"{n} swap /u8" for n in (1, 3, 200, 255)]
+
+
+def random_body(rng: random.Random) -> str:
+    """
+    A quote body storing a function of the loop index at an address which is a function of
+    the loop index, one or more times.
+    """
+    def store() -> str:
+        value   = " ".join(rng.choice(TRANSFORMS) for _ in range(rng.randint(0, 4)))
+        address = " ".join(rng.choice(TRANSFORMS) for _ in range(rng.randint(0, 3)))
+        return f"dup {value} swap {address} u16 store-at"
+    return " ".join(f"dup {store()}" for _ in range(rng.randint(0, 2))) + f" {store()}"
+
+
+class TestVectorize(TestCase):
+    def quote_body(self, code: str):
+        nodes = FirstPhase(get_stdlib(), verbose=False).parse_and_typecheck(code)
+        return nodes[0].funcs[-2].body
+
+    def test_detection(self):
+        for body, vectorizable in [
+            ("dup *u8 5 u16 store-at", True),
+            ("dup 3 +u8 swap u16 store-at", True),
+            ("drop", True),
+            ("dup u16 retrieve-from swap u16 store-at", False),
+            ("dup 3 >u8 [| 1 |] [| 2 |] if swap u16 store-at", False),
+            ("over +u8 7 u16 store-at", False),
+        ]:
+            with self.subTest(body=body):
+                code = f"9 0 100 [| {body} |] indexed-iter"
+                self.assertEqual(vectorizable, vectorize(self.quote_body(code), dict()) is not None)
+
+    def test_user_words_are_expanded(self):
+        square, loop = FirstPhase(get_stdlib(), verbose=False).parse_and_typecheck(
+            ": square dup *u8 ; 0 100 [| square 5 u16 store-at |] indexed-iter"
+        )
+        loop = vectorize(loop.funcs[-2].body, {"square": square.funcbody})
+        self.assertEqual([(49, 5)], loop.evaluate(7))
+
+    def test_same_stores_as_scalar_path(self):
+        rng = random.Random(1234)
+        for _ in range(100):
+            code = f"0 250 [| {random_body(rng)} |] indexed-iter"
+            with self.subTest(code=code):
+                scalar = Interpreter(get_stdlib(), verbose=False, vectorized=False)
+                scalar.eval(code)
+
+                # the expressions on single indexes, without NumPy
+                loop = vectorize(self.quote_body(code), dict())
+                memory = dict()
+                for i in range(0, 250):
+                    memory.update((address, value) for value, address in loop.evaluate(i))
+                self.assertEqual(scalar.memory, memory)
+
+    @skipIf(np is None, "NumPy is not installed")
+    def test_same_results_as_scalar_path(self):
+        rng = random.Random(5678)
+        for _ in range(100):
+            start, end = sorted((rng.randint(0, 255), rng.randint(0, 255)))
+            code = f": f {random_body(rng)} ; {start} {end} [| f |] indexed-iter 7 8 swap"
+            with self.subTest(code=code):
+                scalar = Interpreter(get_stdlib(), verbose=False, vectorized=False)
+                scalar.eval(code)
+                vectorized = Interpreter(get_stdlib(), verbose=False)
+                vectorized.eval(code)
+
+                self.assertEqual(scalar.stack, vectorized.stack)
+                self.assertEqual(scalar.memory, vectorized.memory)
+
+    @skipIf(np is None, "NumPy is not installed")
+    def test_fallback_on_errors(self):
+        for code, error in [
+            ("0 100 [| 7 /u8 5 u16 store-at |] indexed-iter", ZeroDivisionError),
+            ("0 100 [| 3 *u8 u16 300 u16 swap store-at |] indexed-iter", AssertionError),
+        ]:
+            with self.subTest(code=code):
+                with self.assertRaises(error):
+                    Interpreter(get_stdlib(), verbose=False).eval(code)
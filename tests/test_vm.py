@@ -0,0 +1,191 @@
+import os
+import re
+from unittest import TestCase
+from typing import *
+
+from forfait.astnodes import Number, Funcall
+from forfait.interpreter.interpreter import Interpreter
+from forfait.interpreter.superinstructions import SuperinstructionVM, SUPERINSTRUCTIONS, LITERAL, stack_effect, \
+    ngram_profile
+from forfait.interpreter.typed import TypedVM, MEMORY_SIZE
+from forfait.interpreter.vm import VM, ZVMError, OPCODES, RET, PUSH_QUOTE, CALL, COMPARISONS
+from forfait.optimizer import Optimizer
+from forfait.parser.firstphase import FirstPhase
+from forfait.peephole import RuleSet
+from forfait.stdlibs.basic_stdlib import get_stdlib
+from forfait.ztypes.ztypes import ZTBase
+
+
+with open(os.path.join(os.path.dirname(__file__), "..", "examples", "fibonacci.forf")) as f:
+    FIBONACCI = f.read()
+
+def without_folding(machine: VM) -> VM:
+    """
+    :return: `machine`, whose optimizer doesn't evaluate the programs, so that it runs their words
+    """
+    machine.optimizer = Optimizer(machine.ctx, rules=RuleSet(), dead_code=False, inline=False, partial_evaluation=False)
+    return machine
+
+
+def assert_compiled(test: TestCase, machine: VM, code: str):
+    for funcname in set(re.sub(r"\(\(.*?\)\)", "", code, flags=re.S).split()) & set(OPCODES):
+        test.assertIn(OPCODES[funcname], machine.code, funcname)
+
+
+COUNTDOWN = ": countdown dup 0 ==u8 [| drop |] [| dup dup u16 store-at --u8 countdown |] if ; 1 5 countdown"
+
+
+class TestVM(TestCase):
+    def run_both(self, code: str) -> VM:
+        vm = without_folding(VM(get_stdlib()))
+        vm.eval(code)
+        assert_compiled(self, vm, code)
+
+        interpreter = Interpreter(get_stdlib(), verbose=False)
+        interpreter.eval(code)
+
+        self.assertEqual(interpreter.stack, vm.stack)
+        self.assertEqual(interpreter.memory, vm.memory)
+        return vm
+
+    def test_same_results_as_interpreter(self):
+        for code in [
+            "1 2 3 rot- swap over rot+ dup drop",
+            "200 100 +u8 3 7 *u8 2 9 /u8 9 2 -u8 ++u8 0 --u8",
+            "1 2 >u8 1 2 <u8 2 2 >=u8 3 2 <=u8 4 4 ==u8 4 5 !=u8",
+            "0 5 [| dup u16 store-at |] indexed-iter",
+            "1 1 [| dup 100 <=u8 |] [| swap over +u8 |] while swap drop",
+            "100 [| dup [| +u8 |] eval |] eval",
+            "5 true [| [| dup dup +u8 +u8 |] eval |] [| ++u8 |] if dup",
+            "5 false [| [| dup dup +u8 +u8 |] eval |] [| ++u8 |] if dup",
+            ": sq dup *u8 ; 0 10 [| sq 5 u16 store-at |] indexed-iter",
+            "0 10 [| dup u16 store-at |] indexed-iter 3 u16 retrieve-from 300 u16 retrieve-from",
+            FIBONACCI + " 8 fibonacci 12 fibonacci",
+            COUNTDOWN,
+        ]:
+            with self.subTest(code=code):
+                self.run_both(code)
+
+    def test_fibonacci(self):
+        vm = self.run_both(FIBONACCI + " 8 fibonacci")
+        self.assertEqual([55], vm.stack)
+
+    def test_quotes_and_words_are_compiled_once(self):
+        vm = VM(get_stdlib())
+        vm.optimizer = Optimizer(vm.ctx, inline=False)
+        vm.eval(": sq dup *u8 ; 0 10 [| sq sq drop |] indexed-iter 3 sq")
+        self.assertEqual([9], vm.stack)
+
+        # blocks: sq, the quote, the main program
+        self.assertEqual(3, vm.code.count(RET))
+        self.assertEqual(3, vm.code.count(CALL))
+        self.assertEqual(1, vm.code.count(PUSH_QUOTE))
+        self.assertEqual(1, vm.code.count(OPCODES["*u8"]))
+
+    def test_recursive_words(self):
+        vm = self.run_both(COUNTDOWN)
+        self.assertEqual([1], vm.stack)
+        self.assertEqual(2, vm.code.count(CALL))
+
+    def test_state_persists_between_evals(self):
+        vm = VM(get_stdlib())
+        vm.eval(": double dup +u8 ;")
+        vm.eval("21 double")
+        self.assertEqual([42], vm.stack)
+
+    def test_unsupported_builtin(self):
+        with self.assertRaises(ZVMError):
+            VM(get_stdlib()).eval("empty-list")
+
+
+class TestSuperinstructions(TestCase):
+    def test_same_results_as_vm(self):
+        # operands read from memory, so that the optimizer doesn't evaluate the programs
+        operands = "200 0 u16 store-at 17 1 u16 store-at 0 u16 retrieve-from 1 u16 retrieve-from"
+        programs = [
+            FIBONACCI + " 8 fibonacci 12 fibonacci",
+            COUNTDOWN,
+            "0 5 [| dup u16 store-at |] indexed-iter",
+            f"{operands} [| dup 100 <=u8 |] [| swap over +u8 |] while swap drop",
+            f"{operands} over over swap over drop drop swap drop 3 4 5 ++u8 rot+ --u8 rot+",
+            "1 0 u16 retrieve-from 10 +u8 [| 3 *u8 dup 7 -u8 over /u8 swap 9 >=u8 drop drop |] indexed-iter",
+            f"{operands} over /u8 swap 250 /u8 u16 dup /u16",
+        ] + [f"{operands} u16 swap u16 swap over {op} swap 3 u16 {op} dup {op}" for op in ["+u16", "-u16", "*u16"]] + \
+            [f"{operands} over {op} swap 3 {op} dup {op}" for op in ["+u8", "-u8", "*u8"]] + \
+            [f"{operands} 5 {op} swap dup 7 {op}" for op in COMPARISONS]
+
+        for code in programs:
+            with self.subTest(code=code):
+                vm, fused = VM(get_stdlib()), SuperinstructionVM(get_stdlib())
+                vm.eval(code)
+                fused.eval(code)
+                self.assertEqual(vm.stack, fused.stack)
+                self.assertEqual(vm.memory, fused.memory)
+                self.assertLess(len(fused.code), len(vm.code))
+
+    def test_declared_stack_effects(self):
+        ctx = get_stdlib()
+        for pattern, (effect, _) in SUPERINSTRUCTIONS.items():
+            words = [
+                Number(1, ZTBase.U8) if token == LITERAL else Funcall(token, ctx.fresh_builtin_type(token))
+                for token in pattern
+            ]
+            self.assertEqual(effect, stack_effect(words), pattern)
+
+    def test_fibonacci_is_fused(self):
+        vm = SuperinstructionVM(get_stdlib())
+        vm.eval(FIBONACCI)
+        ops = vm.disassemble()
+        self.assertIn("[rot- dup]", ops)
+        self.assertIn("[# >=u8] 1", ops)
+        self.assertIn("[--u8 rot+]", ops)
+        self.assertIn("[over +u8 swap]", ops)
+
+    def test_ngram_profile(self):
+        nodes = FirstPhase(get_stdlib(), verbose=False).parse_and_typecheck(
+            ": f over +u8 swap ; 1 2 f [| over +u8 swap |] eval"
+        )
+        profile = ngram_profile(nodes, 3)
+        self.assertEqual(2, profile[("over", "+u8", "swap")])
+        self.assertEqual(1, profile[(LITERAL, LITERAL, "f")])
+
+
+class TestTypedVM(TestCase):
+    PROGRAMS = [
+        "1 2 3 rot- swap over rot+ dup drop",
+        "200 100 +u8 3 7 *u8 2 9 /u8 9 2 -u8 ++u8 0 --u8",
+        "1 2 >u8 1 2 <u8 2 2 >=u8 3 2 <=u8 4 4 ==u8 4 5 !=u8",
+        "5 true [| [| dup dup +u8 +u8 |] eval |] [| ++u8 |] if dup",
+        "1 1 [| dup 100 <=u8 |] [| swap over +u8 |] while swap drop",
+        "0 250 [| dup u16 store-at |] indexed-iter 0 250 [| dup u16 retrieve-from ++u8 swap u16 store-at |] indexed-iter",
+        "7 u16 retrieve-from 0 10 [| 3 *u8 u16 17 u16 store-at |] indexed-iter 17 u16 retrieve-from",
+        FIBONACCI + " 8 fibonacci 12 fibonacci",
+        COUNTDOWN,
+    ]
+
+    def test_same_results_as_interpreter(self):
+        for code in self.PROGRAMS:
+            with self.subTest(code=code):
+                typed = without_folding(TypedVM(get_stdlib()))
+                typed.eval(code)
+                assert_compiled(self, typed, code)
+
+                interpreter = Interpreter(get_stdlib(), verbose=False)
+                interpreter.eval(code)
+
+                # booleans are 0 and 1 on the typed stack
+                self.assertEqual(interpreter.stack, typed.stack)
+                self.assertEqual(interpreter.memory, {a: x for a, x in enumerate(typed.memory) if a in interpreter.memory or x != 0})
+
+    def test_view_is_not_a_copy(self):
+        typed = TypedVM(get_stdlib())
+        view = typed.view(10, 20)
+        typed.eval("42 12 u16 store-at")
+        self.assertEqual(42, view[2])
+        self.assertTrue(view.readonly)
+
+    def test_clear(self):
+        typed = TypedVM(get_stdlib())
+        typed.eval("1 2 3 4 5 u16 store-at __clear 7")
+        self.assertEqual([7], typed.stack)
+        self.assertEqual(bytes(MEMORY_SIZE), typed.memory)
@@ -5,7 +5,7 @@ from forfait.my_exceptions import ZException
 from forfait.ztypes import *
 from forfait.ztypes.context import Context
 from forfait.ztypes.ztypes import ZTFunction, ZTBase, ZTGeneric, type_of_application_rowpoly, ZTFuncHelper, \
-    ZTRowGeneric, ZTList, ZTypeError, ZTMaybe
+    ZTRowGeneric, ZTList, ZTypeError, ZTMaybe, ZTRow
 
 import logging
 logging.basicConfig(level=logging.DEBUG, format="[%(levelname)s]:%(message)s")
@@ -192,3 +192,142 @@ class TestFunctionApplication_composite_types(TestCase):
         f1 = ZTFuncHelper(S, [A], S, [l])
         f2 = ZTFuncHelper(R, [m], R, [A])
         self.assert_fail(f1, f2)
+
+#################################################################
+
+class TestContext(TestCase):
+    def test_stdlib_overlays_share_builtins(self):
+        from forfait.stdlibs.basic_stdlib import get_stdlib
+
+        ctx1, ctx2 = get_stdlib(), get_stdlib()
+        self.assertIs(ctx1.builtin_types, ctx2.builtin_types)
+
+        ctx1.add_userfunction_type("foo", ctx1.fresh_builtin_type("dup"))
+        self.assertNotIn("foo", ctx2.user_types)
+
+        with self.assertRaises(TypeError):
+            ctx1.builtin_types["foo"] = ctx1.fresh_builtin_type("dup")
+
+    def test_fresh_builtin_type_does_not_alias(self):
+        from forfait.stdlibs.basic_stdlib import get_stdlib
+
+        ctx = get_stdlib()
+        t1, t2 = ctx.fresh_builtin_type("dup"), ctx.fresh_builtin_type("dup")
+        self.assertFalse(t1.structural_eq(t2))
+        self.assertEqual(str(t1), str(ctx.builtin_types["dup"]))
+
+    def test_type_scheme_instantiation(self):
+        from forfait.ztypes.scheme import TypeScheme
+
+        S, R = ZTRowGeneric("S"), ZTRowGeneric("R")
+        A = ZTGeneric("A")
+        t = ZTFuncHelper(S, [A, ZTFuncHelper(S, [A], R, [ZTList(A)])], R, [A, ZTBase.U8])
+
+        scheme = TypeScheme(t)
+        t1, t2 = scheme.instantiate(), scheme.instantiate()
+
+        self.assertEqual(str(t), str(t1))
+        self.assertFalse(t1.structural_eq(t2))
+        self.assertEqual(3, len(scheme.quantified))
+
+        # occurrences of the same generic are instantiated with the same fresh generic
+        inner = t1.left.types[1]
+        self.assertTrue(t1.left.row_var.structural_eq(inner.left.row_var))
+        self.assertTrue(t1.left.types[0].structural_eq(inner.right.types[0].inner_types[0]))
+        self.assertFalse(t1.left.types[0].structural_eq(A))
+
+    def test_union_find_substitutions(self):
+        ctx = Context()
+        A, B, C = ZTGeneric("A"), ZTGeneric("B"), ZTGeneric("C")
+
+        # after 'A ~~> 'B, 'A is shown as 'B
+        A.unify(B, ctx)
+        self.assertEqual("'B", str(ctx.resolve(A)))
+
+        # binding any member of the class binds the whole class
+        C.unify(A, ctx)
+        B.unify(ZTList(ZTBase.U8), ctx)
+        for g in [A, B, C]:
+            self.assertEqual("LIST<U8>", str(ctx.resolve(g)))
+
+        # conflicting bindings
+        with self.assertRaises(ZTypeError):
+            C.unify(ZTList(ZTBase.BOOL), ctx)
+
+    def test_occur_check(self):
+        ctx = Context()
+        A, B = ZTGeneric("A"), ZTGeneric("B")
+
+        A.unify(ZTList(B), ctx)
+        with self.assertRaises(Exception):
+            B.unify(ZTMaybe(A), ctx)
+
+    def test_row_substitutions(self):
+        ctx = Context()
+        S, R = ZTRowGeneric("S"), ZTRowGeneric("R")
+        t = ZTFuncHelper(S, [ZTBase.U8], S, [])
+
+        S.unify(ZTRow(R, [ZTBase.BOOL]), ctx)
+        self.assertEqual("(''R BOOL U8 -> ''R BOOL)", str(ctx.resolve(t)))
+
+    def test_resolve_is_memoized_per_generation(self):
+        ctx = Context()
+        S, A, B = ZTRowGeneric("S"), ZTGeneric("A"), ZTGeneric("B")
+        t = ZTFuncHelper(S, [A], S, [ZTList(A), B])
+
+        # nothing to substitute: the type itself is returned
+        self.assertIs(t, ctx.resolve(t))
+
+        A.unify(ZTBase.U8, ctx)
+        t1 = ctx.resolve(t)
+        self.assertEqual("(''S U8 -> ''S LIST<U8> 'B)", str(t1))
+        self.assertIs(t1, ctx.resolve(t))
+        self.assertIs(t1, ctx.resolve(t1))
+
+        # a new substitution invalidates the memoized results
+        B.unify(ZTBase.BOOL, ctx)
+        self.assertEqual("(''S U8 -> ''S LIST<U8> BOOL)", str(ctx.resolve(t)))
+
+
+class TestImmutableTypes(TestCase):
+    def test_hash_consing(self):
+        S, A = ZTRowGeneric("S"), ZTGeneric("A")
+        t1 = ZTFuncHelper(S, [A, ZTList(ZTBase.U8)], S, [ZTMaybe(A)])
+        t2 = ZTFuncHelper(S, (A, ZTList(ZTBase.U8)), S, (ZTMaybe(A),))
+        self.assertIs(t1, t2)
+        self.assertTrue(t1.structural_eq(t2))
+
+        # different generics with the same name are different types
+        self.assertIsNot(ZTList(A), ZTList(ZTGeneric("A")))
+        self.assertIsNot(ZTList(ZTBase.U8), ZTMaybe(ZTBase.U8))
+
+    def test_types_are_immutable(self):
+        import copy
+
+        S, A = ZTRowGeneric("S"), ZTGeneric("A")
+        row = ZTRow(S, [A, ZTBase.U8])
+        for t, field in [(row, "types"), (ZTFunction(row, row), "left"), (ZTList(A), "inner_types"), (A, "counter")]:
+            with self.assertRaises(AttributeError):
+                setattr(t, field, None)
+            self.assertIs(t, copy.deepcopy(t))
+            self.assertIs(t, copy.copy(t))
+
+    def test_substitution_returns_new_types(self):
+        S, R, A = ZTRowGeneric("S"), ZTRowGeneric("R"), ZTGeneric("A")
+        t = ZTFuncHelper(S, [A], S, [ZTList(A), ZTBase.U8])
+
+        t1 = t.substitute_generic(A, ZTBase.BOOL)
+        self.assertEqual("(''S 'A -> ''S LIST<'A> U8)", str(t))
+        self.assertEqual("(''S BOOL -> ''S LIST<BOOL> U8)", str(t1))
+        self.assertIs(t1.right.types[1], t.right.types[1])  # unchanged subtrees are shared
+
+        t2 = t.substitute_generic(S, ZTRow(R, [ZTBase.U16]))
+        self.assertEqual("(''R U16 'A -> ''R U16 LIST<'A> U8)", str(t2))
+        self.assertIs(t, t.substitute_generic(ZTGeneric("B"), ZTBase.U8))
+
+    def test_keep_last_n(self):
+        S = ZTRowGeneric("S")
+        row = ZTRow(S, [ZTBase.U8, ZTBase.BOOL, ZTBase.U16])
+        self.assertEqual("''S BOOL U16", str(row.keep_last_n(2)))
+        self.assertEqual("''S", str(row.keep_last_n(0)))
+        self.assertEqual(3, row.arity())